@@ -0,0 +1,33 @@
+"""
+ASGI config for bfa project.
+
+Serves the admin like wsgi.py does, plus the websockets for live
+leaderboards. Run it with daphne (see the README).
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bfa.settings')
+
+# set up django before anything imports models
+django_application = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+from django.urls import path
+
+from submissions.bus import bus
+from submissions.live import LeaderboardConsumer
+
+application = ProtocolTypeRouter({
+    'http': django_application,
+    'websocket': AllowedHostsOriginValidator(AuthMiddlewareStack(URLRouter([
+        path('ws/leaderboard/<int:week>/', LeaderboardConsumer.as_asgi()),
+    ]))),
+})
+
+# to hear about changes made by the bot (see submissions/bus.py)
+bus.start()
@@ -0,0 +1,85 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+PINNED_UNTIL_KEY = 'replica_pinned_until'
+
+@contextmanager
+def replica_reads():
+    """Sends queries inside this block to the replica database (if there is one)."""
+
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+class ReplicaRouter:
+    """Routes reads inside `replica_reads()` to the replica, and everything else to the primary.
+
+    Only submissions data is read from the replica; logins and sessions always
+    use the primary. Without a replica configured (settings.DATABASE_REPLICA),
+    everything uses the primary. The bot never uses `replica_reads()`, so it
+    always reads its own writes.
+    """
+
+    replica_apps = {'submissions'}
+
+    def db_for_read(self, model, **hints):
+        if (
+            settings.DATABASE_REPLICA
+            and _replica_reads.get()
+            and model._meta.app_label in self.replica_apps
+        ):
+            return settings.DATABASE_REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica has the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+class ReplicaMiddleware:
+    """Uses the replica for the heavy admin read-only pages (lists, leaderboards & search).
+
+    Change forms always read from the primary. After making any change, a user
+    reads from the primary for REPLICA_PIN_SECONDS so they see their own
+    changes even if the replica is lagging.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, req):
+        if req.method not in ('GET', 'HEAD'):
+            response = self.get_response(req)
+            if hasattr(req, 'session'):
+                req.session[PINNED_UNTIL_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+            return response
+
+        if self.use_replica(req):
+            with replica_reads():
+                return self.get_response(req)
+        return self.get_response(req)
+
+    def use_replica(self, req):
+        if not settings.DATABASE_REPLICA:
+            return False
+        if hasattr(req, 'session') and req.session.get(PINNED_UNTIL_KEY, 0) > time.time():
+            return False
+
+        try:
+            url_name = resolve(req.path_info).url_name or ''
+        except Resolver404:
+            return False
+        return url_name.endswith('_changelist') or url_name == 'autocomplete'
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import dj_database_url
 import django_heroku
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
+    'channels',
 ]
 
 MIDDLEWARE = [
@@ -54,12 +57,22 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bfa.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'bfa.urls'
 
+# for live leaderboards (see bfa/asgi.py). Web processes hear about new
+# submissions from postgres, so each only needs its own in-memory layer.
+ASGI_APPLICATION = 'bfa.asgi.application'
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -101,6 +114,19 @@ if os.environ.get('GITHUB_WORKFLOW'):
     }
 }
 
+# Optional read replica, used for the heavy admin pages (see bfa/routers.py)
+DATABASE_ROUTERS = ['bfa.routers.ReplicaRouter']
+DATABASE_REPLICA = None
+
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.parse(os.environ['REPLICA_DATABASE_URL'])
+    # tests use the default database for both
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICA = 'replica'
+
+# how long (in seconds) someone reads from the primary after making a change
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -139,5 +165,122 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+
+# Caching
+
+# how long (in seconds) cached admin filter counts are kept. They're cleared
+# whenever submissions change, in any process (see submissions/bus.py), so
+# this is just a fallback.
+FACET_CACHE_TIMEOUT = int(os.environ.get('FACET_CACHE_TIMEOUT', 3600))
+# how long (in seconds) the bot keeps the current challenge cached. It's
+# cleared whenever a challenge changes, in the bot or the admin, so this is
+# just a fallback.
+CURRENT_CHALLENGE_CACHE_TIMEOUT = int(os.environ.get('CURRENT_CHALLENGE_CACHE_TIMEOUT', 3600))
+# how long (in seconds) the bot keeps rendered leaderboard images. They're
+# cached by their contents, so this only limits memory use.
+LEADERBOARD_IMAGE_CACHE_TIMEOUT = int(os.environ.get('LEADERBOARD_IMAGE_CACHE_TIMEOUT', 7 * 24 * 60 * 60))
+
+
+# Admin changelists
+# The submission changelist counts its rows when the database expects fewer
+# than this many, and otherwise shows the query planner's estimate, since
+# counting them all takes longer the more there are.
+ESTIMATED_COUNT_THRESHOLD = int(os.environ.get('ESTIMATED_COUNT_THRESHOLD', 10_000))
+
+# how often (in seconds) at most an open week's score distribution is
+# recomputed while submissions keep coming in (see submissions/stats.py)
+STATS_REFRESH_SECONDS = int(os.environ.get('STATS_REFRESH_SECONDS', 60))
+
+
+# Ratings (see submissions/ratings.py)
+# Changing these only affects weeks rated afterwards, unless ratings are
+# rebuilt (manage.py updateratings --rebuild).
+
+# the rating students start from
+RATING_INITIAL = float(os.environ.get('RATING_INITIAL', 1500))
+# how much one week can move a rating: the most a student can gain, by beating
+# everyone in their division with the same rating as them, is K / 2
+RATING_K = float(os.environ.get('RATING_K', 32))
+
+
+# Bot commands
+
+# ids of the discord servers to register slash commands in, comma separated.
+# Commands registered in a server show up right away; without this they're
+# registered globally, which can take up to an hour.
+SLASH_COMMAND_GUILD_IDS = [
+    int(guild_id) for guild_id in os.environ.get('SLASH_COMMAND_GUILD_IDS', '').split(',') if guild_id
+]
+# set to only take slash commands. Then the bot doesn't ask discord to send it
+# every message in the server.
+PREFIX_COMMANDS_DISABLED = bool(os.environ.get('PREFIX_COMMANDS_DISABLED'))
+# max number of commands working on the database at once. Each student's
+# commands always take turns.
+COMMAND_CONCURRENCY = int(os.environ.get('COMMAND_CONCURRENCY', 4))
+
+
+# Bot memory
+# The bot only asks discord for the events its commands need, and keeps no
+# messages or members around (commands get them from discord with each
+# message or interaction), so its memory doesn't grow with the server.
+
+# how many recent messages the bot keeps (0 for none)
+BOT_MESSAGE_CACHE_SIZE = int(os.environ.get('BOT_MESSAGE_CACHE_SIZE', 0))
+# set to keep the members the bot sees in memory (as far as its intents allow)
+BOT_CACHE_MEMBERS = bool(os.environ.get('BOT_CACHE_MEMBERS'))
+# more gateway intents to turn on, comma separated (eg. "members,guild_reactions").
+# See discord.Intents for the names.
+BOT_EXTRA_INTENTS = [intent for intent in os.environ.get('BOT_EXTRA_INTENTS', '').split(',') if intent]
+
+
+# Bot replies
+
+# when the bot replied to a submission less than this many seconds ago, its
+# next replies in that channel wait this long and are sent as one message
+REPLY_BATCH_WINDOW = float(os.environ.get('REPLY_BATCH_WINDOW', 1))
+
+
+# Submission log
+# When set, the bot writes each submission to this local file before replying,
+# and saves them to the database from there, so none are lost if the database
+# is down. See submissions/wal.py.
+
+SUBMISSION_LOG_PATH = os.environ.get('SUBMISSION_LOG_PATH')
+SUBMISSION_LOG_BATCH_SIZE = int(os.environ.get('SUBMISSION_LOG_BATCH_SIZE', 50))
+# how long (in seconds) the bot waits for a submission to be saved before
+# replying without the upscore
+SUBMISSION_LOG_ACK_TIMEOUT = float(os.environ.get('SUBMISSION_LOG_ACK_TIMEOUT', 2))
+
+
+# Command traces
+# When set, the bot appends the commands it's sent (anonymised) to this JSON
+# Lines file, to replay later with manage.py replaytrace. See
+# submissions/traces.py.
+
+BOT_TRACE_PATH = os.environ.get('BOT_TRACE_PATH')
+
+
+# Archiving
+
+# closed weeks are moved to the archive this many days after they close
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 28))
+# closed weeks are compacted this many days after they close, down to each
+# student's best submission and their latest few
+COMPACT_AFTER_DAYS = int(os.environ.get('COMPACT_AFTER_DAYS', 7))
+COMPACT_KEEP_LATEST = int(os.environ.get('COMPACT_KEEP_LATEST', 3))
+
+
+# Score checking
+# Optionally read the score off each submission picture with a local OCR
+# engine (tesseract) so mismatches can be flagged in the admin.
+
+OCR_ENABLED = bool(os.environ.get('OCR_ENABLED'))
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', 2))
+OCR_QUEUE_SIZE = int(os.environ.get('OCR_QUEUE_SIZE', 50))
+# left,top,right,bottom of the score region as fractions of the picture size
+OCR_SCORE_REGION = tuple(
+    float(edge) for edge in os.environ.get('OCR_SCORE_REGION', '0,0,1,1').split(',')
+)
+
 # Configure Django App for Heroku.
 django_heroku.settings(locals())
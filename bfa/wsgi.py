@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bfa.settings')
 
 application = get_wsgi_application()
+
+# to hear about changes made by the bot (see submissions/bus.py)
+from submissions.bus import bus
+
+bus.start()
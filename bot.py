@@ -1,28 +1,297 @@
+import asyncio
+import contextlib
+import io
 import os
+import time
 import typing
 
+# for timing startup, from before the slow imports
+STARTED_AT = time.perf_counter()
+
+def log_startup(step):
+    print(f'[startup] {step} after {time.perf_counter() - STARTED_AT:.2f}s')
+
+import discord
 from discord.ext import commands
 import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bfa.settings')
 django.setup()
-
+log_startup('loaded discord.py and django')
+
+from django.conf import settings
+import interactions
+from interactions import option
+from submissions import diagnostics
+from submissions.bus import bus
+from submissions.caches import async_current_challenge, async_warm_up
+from submissions.leaderboards import DIVISION_ORDER, LeaderboardRenderer
 from submissions.models import (
     async_save_score,
     async_update_student,
     async_new_week,
+    async_get_challenge,
     close_submissions,
     reopen_submissions,
-    is_latest_week_open,
     LevelPlacement as DIVISIONS,
+    PERCENTILES,
 )
+from submissions.ratings import async_student_rating
+from submissions.stats import async_challenge_stats
 
 description = 'A bot to help with weekly score submissions'
-bot = commands.Bot(command_prefix='!', description=description)
 
+# just what the commands need: servers (with their channels and roles), and
+# server messages for ! commands. Slash commands come in as interactions, so
+# with ! commands off the bot doesn't need discord to send it every message.
+intents = discord.Intents.none()
+intents.guilds = True
+intents.guild_messages = not settings.PREFIX_COMMANDS_DISABLED
+for intent in settings.BOT_EXTRA_INTENTS:
+    setattr(intents, intent, True)
+
+bot = commands.Bot(
+    command_prefix='!',
+    description=description,
+    intents=intents,
+    max_messages=settings.BOT_MESSAGE_CACHE_SIZE or None,
+    # commands get their members from the message or interaction
+    member_cache_flags=(
+        discord.MemberCacheFlags.from_intents(intents) if settings.BOT_CACHE_MEMBERS
+        else discord.MemberCacheFlags.none()
+    ),
+    chunk_guilds_at_startup=False,
+)
+slash = interactions.SlashCommands(guild_ids=settings.SLASH_COMMAND_GUILD_IDS)
+slash.add_to(bot)
+
+FACULTY_ROLES = ('Admin', 'Faculty', 'TO')
+
+# reactions on !submit messages
+RECEIVED = '\N{INBOX TRAY}'
+SAVED = '\N{WHITE HEAVY CHECK MARK}'
+FAILED = '\N{CROSS MARK}'
+
+
+# Discord's limit on a message's length
+MAX_MESSAGE_LENGTH = 2000
+
+class ReplyBatcher:
+    """Sends the bot's replies to submissions, merging them when it's busy.
+
+    A reply goes out right away, as a threaded reply to the submission, unless
+    another one was just sent in the same channel. Then it waits (up to
+    `window` seconds) and goes out together with any other replies that came
+    in meanwhile, in as few messages as fit. This keeps the bot well under
+    Discord's rate limits during a deadline rush.
+
+    Replies are only sent once the submission is saved, so failing to send
+    one is logged rather than raised (a "try again" would only duplicate the
+    submission). `reply` returns whether it was sent.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        # channel id -> when the last reply was sent
+        self._last_sent = {}
+        # channel id -> [(message, content, future)] for replies waiting to be sent
+        self._batches = {}
+
+    async def reply(self, message, content):
+        loop = asyncio.get_running_loop()
+        channel_id = message.channel.id
+        since_last = loop.time() - self._last_sent.get(channel_id, float('-inf'))
+
+        if channel_id not in self._batches and since_last >= self.window:
+            self._last_sent[channel_id] = loop.time()
+            return await self._reply(message, content)
+
+        batch = self._batches.get(channel_id)
+        if batch is None:
+            batch = self._batches[channel_id] = []
+            loop.call_later(
+                max(self.window - since_last, 0),
+                lambda: loop.create_task(self._send_batch(message.channel)),
+            )
+
+        sent = loop.create_future()
+        batch.append((message, content, sent))
+        return await sent
+
+    async def _reply(self, message, content):
+        try:
+            await message.reply(content, mention_author=False)
+        except discord.HTTPException as error:
+            print(f"Couldn't reply to message {message.id}: {error.__class__.__name__}: {error}")
+            return False
+        return True
+
+    async def _send_batch(self, channel):
+        batch = self._batches.pop(channel.id)
+        self._last_sent[channel.id] = asyncio.get_running_loop().time()
+
+        try:
+            for chunk in split_batch(batch):
+                if len(chunk) == 1:
+                    message, content, _ = chunk[0]
+                    results = [await self._reply(message, content)]
+                else:
+                    try:
+                        await channel.send('\n\n'.join(content for _, content, _ in chunk))
+                        results = [True] * len(chunk)
+                    except discord.HTTPException as error:
+                        print(f"Couldn't send {len(chunk)} replies together, sending them one by one: {error}")
+                        results = [await self._reply(message, content) for message, content, _ in chunk]
+                for (*_, sent), result in zip(chunk, results):
+                    sent.set_result(result)
+        except Exception as error:
+            for *_, sent in batch:
+                if not sent.done():
+                    sent.set_exception(error)
+
+def split_batch(batch):
+    """Splits waiting replies into chunks that fit in a message each (joined by blank lines)."""
+
+    chunk, length = [], 0
+    for reply in batch:
+        content = reply[1]
+        if chunk and length + 2 + len(content) > MAX_MESSAGE_LENGTH:
+            yield chunk
+            chunk, length = [], 0
+        length += (2 if chunk else 0) + len(content)
+        chunk.append(reply)
+    if chunk:
+        yield chunk
+
+
+class CommandLimiter:
+    """Limits how many commands work on the database at once.
+
+    Commands with the same key (eg. the same student) take turns, so a student
+    double posting !submit has their submissions saved one after the other and
+    gets the right upscores. Commands with different keys run side by side, up
+    to `limit` at a time, so a burst of commands can't pile up on the database.
+
+    Keeps track of how long commands wait for their turn.
+    """
+
+    def __init__(self, limit, slow_wait=1):
+        self.limit = limit
+        self.slow_wait = slow_wait
+        # made on first use, so it belongs to the running event loop
+        self._semaphore = None
+        # key -> [lock, number of commands using or waiting for it]
+        self._locks = {}
+
+        self.waiting = 0
+        self.count = 0
+        self.total_wait = 0
+        self.max_wait = 0
+
+    @contextlib.asynccontextmanager
+    async def turn(self, key):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        self.waiting += 1
+        waiting = True
+
+        try:
+            async with entry[0], self._semaphore:
+                self.waiting -= 1
+                waiting = False
+                self._record_wait(key, loop.time() - started)
+                yield
+        finally:
+            if waiting:
+                self.waiting -= 1
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def stats(self):
+        return {
+            'waiting': self.waiting,
+            'commands': self.count,
+            'average_wait': self.total_wait / self.count if self.count else 0,
+            'max_wait': self.max_wait,
+        }
+
+    def _record_wait(self, key, wait):
+        self.count += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait >= self.slow_wait:
+            print(f'Command for {key} waited {wait:.2f}s for its turn ({self.waiting} still waiting)')
+
+replies = ReplyBatcher(settings.REPLY_BATCH_WINDOW)
+limiter = CommandLimiter(settings.COMMAND_CONCURRENCY)
+leaderboard_renderer = LeaderboardRenderer()
+
+# the optional parts are only imported when they're turned on
+score_reader = None
+if settings.OCR_ENABLED:
+    from submissions.ocr import ScoreReader
+    score_reader = ScoreReader(
+        workers=settings.OCR_WORKERS,
+        queue_size=settings.OCR_QUEUE_SIZE,
+        region=settings.OCR_SCORE_REGION,
+    )
+
+submission_log = None
+if settings.SUBMISSION_LOG_PATH:
+    from submissions.wal import SubmissionLog
+    submission_log = SubmissionLog(
+        settings.SUBMISSION_LOG_PATH,
+        batch_size=settings.SUBMISSION_LOG_BATCH_SIZE,
+    )
+
+trace_recorder = None
+if settings.BOT_TRACE_PATH:
+    from submissions.traces import TraceRecorder
+    trace_recorder = TraceRecorder(settings.BOT_TRACE_PATH)
+
+# started alongside logging in to discord, see warm_up
+warm_up_task = None
+first_command_done = False
+
+
+async def warm_up():
+    """Connects to the database and loads the current challenge, while the bot
+    logs in to discord. on_ready waits for this before saying the bot's ready.
+
+    It's only a head start, so if it fails the bot starts anyway, and the
+    first commands connect to the database themselves.
+    """
+
+    try:
+        challenge = await async_warm_up()
+    except Exception as error:
+        log_startup(f"couldn't warm up: {error.__class__.__name__}: {error}")
+    else:
+        log_startup(f'connected to the database (current challenge: {challenge})')
 
 @bot.event
 async def on_ready():
+    if warm_up_task is not None:
+        await warm_up_task
+
+    if score_reader is not None:
+        score_reader.start(bot.loop)
+    if submission_log is not None:
+        submission_log.start(bot.loop)
+
+    # (after starting those, so !submit works even if this fails)
+    try:
+        await slash.sync(bot)
+    except Exception as error:
+        log_startup(f"couldn't register the slash commands: {error.__class__.__name__}: {error}")
+
+    log_startup('ready')
     print("It's lit")
     print(f'Logged in as {bot.user}')
     print('~*~*~*~*~*~*~*~')
@@ -37,55 +306,481 @@ async def correct_channel(ctx):
 
     return ctx.channel.id == int(os.getenv('SUBMISSION_CHANNEL_ID'))
 
+@bot.listen('on_message')
+async def record_message(message):
+    if (
+        trace_recorder is not None
+        and message.guild is not None
+        and not message.author.bot
+        and message.content.startswith(bot.command_prefix)
+        and message.channel.id == int(os.getenv('SUBMISSION_CHANNEL_ID'))
+    ):
+        trace_recorder.record_message(message)
+
+@bot.listen('on_socket_response')
+async def record_interaction(msg):
+    # type 2 is an application command
+    if (
+        trace_recorder is not None
+        and msg.get('t') == 'INTERACTION_CREATE'
+        and msg['d']['type'] == 2
+        and msg['d'].get('channel_id') == os.getenv('SUBMISSION_CHANNEL_ID')
+    ):
+        trace_recorder.record_interaction(bot.get_guild(int(msg['d'].get('guild_id', 0))), msg['d'])
+
 @bot.before_invoke
 async def print_command(ctx):
     print(f'received {ctx.invoked_with} cmd: "{ctx.message.clean_content}" {ctx.message}')
 
+@bot.after_invoke
+@slash.after_invoke
+async def time_first_command(ctx):
+    global first_command_done
+    if not first_command_done:
+        first_command_done = True
+        log_startup('handled the first command')
+
+async def in_submission_channel(ctx):
+    """The global checks, for slash commands (bot.check doesn't cover those)."""
+
+    return await globally_block_dms(ctx) and await correct_channel(ctx)
+
 
 async def are_submissions_open(ctx):
     """Checks that submissions are open before proceeding."""
 
-    if await is_latest_week_open():
+    challenge = await async_current_challenge()
+    if challenge is not None and challenge.is_open:
         return True
     else:
         raise commands.DisabledCommand
 
-@bot.command()
-@commands.check(are_submissions_open)
-async def submit(ctx, score: int):
-    """Submit a score **with picture** for the BFA Weekly Challenge
+class Students(commands.Cog):
+    """Commands for everyone"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command()
+    @commands.check(are_submissions_open)
+    async def submit(self, ctx, score: int):
+        """Submit a score **with picture** for the BFA Weekly Challenge
+
+        This command requires a photo attachment to be part of the message.
+
+        <score> -- Your ex or money score (depending on the challenge) [digits only, no commas]
+        """
+
+        validate_score(score)
+        validate_attachment(ctx.message)
+
+        # let them know it's been received while it's being saved
+        received = asyncio.ensure_future(ctx.message.add_reaction(RECEIVED))
+
+        try:
+            upscore, pending = await save_submission(ctx.author, score, ctx.message.attachments[0])
+        except Exception:
+            await swap_reaction(ctx.message, ctx.me, received, None)
+            raise
+
+        if pending is not None:
+            asyncio.create_task(mark_saved_later(ctx.message, ctx.me, received, pending))
+            await replies.reply(ctx.message, pending_message(ctx.author, score))
+            return
+
+        await asyncio.gather(
+            replies.reply(ctx.message, submitted_message(ctx.author, score, upscore)),
+            swap_reaction(ctx.message, ctx.me, received, SAVED),
+        )
+
+    @submit.error
+    async def invalid_submission(self, ctx, error):
+        if isinstance(error, commands.DisabledCommand):
+            await ctx.send(f'Sorry {ctx.author.mention}, submissions are currently closed.')
+        elif isinstance(error, commands.UserInputError):
+            await ctx.send(f'Incorrect command usage: {error}')
+            await ctx.send_help(ctx.command)
+        else:
+            await generic_on_error(ctx, error)
+
+    @commands.command()
+    async def addtwitter(self, ctx, twitter):
+        """Add twitter username to your Student profile
+
+        <twitter> -- Your twitter username
+        """
+
+        div = get_division(ctx.author.roles)
+        async with limiter.turn(ctx.author.id):
+            await async_update_student(
+                ctx.author.id,
+                discord_name=str(ctx.author),
+                level=div,
+                twitter=twitter,
+            )
+        await ctx.send(f"Updated {ctx.author.mention}'s profile!")
+
+    @commands.command()
+    async def addname(self, ctx, ddr_name):
+        """Add DDR name to your Student profile
+
+        <ddr_name> -- Your DDR name (ex. KEEKSTER)
+        """
+
+        div = get_division(ctx.author.roles)
+        async with limiter.turn(ctx.author.id):
+            await async_update_student(
+                ctx.author.id,
+                discord_name=str(ctx.author),
+                level=div,
+                ddr_name=ddr_name,
+            )
+        await ctx.send(f"Updated {ctx.author.mention}'s profile!")
+
+    @commands.command()
+    async def rating(self, ctx, member: typing.Optional[discord.Member] = None):
+        """Show your skill rating, from how you placed in your division in closed weeks
+
+        [member] -- Whose rating to show (faculty only, defaults to yours)
+        """
+
+        if member is not None and member.id != ctx.author.id:
+            await commands.has_any_role(*FACULTY_ROLES).predicate(ctx)
+        member = member or ctx.author
+        await ctx.send(rating_message(member, await async_student_rating(member.id)))
+
+    @rating.error
+    async def invalid_rating(self, ctx, error):
+        if isinstance(error, commands.UserInputError):
+            await ctx.send(f'Incorrect command usage: {error}')
+            await ctx.send_help(ctx.command)
+        elif isinstance(error, commands.MissingAnyRole):
+            await ctx.send(f"Sorry {ctx.author.mention}, only faculty, admins, and TOs can see other students' ratings!")
+        else:
+            await generic_on_error(ctx, error)
+
+    @addtwitter.error
+    @addname.error
+    async def invalid_update(self, ctx, error):
+        if isinstance(error, commands.UserInputError):
+            await ctx.send(f'Incorrect command usage: {error}')
+            await ctx.send_help(ctx.command)
+        else:
+            await generic_on_error(ctx, error)
+
+class Faculty(commands.Cog):
+    """Commands for faculty, admins, and TOs"""
+
+    # these all change the current challenge, so they take turns
+    LIMITER_KEY = 'challenge'
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    def cog_check(self, ctx):
+        return commands.has_any_role(*FACULTY_ROLES).predicate(ctx)
+
+    @commands.command()
+    async def newweek(self, ctx, *, name):
+        """Start a new weekly challenge
+
+        <name> -- Name of the new weekly challenge
+        """
+
+        async with limiter.turn(self.LIMITER_KEY):
+            challenge = await async_current_challenge()
+            if challenge is not None and challenge.is_open:
+                challenge = None
+            else:
+                challenge = await async_new_week(name)
+
+        if challenge is None:
+            await ctx.send(f"You can't make a new week while the current week is still open!")
+        else:
+            await ctx.send(f'Week {challenge.week}: {challenge.name} has begun!')
+
+    @commands.command()
+    async def close(self, ctx):
+        """Close submissions for the current weekly challenge"""
+
+        async with limiter.turn(self.LIMITER_KEY):
+            challenge = await close_submissions()
+        if challenge is not None:
+            await ctx.send(f'Pencils down! Submissions for Week {challenge.week}: {challenge.name} are now closed!')
+            await post_leaderboards(ctx.channel, challenge)
+        else:
+            await ctx.send("(There's no challenge week to close.)")
+
+    @commands.command()
+    async def reopen(self, ctx):
+        """Reopen submissions for the current weekly challenge"""
+
+        async with limiter.turn(self.LIMITER_KEY):
+            challenge = await reopen_submissions()
+        if challenge is not None:
+            await ctx.send(f'Submissions for Week {challenge.week}: {challenge.name} are now reopen!')
+        else:
+            await ctx.send("(There's no challenge week to reopen.)")
+
+    @commands.command()
+    async def leaderboard(self, ctx, week: typing.Optional[int] = None):
+        """Post the leaderboards for a weekly challenge
+
+        [week] -- Which week (defaults to the current one)
+        """
+
+        if week is None:
+            challenge = await async_current_challenge()
+        else:
+            challenge = await async_get_challenge(week)
+
+        if challenge is not None:
+            await ctx.send(f'Leaderboards for Week {challenge.week}: {challenge.name}')
+            await post_leaderboards(ctx.channel, challenge)
+        else:
+            await ctx.send("(There's no challenge week like that.)")
 
-    This command requires a photo attachment to be part of the message.
+    @commands.command()
+    async def stats(self, ctx, week: typing.Optional[int] = None):
+        """Post the score distribution for a weekly challenge
 
-    <score> -- Your ex or money score (depending on the challenge) [digits only, no commas]
+        Each division's mean, standard deviation, percentiles and histogram of students' best scores.
+
+        [week] -- Which week (defaults to the current one)
+        """
+
+        if week is None:
+            challenge = await async_current_challenge()
+        else:
+            challenge = await async_get_challenge(week)
+
+        if challenge is not None:
+            await ctx.send(stats_message(challenge, await async_challenge_stats(challenge)))
+        else:
+            await ctx.send("(There's no challenge week like that.)")
+
+    @commands.command(name='diagnostics')
+    async def diagnostics_command(self, ctx, tracing: typing.Optional[str] = None):
+        """Post the bot's memory use: in total, in its caches, and where it was allocated
+
+        [tracing] -- "start" to trace where memory is allocated from now on (slows the bot down a little), "stop" to stop
+        """
+
+        if tracing == 'start':
+            diagnostics.start_tracing()
+        elif tracing == 'stop':
+            diagnostics.stop_tracing()
+        elif tracing is not None:
+            raise commands.BadArgument('tracing must be "start" or "stop"')
+        await ctx.send(diagnostics_message(self.bot))
+
+    @newweek.error
+    @close.error
+    @reopen.error
+    @leaderboard.error
+    @stats.error
+    @diagnostics_command.error
+    async def invalid_restricted(self, ctx, error):
+        if isinstance(error, commands.UserInputError):
+            await ctx.send(f'Incorrect command usage: {error}')
+            await ctx.send_help(ctx.command)
+        elif isinstance(error, commands.MissingAnyRole):
+            await ctx.send(f'Sorry {ctx.author.mention}, only faculty, admins, and TOs can use that command!')
+        else:
+            await generic_on_error(ctx, error)
+
+bot.add_cog(Students(bot))
+bot.add_cog(Faculty(bot))
+
+async def post_leaderboards(channel, challenge):
+    """Posts a challenge's leaderboard images, one per division."""
+
+    try:
+        images = await leaderboard_renderer.render(challenge)
+    except Exception as error:
+        print(f"Couldn't render leaderboards for week {challenge.week}: {error.__class__.__name__}: {error}")
+        await channel.send("(Couldn't draw the leaderboards, they're in the admin site.)")
+        return
+
+    if not images:
+        await channel.send('(No submissions this week.)')
+        return
+
+    await channel.send(files=[
+        discord.File(io.BytesIO(image), filename=f'week{challenge.week}-{level or "unknown"}.png')
+        for level, image in images
+    ])
+
+async def save_submission(member, score, attachment):
+    """Saves a submission from a member. Returns (upscore, pending).
+
+    `upscore` is the same as async_save_score's. If the submission log is on
+    and the database doesn't save the submission in time, it's left in the log
+    and `pending` is a future for its (upscore, id) (otherwise it's None).
     """
 
-    if score < 0 or score > 1000000:
-        raise commands.BadArgument('score must be between 0 and 1000000')
+    div = get_division(member.roles)
+    challenge = await async_current_challenge()
+    if submission_log is not None:
+        saved = await submission_log.submit({
+            'challenge_id': challenge.week,
+            'discord_snowflake_id': member.id,
+            'discord_name': str(member),
+            'level': div,
+            'score': score,
+            'pic_url': attachment.proxy_url,
+        })
+        if score_reader is not None:
+            # (read while it's being saved, even if that takes a while)
+            score_reader.submit(attachment, challenge.score_type, saved)
+        try:
+            upscore, _ = await asyncio.wait_for(
+                asyncio.shield(saved),
+                timeout=settings.SUBMISSION_LOG_ACK_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            # it's safe in the log, and will be saved once the database catches up
+            return None, saved
+    else:
+        async with limiter.turn(member.id):
+            upscore, submission_id = await async_save_score(member.id, str(member), div, score, attachment.proxy_url)
+        if score_reader is not None:
+            score_reader.submit(attachment, challenge.score_type, submission_id)
 
-    pic_url = validate_attachment(ctx.message)
-    div = get_division(ctx.author.roles)
-    upscore = await async_save_score(ctx.author.id, str(ctx.author), div, score, pic_url)
+    return upscore, None
 
-    message = f"Submitted {ctx.author.mention}'s score of {score}"
+def submitted_message(member, score, upscore):
+    message = f"Submitted {member.mention}'s score of {score}"
 
     if upscore is not None:
         if upscore < 0:
             message = f"{message}\nThis is {abs(upscore)} lower than your highest submission this week, but I saved the photo just in case."
         else:
             message = f'{message}\n+{upscore} upscore!'
+    return message
 
-    await ctx.send(message)
+def pending_message(member, score):
+    return f"Got {member.mention}'s score of {score}! It'll be saved in a bit."
 
-@submit.error
-async def invalid_submission(ctx, error):
-    if isinstance(error, commands.DisabledCommand):
-        await ctx.send(f'Sorry {ctx.author.mention}, submissions are currently closed.')
-    elif isinstance(error, commands.UserInputError):
-        await ctx.send(f'Incorrect command usage: {error}')
-        await ctx.send_help(submit)
+async def swap_reaction(message, me, received, new_reaction):
+    """Replaces the bot's "received" reaction on a message with a new one (or none).
+
+    The reactions are only a courtesy, so failing to change them is logged
+    rather than raised: by now the submission is saved (or its own error is
+    being handled), and a retry would only duplicate it.
+    """
+
+    try:
+        await received
+        if new_reaction is not None:
+            await message.add_reaction(new_reaction)
+        await message.remove_reaction(RECEIVED, me)
+    except discord.HTTPException as error:
+        print(f"Couldn't update the reactions on message {message.id}: {error.__class__.__name__}: {error}")
+
+async def mark_saved_later(message, me, received, saved):
+    """Updates a submission's reaction once it's saved from the submission log."""
+
+    try:
+        await saved
+    except Exception:
+        await swap_reaction(message, me, received, FAILED)
     else:
-        await generic_on_error(ctx, error)
+        await swap_reaction(message, me, received, SAVED)
+
+# for histograms, from lowest to highest
+BARS = '\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+
+def stats_message(challenge, week_stats):
+    """A table of a week's score distributions (see stats.challenge_stats), per division and in total."""
+
+    if None not in week_stats:
+        return f'(No submissions for Week {challenge.week}: {challenge.name}.)'
+
+    rows = [(level or '?', week_stats[level]) for level in DIVISION_ORDER if level in week_stats]
+    rows.append(('all', week_stats[None]))
+    lines = [['div', 'n', 'mean', 'sd', *(f'p{round(p * 100)}' for p in PERCENTILES)]] + [
+        [
+            level,
+            str(row.participants),
+            *(f'{score:,.0f}' for score in (row.mean_best_score, row.stddev_best_score, *row.percentiles)),
+        ]
+        for level, row in rows
+    ]
+    widths = [max(len(cell) for cell in column) for column in zip(*lines)]
+    histograms = ['histogram'] + [sparkline(row.histogram) for _, row in rows]
+
+    # the division on the left, numbers lined up on the right
+    table = '\n'.join(
+        '  '.join([line[0].ljust(widths[0]), *(cell.rjust(width) for cell, width in zip(line[1:], widths[1:])), histogram])
+        for line, histogram in zip(lines, histograms)
+    )
+    return f'Best scores for Week {challenge.week}: {challenge.name}\n```\n{table}\n```'
+
+def sparkline(histogram):
+    tallest = max(histogram) or 1
+    return ''.join(BARS[(len(BARS) - 1) * count // tallest] if count else ' ' for count in histogram)
+
+def rating_message(member, rating):
+    """A student's rating, rank and latest rating changes (see ratings.student_rating)."""
+
+    if rating is None:
+        return f"{member.mention} isn't rated yet. Ratings come from closed weeks you've submitted to."
+
+    student, rank, rated, changes = rating
+    lines = [f"{member.mention}'s rating is {round(student.rating)} (#{rank} of {rated} rated students)"]
+    for change in changes:
+        before = change.rating_before if change.rating_before is not None else settings.RATING_INITIAL
+        lines.append(
+            f'Week {change.challenge_id}: placed {change.rank} of {change.players} in {change.level or "?"}, '
+            f'{change.rating_after - before:+.0f}'
+        )
+    return '\n'.join(lines)
+
+def diagnostics_message(bot):
+    """The bot's memory use, cache sizes, command waits and top allocation sites."""
+
+    rss = diagnostics.rss()
+    lines = [f'Memory: {size_text(rss) if rss is not None else "?"} (peak {size_text(diagnostics.peak_rss())})']
+
+    members = sum(len(guild.members) for guild in bot.guilds)
+    caches = [
+        f'{len(bot.cached_messages)} messages',
+        f'{len(bot.users)} users',
+        f'{members} members in {len(bot.guilds)} servers',
+    ]
+    cache_size = diagnostics.cache_size()
+    if cache_size is not None:
+        entries, size = cache_size
+        caches.append(f'{entries} cache entries ({size_text(size)})')
+    lines.append(f'Caches: {", ".join(caches)}')
+
+    waits = limiter.stats()
+    lines.append(
+        f'Commands: {waits["commands"]} run, {waits["waiting"]} waiting, '
+        f'waits {waits["average_wait"]:.2f}s on average and {waits["max_wait"]:.2f}s at most'
+    )
+
+    allocations = diagnostics.top_allocations()
+    if allocations:
+        width = max(len(site) for site, _, _ in allocations)
+        table = '\n'.join(
+            f'{site.ljust(width)}  {size_text(size):>9}  {"+" if grown >= 0 else "-"}{size_text(abs(grown))}'
+            for site, size, grown in allocations
+        )
+        lines.append(f'Top allocation sites (size, growth while tracing):\n```\n{table}\n```')
+    else:
+        lines.append('(Not tracing allocations. `!diagnostics start` to start.)')
+    return '\n'.join(lines)
+
+def size_text(size):
+    if size >= 2 ** 20:
+        return f'{size / 2 ** 20:.1f} MB'
+    return f'{size / 2 ** 10:.1f} kB'
+
+def validate_score(score):
+    if score < 0 or score > 1000000:
+        raise commands.BadArgument('score must be between 0 and 1000000')
 
 def validate_attachment(msg):
     """Checks if a message includes 1 image attachment
@@ -95,52 +790,23 @@ def validate_attachment(msg):
 
     if len(msg.attachments) != 1:
         raise commands.TooManyArguments('needs one file attachment.')
-    attachment = msg.attachments[0]
+    return validate_picture(msg.attachments[0])
+
+def validate_picture(attachment):
+    """Checks that an attachment is an image. Returns its proxy_url"""
+
     if attachment.height is None or attachment.width is None:
         raise commands.BadArgument('file attachment must be an image.')
 
     return attachment.proxy_url
 
-@bot.command()
-async def addtwitter(ctx, twitter):
-    """Add twitter username to your Student profile
-
-    <twitter> -- Your twitter username
-    """
-
-    div = get_division(ctx.author.roles)
-    await async_update_student(
-        ctx.author.id,
-        discord_name=str(ctx.author),
-        level=div,
-        twitter=twitter,
-    )
-    await ctx.send(f"Updated {ctx.author.mention}'s profile!")
-
-@bot.command()
-async def addname(ctx, ddr_name):
-    """Add DDR name to your Student profile
-
-    <ddr_name> -- Your DDR name (ex. KEEKSTER)
-    """
-
-    div = get_division(ctx.author.roles)
-    await async_update_student(
-        ctx.author.id,
-        discord_name=str(ctx.author),
-        level=div,
-        ddr_name=ddr_name,
-    )
-    await ctx.send(f"Updated {ctx.author.mention}'s profile!")
-
-@addtwitter.error
-@addname.error
-async def invalid_update(ctx, error):
-    if isinstance(error, commands.UserInputError):
-        await ctx.send(f'Incorrect command usage: {error}')
-        await ctx.send_help(ctx.command)
-    else:
-        await generic_on_error(ctx, error)
+# division role names, highest first
+DIVISION_ROLES = {
+    'Graduate': DIVISIONS.GRADUATE,
+    'Varsity': DIVISIONS.VARSITY,
+    'Freshman': DIVISIONS.FRESHMAN,
+    'JV': DIVISIONS.JUNIOR_VARSITY,
+}
 
 def get_division(roles_list):
     """Finds the highest division in a given list of Roles.
@@ -148,79 +814,154 @@ def get_division(roles_list):
     Returns the code for that division based on Student.LevelPlacement choices.
     """
 
-    divs = {
-        'Graduate': DIVISIONS.GRADUATE,
-        'Varsity': DIVISIONS.VARSITY,
-        'Freshman': DIVISIONS.FRESHMAN,
-        'JV': DIVISIONS.JUNIOR_VARSITY,
-    }
-
     role_names = {role.name for role in roles_list}
-    for div, code in divs.items():
+    for div, code in DIVISION_ROLES.items():
         if div in role_names:
             return code
     return DIVISIONS.UNKNOWN
 
-@bot.command()
-@commands.has_any_role('Admin', 'Faculty', 'TO')
-async def newweek(ctx, *, name):
-    """Start a new weekly challenge
-
-    <name> -- Name of the new weekly challenge
-    """
-
-    if await is_latest_week_open():
-        await ctx.send(f"You can't make a new week while the current week is still open!")
+async def generic_on_error(ctx, error):
+    if isinstance(error, commands.CheckFailure):
+        # it's either in a dm or in the wrong channel, in which case the bot
+        # should stay silent.
+        pass
     else:
-        challenge = await async_new_week(name)
-        await ctx.send(f'Week {challenge.week}: {challenge.name} has begun!')
+        print(f'Error occurred in `{ctx.command}`: {error.__class__.__name__}: {error}')
+        await ctx.send(f":grimacing: An error occurred running that command! Please try again {ctx.author.mention}.")
+        raise error
 
-@bot.command()
-@commands.has_any_role('Admin', 'Faculty', 'TO')
-async def close(ctx):
-    """Close submissions for the current weekly challenge"""
+# Slash commands
+# These do the same things as the ! commands. Their responses are deferred
+# (discord shows "thinking...") before touching the database, so a slow save
+# never runs past the interaction's 3 second deadline.
 
-    challenge = await close_submissions()
-    if challenge is not None:
-        await ctx.send(f'Pencils down! Submissions for Week {challenge.week}: {challenge.name} are now closed!')
-    else:
-        await ctx.send("(There's no challenge week to close.)")
+async def run_command(ctx, name, /, *args, **kwargs):
+    """Runs the ! command with the same name (without its checks)."""
 
-@bot.command()
-@commands.has_any_role('Admin', 'Faculty', 'TO')
-async def reopen(ctx):
-    """Reopen submissions for the current weekly challenge"""
+    command = ctx.bot.get_command(name)
+    await command.callback(command.cog, ctx, *args, **kwargs)
 
-    challenge = await reopen_submissions()
-    if challenge is not None:
-        await ctx.send(f'Submissions for Week {challenge.week}: {challenge.name} are now reopen!')
+@slash.command('submit', 'Submit a score with picture for the BFA Weekly Challenge', [
+    option('score', 'Your ex or money score (depending on the challenge)', interactions.INTEGER),
+    option('picture', 'Picture of your score', interactions.ATTACHMENT),
+])
+@commands.check(in_submission_channel)
+@commands.check(are_submissions_open)
+async def slash_submit(ctx, score, picture):
+    validate_score(score)
+    validate_picture(picture)
+
+    await ctx.defer()
+    upscore, pending = await save_submission(ctx.author, score, picture)
+    if pending is not None:
+        await ctx.send(pending_message(ctx.author, score))
     else:
-        await ctx.send("(There's no challenge week to reopen.)")
-
-@newweek.error
-@close.error
-@reopen.error
-async def invalid_restricted(ctx, error):
-    if isinstance(error, commands.UserInputError):
-        await ctx.send(f'Incorrect command usage: {error}')
-        await ctx.send_help(ctx.command)
+        await ctx.send(submitted_message(ctx.author, score, upscore))
+
+@slash.command('addtwitter', 'Add twitter username to your Student profile', [
+    option('twitter', 'Your twitter username'),
+])
+@commands.check(in_submission_channel)
+async def slash_addtwitter(ctx, twitter):
+    await ctx.defer()
+    await run_command(ctx, 'addtwitter', twitter)
+
+@slash.command('addname', 'Add DDR name to your Student profile', [
+    option('ddr_name', 'Your DDR name (ex. KEEKSTER)'),
+])
+@commands.check(in_submission_channel)
+async def slash_addname(ctx, ddr_name):
+    await ctx.defer()
+    await run_command(ctx, 'addname', ddr_name)
+
+@slash.command('rating', 'Show your skill rating, from how you placed in closed weeks', [
+    option('member', "Whose rating to show (faculty only, defaults to yours)", interactions.USER, required=False),
+])
+@commands.check(in_submission_channel)
+async def slash_rating(ctx, member=None):
+    await ctx.defer()
+    await run_command(ctx, 'rating', member)
+
+@slash.command('newweek', 'Start a new weekly challenge', [
+    option('name', 'Name of the new weekly challenge'),
+])
+@commands.check(in_submission_channel)
+@commands.has_any_role(*FACULTY_ROLES)
+async def slash_newweek(ctx, name):
+    await ctx.defer()
+    await run_command(ctx, 'newweek', name=name)
+
+@slash.command('leaderboard', 'Post the leaderboards for a weekly challenge', [
+    option('week', 'Which week (defaults to the current one)', interactions.INTEGER, required=False),
+])
+@commands.check(in_submission_channel)
+@commands.has_any_role(*FACULTY_ROLES)
+async def slash_leaderboard(ctx, week=None):
+    await ctx.defer()
+    await run_command(ctx, 'leaderboard', week)
+
+@slash.command('stats', 'Post the score distribution for a weekly challenge', [
+    option('week', 'Which week (defaults to the current one)', interactions.INTEGER, required=False),
+])
+@commands.check(in_submission_channel)
+@commands.has_any_role(*FACULTY_ROLES)
+async def slash_stats(ctx, week=None):
+    await ctx.defer()
+    await run_command(ctx, 'stats', week)
+
+@slash.command('diagnostics', "Post the bot's memory use", [
+    option('tracing', '"start" to trace where memory is allocated, "stop" to stop', required=False),
+])
+@commands.check(in_submission_channel)
+@commands.has_any_role(*FACULTY_ROLES)
+async def slash_diagnostics(ctx, tracing=None):
+    await ctx.defer(hidden=True)
+    await run_command(ctx, 'diagnostics', tracing)
+
+@slash.command('close', 'Close submissions for the current weekly challenge')
+@commands.check(in_submission_channel)
+@commands.has_any_role(*FACULTY_ROLES)
+async def slash_close(ctx):
+    await ctx.defer()
+    await run_command(ctx, 'close')
+
+@slash.command('reopen', 'Reopen submissions for the current weekly challenge')
+@commands.check(in_submission_channel)
+@commands.has_any_role(*FACULTY_ROLES)
+async def slash_reopen(ctx):
+    await ctx.defer()
+    await run_command(ctx, 'reopen')
+
+@slash.error
+async def invalid_slash_command(ctx, error):
+    # checks and input errors happen before the response is deferred, so
+    # those replies are only shown to whoever used the command
+    if isinstance(error, commands.DisabledCommand):
+        await ctx.send(f'Sorry {ctx.author.mention}, submissions are currently closed.', hidden=True)
+    elif isinstance(error, commands.UserInputError):
+        await ctx.send(f'Incorrect command usage: {error}', hidden=True)
     elif isinstance(error, commands.MissingAnyRole):
-        await ctx.send(f'Sorry {ctx.author.mention}, only faculty, admins, and TOs can use that command!')
+        await ctx.send(f'Sorry {ctx.author.mention}, only faculty, admins, and TOs can use that command!', hidden=True)
+    elif isinstance(error, commands.CheckFailure):
+        # unlike a message, an interaction can't just be ignored
+        await ctx.send('Sorry, that command only works in the submissions channel.', hidden=True)
     else:
-        await generic_on_error(ctx, error)
-
-async def generic_on_error(ctx, error):
-    if isinstance(error, commands.CheckFailure):
-        # it's either in a dm or in the wrong channel, in which case the bot
-        # should stay silent.
-        pass
-    else:
-        print(f'Error occurred in `{ctx.command}`: {error.__class__.__name__}: {error}')
+        print(f'Error occurred in `/{ctx.name}`: {error.__class__.__name__}: {error}')
         await ctx.send(f":grimacing: An error occurred running that command! Please try again {ctx.author.mention}.")
         raise error
 
-if __name__ == '__main__':
+def prepare():
+    """Gets the bot ready to log in, on its event loop. Returns the discord token."""
+
+    global warm_up_task
     # ensure necessary env vars are set
     int(os.environ['SUBMISSION_CHANNEL_ID'])
     token = os.environ['DISCORD_BOT_TOKEN']
-    bot.run(token)
+    # connect to the database while logging in to discord
+    warm_up_task = bot.loop.create_task(warm_up())
+    # to hear about changes made in the admin
+    bus.start()
+    return token
+
+if __name__ == '__main__':
+    bot.run(prepare())
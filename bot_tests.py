@@ -4,26 +4,36 @@ import discord.ext.test as dpytest
 import discord
 
 from channels.db import database_sync_to_async
+from django.core.cache import cache
+from django.db import OperationalError
+from django.db.backends.utils import CursorWrapper
+from django.utils import timezone
 
+import asyncio
 import os
+import subprocess
+import sys
+import types
 
-from submissions import models
+from concurrent.futures import ThreadPoolExecutor
+
+from submissions import leaderboards, models, ocr, ratings, stats, traces, wal
 import bot
+import interactions
 
 @pytest.fixture
 async def test_bot(event_loop):
     intents = discord.Intents.default()
     intents.members = True
 
+    # tables are emptied between tests without clearing the caches
+    cache.clear()
+
     test_bot = commands.Bot('!', loop=event_loop, intents=intents)
     test_bot.add_check(bot.globally_block_dms)
     test_bot.add_check(bot.correct_channel)
-    test_bot.add_command(bot.submit)
-    test_bot.add_command(bot.addtwitter)
-    test_bot.add_command(bot.addname)
-    test_bot.add_command(bot.newweek)
-    test_bot.add_command(bot.close)
-    test_bot.add_command(bot.reopen)
+    test_bot.add_cog(bot.Students(test_bot))
+    test_bot.add_cog(bot.Faculty(test_bot))
 
     dpytest.configure(client=test_bot, num_channels=2, num_members=3)
 
@@ -35,6 +45,51 @@ async def test_bot(event_loop):
 
     await dpytest.empty_queue()
 
+@pytest.fixture
+def interaction_requests(test_bot, monkeypatch):
+    """Records the bot's http requests (responding to slash commands) as (method, path, json)."""
+
+    requests = []
+    async def request(route, **kwargs):
+        requests.append((route.method, route.path, kwargs.get('json')))
+    monkeypatch.setattr(test_bot.http, 'request', request)
+
+    return requests
+
+@pytest.fixture
+def queries(monkeypatch):
+    """Records the SQL of every database query, from any thread.
+
+    (The commands' queries run in database_sync_to_async's thread, which
+    django's own query capturing doesn't see.)
+    """
+
+    queries = []
+    execute, executemany = CursorWrapper.execute, CursorWrapper.executemany
+
+    def counting_execute(self, sql, params=None):
+        queries.append(sql)
+        return execute(self, sql, params)
+
+    def counting_executemany(self, sql, param_list):
+        queries.append(sql)
+        return executemany(self, sql, param_list)
+
+    monkeypatch.setattr(CursorWrapper, 'execute', counting_execute)
+    monkeypatch.setattr(CursorWrapper, 'executemany', counting_executemany)
+    return queries
+
+@pytest.fixture
+def submission_log(test_bot, tmp_path, monkeypatch, settings):
+    settings.SUBMISSION_LOG_ACK_TIMEOUT = 1
+    log = wal.SubmissionLog(str(tmp_path / 'submissions.log'), retry_delay=0.1)
+    log.start(test_bot.loop)
+    monkeypatch.setattr(bot, 'submission_log', log)
+
+    yield log
+
+    log._task.cancel()
+
 ### Bot checks
 
 @pytest.mark.django_db(transaction=True)
@@ -60,6 +115,30 @@ async def test_bot_ignores_other_channels(test_bot):
     await ignore_discord_error(dpytest.message(content="!newweek abc", channel=other_channel))
     assert dpytest.verify().message().nothing()
 
+@pytest.mark.asyncio
+async def test_failed_warm_up_doesnt_stop_startup(monkeypatch, capsys):
+    async def database_down():
+        raise OperationalError('database is down')
+    monkeypatch.setattr(bot, 'async_warm_up', database_down)
+
+    await bot.warm_up()
+    assert "couldn't warm up: OperationalError: database is down" in capsys.readouterr().out
+
+@pytest.mark.asyncio
+async def test_failed_slash_sync_doesnt_stop_startup(tmp_path, monkeypatch, capsys):
+    async def forbidden(bot):
+        raise discord.Forbidden(types.SimpleNamespace(status=403, reason='Forbidden'), 'Missing Access')
+    monkeypatch.setattr(bot.slash, 'sync', forbidden)
+    log = wal.SubmissionLog(str(tmp_path / 'submissions.log'))
+    monkeypatch.setattr(bot, 'submission_log', log)
+
+    await bot.on_ready()
+    try:
+        assert log._task is not None
+        assert "couldn't register the slash commands: Forbidden" in capsys.readouterr().out
+    finally:
+        log._task.cancel()
+
 ### General commands
 
 @pytest.mark.django_db(transaction=True)
@@ -154,6 +233,279 @@ async def test_submit_not_allowed_during_closed_submissions(test_bot):
     assert dpytest.verify().message().contains().content("currently closed")
     assert await database_sync_to_async(models.Submission.objects.count)() == 0
 
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_submit_reacts_and_replies(test_bot):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+
+    msg = await dpytest.message(content="!submit 1234", attachments=["fake"])
+
+    assert [str(r.emoji) for r in msg.reactions if r.me] == [bot.SAVED]
+    assert dpytest.verify().message().contains().content("score of 1234")
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_submit_saved_even_if_reactions_fail(test_bot, monkeypatch):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+
+    async def reactions_down(self, *args):
+        raise discord.HTTPException(types.SimpleNamespace(status=503, reason='Service Unavailable'), 'reactions are down')
+    monkeypatch.setattr(discord.Message, 'add_reaction', reactions_down)
+    monkeypatch.setattr(discord.Message, 'remove_reaction', reactions_down)
+
+    await dpytest.message(content="!submit 1234", attachments=["fake"])
+
+    # no "try again", which would only duplicate the submission
+    assert dpytest.verify().message().contains().content("score of 1234")
+    assert dpytest.verify().message().nothing()
+    assert await database_sync_to_async(models.Submission.objects.count)() == 1
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_submit_saved_even_if_reply_fails(test_bot, monkeypatch):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+
+    async def message_deleted(self, *args, **kwargs):
+        raise discord.HTTPException(types.SimpleNamespace(status=404, reason='Not Found'), 'Unknown Message')
+    monkeypatch.setattr(discord.Message, 'reply', message_deleted)
+
+    await dpytest.message(content="!submit 1234", attachments=["fake"])
+
+    assert dpytest.verify().message().nothing()
+    assert await database_sync_to_async(models.Submission.objects.count)() == 1
+
+@pytest.mark.asyncio
+async def test_replies_are_merged_when_busy():
+    sent = []
+
+    class FakeChannel:
+        id = 1
+        async def send(self, content):
+            sent.append(('send', content))
+
+    class FakeMessage:
+        channel = FakeChannel()
+        def __init__(self, n):
+            self.n = n
+        async def reply(self, content, **kwargs):
+            sent.append(('reply', content))
+
+    replies = bot.ReplyBatcher(window=0.1)
+    await replies.reply(FakeMessage(1), 'one')
+    await asyncio.gather(
+        replies.reply(FakeMessage(2), 'two'),
+        replies.reply(FakeMessage(3), 'three'),
+    )
+
+    assert sent == [('reply', 'one'), ('send', 'two\n\nthree')]
+
+@pytest.mark.asyncio
+async def test_merged_replies_fit_in_messages():
+    sent = []
+
+    class FakeChannel:
+        id = 1
+        async def send(self, content):
+            sent.append(content)
+
+    class FakeMessage:
+        channel = FakeChannel()
+        async def reply(self, content, **kwargs):
+            sent.append(content)
+
+    replies = bot.ReplyBatcher(window=0.1)
+    await replies.reply(FakeMessage(), 'first')
+    contents = [f'{n:03} ' + 'x' * 96 for n in range(45)]
+    assert await asyncio.gather(*(replies.reply(FakeMessage(), content) for content in contents)) == [True] * 45
+
+    assert len(sent) == 4
+    assert all(len(message) <= bot.MAX_MESSAGE_LENGTH for message in sent)
+    assert '\n\n'.join(sent[1:]).split('\n\n') == contents
+
+@pytest.mark.asyncio
+async def test_failed_replies_are_sent_one_by_one_then_given_up(capsys):
+    sent = []
+    down = discord.HTTPException(types.SimpleNamespace(status=503, reason='Service Unavailable'), 'down')
+
+    class FakeChannel:
+        id = 1
+        async def send(self, content):
+            raise down
+
+    class FakeMessage:
+        channel = FakeChannel()
+        def __init__(self, n):
+            self.id = n
+        async def reply(self, content, **kwargs):
+            if self.id == 3:
+                # eg. the student deleted their message
+                raise down
+            sent.append(content)
+
+    replies = bot.ReplyBatcher(window=0.1)
+    assert await replies.reply(FakeMessage(1), 'one')
+    assert await asyncio.gather(
+        replies.reply(FakeMessage(2), 'two'),
+        replies.reply(FakeMessage(3), 'three'),
+    ) == [True, False]
+
+    assert sent == ['one', 'two']
+    assert "Couldn't reply to message 3" in capsys.readouterr().out
+
+@pytest.mark.asyncio
+async def test_limiter_serializes_commands_per_key():
+    limiter = bot.CommandLimiter(limit=4)
+    events = []
+
+    async def command(key, n):
+        async with limiter.turn(key):
+            events.append(('start', n))
+            await asyncio.sleep(0.05)
+            events.append(('end', n))
+
+    await asyncio.gather(command('a', 1), command('a', 2), command('b', 3))
+
+    # 1 and 2 took turns, 3 ran alongside 1
+    assert events.index(('end', 1)) < events.index(('start', 2))
+    assert events.index(('start', 3)) < events.index(('end', 1))
+    assert limiter._locks == {}
+
+    stats = limiter.stats()
+    assert stats['commands'] == 3
+    assert stats['waiting'] == 0
+    # (sleep can wake up a hair early)
+    assert stats['max_wait'] >= 0.04
+
+@pytest.mark.asyncio
+async def test_limiter_limits_concurrency():
+    limiter = bot.CommandLimiter(limit=2)
+    running = 0
+    most_running = 0
+
+    async def command(key):
+        nonlocal running, most_running
+        async with limiter.turn(key):
+            running += 1
+            most_running = max(most_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(command(key) for key in range(6)))
+
+    assert most_running == 2
+    assert limiter.stats()['commands'] == 6
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_submit_with_log_saves_submission(test_bot, submission_log):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+
+    await dpytest.message(content="!submit 100", attachments=["fake1"])
+    await dpytest.message(content="!submit 1234", attachments=["fake2"])
+    assert dpytest.verify().message().contains().content("score of 100")
+    assert dpytest.verify().message().contains().content("+1134 upscore!")
+
+    assert await database_sync_to_async(models.Submission.objects.count)() == 2
+    assert submission_log.pending == []
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_submit_with_log_survives_database_outage(test_bot, submission_log, monkeypatch):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+
+    save_scores = wal.async_save_scores
+    async def database_down(entries):
+        raise OperationalError('database is down')
+    monkeypatch.setattr(wal, 'async_save_scores', database_down)
+
+    msg = await dpytest.message(content="!submit 1234", attachments=["fake"])
+    assert dpytest.verify().message().contains().content("saved in a bit")
+    assert [str(r.emoji) for r in msg.reactions if r.me] == [bot.RECEIVED]
+    assert len(submission_log.pending) == 1
+    assert await database_sync_to_async(models.Submission.objects.count)() == 0
+
+    # database is back
+    monkeypatch.setattr(wal, 'async_save_scores', save_scores)
+    for _ in range(20):
+        if not submission_log.pending:
+            break
+        await asyncio.sleep(0.1)
+
+    assert submission_log.pending == []
+    subm = await database_sync_to_async(models.Submission.objects.first)()
+    assert subm.score == 1234
+
+    await asyncio.sleep(0)
+    assert [str(r.emoji) for r in msg.reactions if r.me] == [bot.SAVED]
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_submit_with_log_saved_after_newweek_goes_in_its_week(test_bot, submission_log, monkeypatch):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+    admin = await make_role_member(test_bot, "Admin")
+
+    save_scores = wal.async_save_scores
+    async def database_down(entries):
+        raise OperationalError('database is down')
+    monkeypatch.setattr(wal, 'async_save_scores', database_down)
+
+    await dpytest.message(content="!submit 1234", attachments=["fake"])
+    assert dpytest.verify().message().contains().content("saved in a bit")
+    sent_by = timezone.now()
+
+    await dpytest.message(content="!close", member=admin)
+    assert dpytest.verify().message().contains().content("are now closed")
+    await dpytest.empty_queue()
+    await dpytest.message(content="!newweek anotha one", member=admin)
+    assert dpytest.verify().message().contains().content("Week 2: anotha one")
+
+    # database is back
+    monkeypatch.setattr(wal, 'async_save_scores', save_scores)
+    for _ in range(20):
+        if not submission_log.pending:
+            break
+        await asyncio.sleep(0.1)
+
+    assert submission_log.pending == []
+    subm = await database_sync_to_async(models.Submission.objects.get)()
+    assert subm.challenge_id == 1
+    assert subm.submitted_at <= sent_by
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_submit_with_log_checks_picture_once_saved(test_bot, submission_log, monkeypatch):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1', score_type=models.ScoreType.EX)
+
+    def read_score(image_bytes, score_type, region):
+        return 1234 if score_type == models.ScoreType.EX else 998_760
+    monkeypatch.setattr(ocr, 'read_score', read_score)
+    async def read(self, **kwargs):
+        return b'picture'
+    monkeypatch.setattr(discord.Attachment, 'read', read)
+    # reading in this process's default executor
+    reader = ocr.ScoreReader()
+    reader._tasks = [asyncio.create_task(reader._work())]
+    monkeypatch.setattr(bot, 'score_reader', reader)
+
+    save_scores = wal.async_save_scores
+    async def database_down(entries):
+        raise OperationalError('database is down')
+    monkeypatch.setattr(wal, 'async_save_scores', database_down)
+
+    await dpytest.message(content="!submit 1234", attachments=["fake"])
+    assert dpytest.verify().message().contains().content("saved in a bit")
+
+    # database is back
+    monkeypatch.setattr(wal, 'async_save_scores', save_scores)
+    try:
+        await asyncio.wait_for(reader.queue.join(), 5)
+    finally:
+        reader.stop()
+
+    subm = await database_sync_to_async(models.Submission.objects.get)()
+    assert subm.ocr_score == 1234
+    assert subm.score_matches_picture
+
 @pytest.mark.django_db(transaction=True)
 @pytest.mark.asyncio
 async def test_addtwitter_creates_student(test_bot):
@@ -276,6 +628,49 @@ async def test_close_closes_submissions(test_bot):
         await dpytest.message(content="!submit 1234", attachments=["fake"])
     assert await database_sync_to_async(models.Submission.objects.count)() == 0
 
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_close_posts_leaderboards(test_bot, tmp_path, monkeypatch):
+    # dpytest saves sent files in the current directory
+    monkeypatch.chdir(tmp_path)
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1', is_open=True)
+    await make_role_member(test_bot, "Freshman")
+    admin = await make_role_member(test_bot, "Admin")
+
+    await dpytest.message(content="!submit 1234", member=admin, attachments=["fake"])
+    await dpytest.empty_queue()
+    await dpytest.message(content="!close", member=admin)
+
+    assert dpytest.verify().message().contains().content("now closed")
+    leaderboard = dpytest.get_message()
+    assert [a.filename for a in leaderboard.attachments] == ['week1-FR.png']
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_leaderboard_images_are_cached(test_bot):
+    challenge = await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+    student = await database_sync_to_async(models.Student.objects.create)(discord_snowflake_id=1, ddr_name='AAA')
+    await database_sync_to_async(student.save_score)(100, 'url')
+
+    renders = 0
+    class CountingPool(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            nonlocal renders
+            renders += 1
+            return super().submit(*args, **kwargs)
+
+    renderer = leaderboards.LeaderboardRenderer()
+    renderer._pool = CountingPool()
+
+    first = await renderer.render(challenge)
+    assert await renderer.render(challenge) == first
+    assert renders == 1
+
+    # a new best score changes the leaderboard, so it's drawn again
+    await database_sync_to_async(student.save_score)(200, 'url')
+    await renderer.render(challenge)
+    assert renders == 2
+
 @pytest.mark.django_db(transaction=True)
 @pytest.mark.asyncio
 async def test_close_restricted_to_admin(test_bot):
@@ -306,6 +701,265 @@ async def test_reopen_restricted_to_admin(test_bot):
         await dpytest.message(content="!reopen")
     assert dpytest.verify().message().contains().content("Sorry").content("only faculty, admins, and TOs")
 
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_stats_posts_score_distribution(test_bot):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+    for i, (level, score) in enumerate([('FR', 800_000), ('FR', 900_000), ('VA', 995_000)]):
+        student = await database_sync_to_async(models.Student.objects.create)(discord_snowflake_id=i, level=level)
+        await database_sync_to_async(student.save_score)(score, 'url')
+    admin = await make_role_member(test_bot, "Admin")
+
+    await dpytest.message(content="!stats 1", member=admin)
+    content = dpytest.get_message().content
+    assert content.startswith('Best scores for Week 1: week1')
+    lines = content.split('\n')
+    assert lines[2].split() == ['div', 'n', 'mean', 'sd', 'p10', 'p25', 'p50', 'p75', 'p90', 'histogram']
+    assert lines[3].split()[:4] == ['VA', '1', '995,000', '0']
+    assert lines[4].split()[:5] == ['FR', '2', '850,000', '50,000', '810,000']
+    assert lines[5].split()[:3] == ['all', '3', '898,333']
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_stats_restricted_to_admin(test_bot):
+    with pytest.raises(commands.MissingAnyRole):
+        await dpytest.message(content="!stats")
+    assert dpytest.verify().message().contains().content("Sorry").content("only faculty, admins, and TOs")
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_rating_shows_rank_and_changes(test_bot):
+    challenge = await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+    member = test_bot.guilds[0].members[0]
+    for snowflake, score in [(member.id, 900_000), (1, 800_000)]:
+        student = await database_sync_to_async(models.Student.objects.create)(discord_snowflake_id=snowflake)
+        await database_sync_to_async(student.save_score)(score, 'url')
+    challenge.is_open = False
+    await database_sync_to_async(challenge.save)()
+
+    await dpytest.message(content="!rating")
+    content = dpytest.get_message().content
+    assert content.startswith(f"{member.mention}'s rating is 1516 (#1 of 2 rated students)")
+    assert 'Week 1' in content and '+16' in content
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_rating_of_unrated_student(test_bot):
+    await dpytest.message(content="!rating")
+    assert dpytest.verify().message().contains().content("isn't rated yet")
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_rating_of_others_restricted_to_faculty(test_bot):
+    other = test_bot.guilds[0].members[1]
+    with pytest.raises(commands.MissingAnyRole):
+        await dpytest.message(content=f"!rating {other.mention}")
+    assert dpytest.verify().message().contains().content("Sorry").content("only faculty, admins, and TOs")
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_diagnostics_reports_memory(test_bot):
+    admin = await make_role_member(test_bot, "Admin")
+
+    await dpytest.message(content="!diagnostics", member=admin)
+    content = dpytest.get_message().content
+    assert content.startswith('Memory: ')
+    assert 'members in 1 servers' in content
+    assert 'Not tracing allocations' in content
+
+    try:
+        await dpytest.message(content="!diagnostics start", member=admin)
+        content = dpytest.get_message().content
+        assert 'Top allocation sites' in content
+    finally:
+        await dpytest.message(content="!diagnostics stop", member=admin)
+    assert 'Not tracing allocations' in dpytest.get_message().content
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_diagnostics_restricted_to_admin(test_bot):
+    with pytest.raises(commands.MissingAnyRole):
+        await dpytest.message(content="!diagnostics")
+    assert dpytest.verify().message().contains().content("Sorry").content("only faculty, admins, and TOs")
+
+def test_bot_keeps_no_messages_or_members():
+    assert bot.bot.intents.value == discord.Intents(guilds=True, guild_messages=True).value
+    assert bot.bot._connection.max_messages is None
+    assert bot.bot._connection.member_cache_flags.value == 0
+
+def test_combined_mode_runs_the_bot_on_daphnes_loop():
+    # in another process, since it installs twisted's reactor
+    subprocess.run(
+        [sys.executable, '-c', 'import combined; assert combined.bot.bot.loop is combined.twisted_loop'],
+        check=True,
+    )
+
+### Slash commands
+# dpytest doesn't do interactions, so these hand the bot an interaction like
+# discord would, and record its http requests instead of sending them
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_slash_submit_creates_submission(test_bot, interaction_requests):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+    sender = await make_role_member(test_bot, "Freshman")
+
+    await use_slash_command(test_bot, 'submit', member=sender, score=1234, picture=fake_picture())
+
+    # deferred before saving, then the reply replaces the "thinking..." message
+    assert interaction_requests[0][1] == '/interactions/{id}/{token}/callback'
+    assert interaction_requests[0][2]['type'] == interactions.DEFER
+    assert interaction_requests[1][0] == 'PATCH'
+    assert "score of 1234" in slash_replies(interaction_requests)[0][0]
+
+    subm = await database_sync_to_async(models.Submission.objects.select_related('student').first)()
+    assert subm.score == 1234
+    assert subm.pic_url == fake_picture()['proxy_url']
+    assert subm.student.discord_snowflake_id == sender.id
+    assert subm.level == models.LevelPlacement.FRESHMAN
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_slash_submit_requires_image(test_bot, interaction_requests):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1')
+    picture = {**fake_picture(), 'width': None, 'height': None}
+
+    await use_slash_command(test_bot, 'submit', score=1234, picture=picture)
+
+    assert slash_replies(interaction_requests) == [('Incorrect command usage: file attachment must be an image.', True)]
+    assert await database_sync_to_async(models.Submission.objects.count)() == 0
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_slash_submit_not_allowed_during_closed_submissions(test_bot, interaction_requests):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1', is_open=False)
+
+    await use_slash_command(test_bot, 'submit', score=1234, picture=fake_picture())
+
+    [(content, hidden)] = slash_replies(interaction_requests)
+    assert "currently closed" in content
+    assert hidden
+    assert await database_sync_to_async(models.Submission.objects.count)() == 0
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_slash_commands_only_work_in_submission_channel(test_bot, interaction_requests):
+    other_channel = test_bot.guilds[0].text_channels[1]
+
+    await use_slash_command(test_bot, 'addname', channel=other_channel, ddr_name='KEEKSTER')
+
+    assert slash_replies(interaction_requests) == [('Sorry, that command only works in the submissions channel.', True)]
+    assert await database_sync_to_async(models.Student.objects.count)() == 0
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_slash_addname_updates_student(test_bot, interaction_requests):
+    sender = test_bot.guilds[0].members[0]
+
+    await use_slash_command(test_bot, 'addname', member=sender, ddr_name='KEEKSTER')
+
+    assert "Updated" in slash_replies(interaction_requests)[0][0]
+    student = await database_sync_to_async(models.Student.objects.get)(discord_snowflake_id=sender.id)
+    assert student.ddr_name == 'KEEKSTER'
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_slash_close_closes_submissions(test_bot, interaction_requests):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1', is_open=True)
+    admin = await make_role_member(test_bot, "Admin")
+
+    await use_slash_command(test_bot, 'close', member=admin)
+
+    assert "now closed" in slash_replies(interaction_requests)[0][0]
+    challenge = await database_sync_to_async(models.Challenge.objects.get)(week=1)
+    assert not challenge.is_open
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_slash_newweek_restricted_to_admin(test_bot, interaction_requests):
+    await database_sync_to_async(models.Challenge.objects.create)(week=1, name='week1', is_open=False)
+
+    await use_slash_command(test_bot, 'newweek', name='newnew')
+
+    [(content, hidden)] = slash_replies(interaction_requests)
+    assert "only faculty, admins, and TOs" in content
+    assert hidden
+    assert await database_sync_to_async(models.Challenge.objects.count)() == 1
+
+### Command traces
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_trace_is_anonymised(test_bot, tmp_path):
+    recorder = traces.TraceRecorder(str(tmp_path / 'trace.jsonl'))
+    member = await make_role_member(test_bot, "Varsity")
+    other = test_bot.guilds[0].members[1]
+
+    message = await dpytest.message(content=f"!addname KEEKS {other.mention}", member=member)
+    recorder.record_message(message)
+    recorder.record_interaction(test_bot.guilds[0], {
+        'member': {'user': {'id': str(member.id)}, 'roles': [str(role.id) for role in member.roles[1:]]},
+        'data': {
+            'name': 'submit',
+            'options': [
+                {'name': 'score', 'type': interactions.INTEGER, 'value': 912345},
+                {'name': 'picture', 'type': interactions.ATTACHMENT, 'value': '1'},
+            ],
+            'resolved': {'attachments': {'1': fake_picture()}},
+        },
+    })
+
+    trace = (tmp_path / 'trace.jsonl').read_text()
+    assert str(member.id) not in trace and str(other.id) not in trace
+    assert 'KEEKS' not in trace and 'cdn.discordapp.com' not in trace
+    message_event, slash_event = traces.read_trace(str(tmp_path / 'trace.jsonl'))
+    assert message_event['command'] == '!addname'
+    assert message_event['arguments'] == f'xxxxx <@{traces.pseudonym(other.id)}>'
+    assert message_event['member'] == slash_event['member'] == traces.pseudonym(member.id)
+    assert message_event['roles'] == slash_event['roles'] == ['Varsity']
+    assert slash_event['arguments'] == [
+        {'name': 'score', 'type': interactions.INTEGER, 'value': 912345},
+        {'name': 'picture', 'type': interactions.ATTACHMENT, 'value': {
+            'filename': 'score.png', 'size': 100, 'content_type': 'image/png', 'width': 100, 'height': 100,
+        }},
+    ]
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_replay_measures_each_command(monkeypatch):
+    monkeypatch.setattr(bot.replies, 'window', 0)
+    picture = {'filename': 'score.png', 'size': 100, 'content_type': 'image/png', 'width': 100, 'height': 100}
+    events = [
+        {'time': 0, 'command': '!submit', 'arguments': '900000', 'member': 'member-a', 'roles': ['Varsity'], 'attachments': [picture]},
+        {'time': 1, 'command': '!sumbit', 'arguments': '900000', 'member': 'member-b', 'roles': [], 'attachments': [picture]},
+        {'time': 2, 'command': '/submit', 'arguments': [
+            {'name': 'score', 'type': interactions.INTEGER, 'value': 950000},
+            {'name': 'picture', 'type': interactions.ATTACHMENT, 'value': picture},
+        ], 'member': 'member-b', 'roles': ['Freshman'], 'attachments': []},
+        {'time': 3, 'command': '!close', 'arguments': '', 'member': 'member-c', 'roles': ['Admin'], 'attachments': []},
+    ]
+
+    replayed = await traces.replay(events, speed=0, log=lambda line: None)
+
+    assert [event.command for event in replayed] == ['!submit', '!sumbit', '/submit', '!close']
+    assert [event.error for event in replayed] == [None, 'CommandNotFound', None, None]
+    assert all(event.latency >= 0 for event in replayed)
+    assert replayed[0].queries > 0 and replayed[1].queries == 0
+    scores = await database_sync_to_async(lambda: sorted(models.Submission.objects.values_list('level', 'score')))()
+    assert scores == [('FR', 950000), ('VA', 900000)]
+    assert not (await database_sync_to_async(models.Challenge.objects.get)(week=1)).is_open
+
+    summary = traces.summarize(replayed)
+    assert list(summary)[0] == 'all'
+    assert summary['all']['count'] == 4 and summary['all']['errors'] == 1
+    assert summary['!submit']['p50'] == replayed[0].latency
+
+def test_schedule_follows_the_recorded_pace():
+    events = [{'time': t} for t in (100, 101, 103, 1000)]
+    assert traces.schedule(events, speed=1, max_gap=60) == [0, 1, 3, 63]
+    assert traces.schedule(events, speed=2, max_gap=60) == [0, 0.5, 1.5, 31.5]
+    assert traces.schedule(events, speed=0) == [0, 0, 0, 0]
+
 ### Helpers
 
 async def ignore_discord_error(coro):
@@ -321,3 +975,140 @@ async def make_role_member(test_bot, role_name, member_index=0):
     await dpytest.add_role(member, role)
 
     return member
+
+async def use_slash_command(test_bot, command, member=None, channel=None, **options):
+    """Has a member use a slash command. Attachment options are given as dicts."""
+
+    member = member or test_bot.guilds[0].members[0]
+    channel = channel or test_bot.get_channel(int(os.environ["SUBMISSION_CHANNEL_ID"]))
+
+    data = {'name': command, 'options': [], 'resolved': {'attachments': {}}}
+    for option_name, value in options.items():
+        if isinstance(value, dict):
+            data['resolved']['attachments'][value['id']] = value
+            value = value['id']
+        data['options'].append({'name': option_name, 'value': value})
+
+    await bot.slash.handle(test_bot, {
+        'id': '1',
+        'token': 'token',
+        'application_id': str(test_bot.user.id),
+        'type': 2,
+        'guild_id': str(channel.guild.id),
+        'channel_id': str(channel.id),
+        'member': {'user': {'id': str(member.id)}},
+        'data': data,
+    })
+
+def slash_replies(requests):
+    """The (content, hidden) of each reply in some recorded interaction requests."""
+
+    replies = []
+    for method, path, payload in requests:
+        if path.endswith('/callback'):
+            if payload['type'] == interactions.DEFER:
+                continue
+            payload = payload['data']
+        replies.append((payload['content'], bool(payload.get('flags', 0) & interactions.EPHEMERAL)))
+    return replies
+
+def fake_picture(attachment_id='1'):
+    return {
+        'id': attachment_id,
+        'size': 100,
+        'filename': 'score.png',
+        'url': f'https://cdn.discordapp.com/attachments/{attachment_id}/score.png',
+        'proxy_url': f'https://media.discordapp.net/attachments/{attachment_id}/score.png',
+        'width': 100,
+        'height': 100,
+        'content_type': 'image/png',
+    }
+
+### Query budgets
+# How many queries each command makes, which mustn't grow with the data. Each
+# command runs against a small and a large week of submissions
+# (FIXTURE_SIZES), and has to make the same number of queries both times, no
+# more than its budget. Bump a budget on purpose, never to make a test pass.
+
+# (students, submissions per student)
+FIXTURE_SIZES = [(2, 2), (40, 5)]
+
+def prefix_command(content, **kwargs):
+    async def use(test_bot, member):
+        await dpytest.message(content=content, member=member, **kwargs)
+    return use
+
+def slash_command(command, **options):
+    async def use(test_bot, member):
+        await use_slash_command(test_bot, command, member=member, **options)
+    return use
+
+# (command, whether the week is open, max queries)
+QUERY_BUDGETS = {
+    '!submit': (prefix_command('!submit 1234', attachments=['fake']), True, 10),
+    '!addtwitter': (prefix_command('!addtwitter @someone'), True, 4),
+    '!addname': (prefix_command('!addname ABC'), True, 4),
+    '!newweek': (prefix_command('!newweek next'), False, 5),
+    '!close': (prefix_command('!close'), True, 16),
+    '!reopen': (prefix_command('!reopen'), False, 9),
+    '!leaderboard': (prefix_command('!leaderboard'), False, 2),
+    '!leaderboard 1': (prefix_command('!leaderboard 1'), False, 2),
+    '!stats': (prefix_command('!stats'), True, 2),
+    '!stats 1': (prefix_command('!stats 1'), False, 2),
+    '!rating': (prefix_command('!rating'), False, 3),
+    '/submit': (slash_command('submit', score=1234, picture=fake_picture()), True, 10),
+    '/addtwitter': (slash_command('addtwitter', twitter='@someone'), True, 4),
+    '/addname': (slash_command('addname', ddr_name='ABC'), True, 4),
+    '/newweek': (slash_command('newweek', name='next'), False, 5),
+    '/close': (slash_command('close'), True, 16),
+    '/reopen': (slash_command('reopen'), False, 9),
+    '/leaderboard': (slash_command('leaderboard'), False, 2),
+    '/stats': (slash_command('stats'), False, 2),
+    '/rating': (slash_command('rating'), False, 3),
+}
+
+def make_week(students, per_student, is_open, member_id):
+    """Week 1 (the only week), with every student submitting `per_student` times.
+
+    The first student is the member with `member_id`. A closed week is rated.
+    """
+
+    models.Submission.objects.all().delete()
+    models.Student.objects.all().delete()
+    models.Challenge.objects.all().delete()
+
+    challenge = models.Challenge.objects.create(week=1, name='week1', is_open=is_open)
+    students = models.Student.objects.bulk_create([
+        models.Student(discord_snowflake_id=member_id if i == 0 else 1000 + i, discord_name=f'student#{i}', ddr_name=f'DDR{i}')
+        for i in range(students)
+    ])
+    models.Submission.objects.bulk_create([
+        models.Submission(student=student, challenge=challenge, score=100 * i, pic_url='url')
+        for student in students
+        for i in range(1, per_student + 1)
+    ])
+    stats.refresh_stats([challenge])
+    ratings.update_ratings()
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+@pytest.mark.parametrize('name', QUERY_BUDGETS)
+async def test_command_stays_within_query_budget(test_bot, interaction_requests, queries, tmp_path, monkeypatch, name):
+    # dpytest saves sent files (leaderboards) in the current directory
+    monkeypatch.chdir(tmp_path)
+    use, is_open, budget = QUERY_BUDGETS[name]
+    admin = await make_role_member(test_bot, "Admin")
+
+    counts = []
+    for size in FIXTURE_SIZES:
+        await database_sync_to_async(make_week)(*size, is_open, admin.id)
+        cache.clear()
+        queries.clear()
+
+        await use(test_bot, admin)
+
+        counts.append(len(queries))
+        await dpytest.empty_queue()
+
+    assert len(set(counts)) == 1, f'query count grows with the data: {counts}'
+    assert counts[0] <= budget
@@ -0,0 +1,50 @@
+"""Runs the bot and the admin site (with live leaderboards) in one process.
+
+For small communities, instead of a web and a bot dyno: one copy of django,
+one event loop, one set of caches. See "Running everything in one process"
+in the README.
+"""
+
+# daphne runs twisted on a new asyncio event loop, set up when it's imported,
+# so that has to be the bot's loop too (the bot takes the current loop when
+# it's made, on import)
+import asyncio
+from daphne.server import Server, twisted_loop
+asyncio.set_event_loop(twisted_loop)
+
+import os
+
+from daphne.endpoints import build_endpoint_description_strings
+from twisted.internet import defer, error, reactor
+
+import bot
+from bfa.asgi import application
+
+def main():
+    token = bot.prepare()
+    twisted_loop.create_task(bot.bot.start(token)).add_done_callback(bot_stopped)
+    # log out of discord before the loop stops
+    reactor.addSystemEventTrigger(
+        'before', 'shutdown',
+        lambda: defer.Deferred.fromFuture(twisted_loop.create_task(bot.bot.close())),
+    )
+
+    port = int(os.environ.get('PORT', 8000))
+    print(f'Serving the admin on port {port}')
+    Server(
+        application=application,
+        endpoints=build_endpoint_description_strings(host='0.0.0.0', port=port),
+    ).run()
+
+def bot_stopped(task):
+    # stop the whole process (to be restarted) rather than go on without the bot
+    if not task.cancelled() and task.exception() is not None:
+        print(f'The bot stopped: {task.exception().__class__.__name__}: {task.exception()}')
+    try:
+        reactor.stop()
+    except error.ReactorNotRunning:
+        # it's already stopping
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""Slash commands for discord.py 1.7, which doesn't support them itself.
+
+Interactions come in as raw gateway events, and are answered through
+discord's HTTP API with the bot's own http client.
+"""
+
+import discord
+from discord.ext import commands
+from discord.http import Route
+
+# application command option types
+STRING = 3
+INTEGER = 4
+USER = 6
+ATTACHMENT = 11
+
+# interaction response types
+RESPOND = 4
+DEFER = 5
+
+# message flag for replies only the user who used the command can see
+EPHEMERAL = 1 << 6
+
+def option(name, description, type=STRING, required=True):
+    return {
+        'name': name,
+        'description': description,
+        'type': type,
+        'required': required,
+    }
+
+class SlashCommand:
+    """A slash command. Checks added with discord.py's check decorators
+    (eg. `commands.check`, `commands.has_any_role`) are run before it.
+    """
+
+    def __init__(self, callback, name, description, options):
+        self.callback = callback
+        self.name = name
+        self.description = description
+        self.options = options
+        # check decorators add themselves bottom up, so run them top down
+        # like discord.py does
+        self.checks = list(reversed(getattr(callback, '__commands_checks__', [])))
+
+    def to_json(self):
+        return {
+            'name': self.name,
+            'description': self.description,
+            'options': self.options,
+        }
+
+    async def invoke(self, ctx, **options):
+        for check in self.checks:
+            result = check(ctx)
+            if hasattr(result, '__await__'):
+                result = await result
+            if not result:
+                raise commands.CheckFailure(f'The check functions for /{self.name} failed.')
+
+        await self.callback(ctx, **options)
+
+class SlashContext:
+    """Like discord.py's commands.Context, for a slash command.
+
+    The command has 3 seconds to respond, so anything slow should `defer()`
+    first, which shows "thinking..." until it sends its reply.
+    """
+
+    def __init__(self, bot, interaction):
+        self.bot = bot
+        self.id = interaction['id']
+        self.token = interaction['token']
+        self.application_id = interaction['application_id']
+        self.name = interaction['data']['name']
+        self.data = interaction['data']
+        self.guild = bot.get_guild(int(interaction['guild_id'])) if 'guild_id' in interaction else None
+        self.channel = bot.get_channel(int(interaction['channel_id']))
+
+        state = bot._connection
+        if 'member' in interaction:
+            user_id = int(interaction['member']['user']['id'])
+            self.author = self.guild.get_member(user_id) if self.guild else None
+            if self.author is None:
+                self.author = discord.Member(data=interaction['member'], guild=self.guild, state=state)
+        else:
+            self.author = discord.User(data=interaction['user'], state=state)
+
+        self.deferred = False
+        self.responded = False
+
+    @property
+    def me(self):
+        return self.guild.me if self.guild is not None else self.bot.user
+
+    def get_options(self, command):
+        """The command's options from the interaction, as keyword arguments."""
+
+        types = {opt['name']: opt['type'] for opt in command.options}
+        resolved = self.data.get('resolved', {})
+
+        options = {}
+        for opt in self.data.get('options', []):
+            value = opt['value']
+            if types.get(opt['name']) == ATTACHMENT:
+                value = discord.Attachment(
+                    data=resolved['attachments'][value],
+                    state=self.bot._connection,
+                )
+            elif types.get(opt['name']) == USER:
+                user = resolved['users'][value]
+                if self.guild is not None and value in resolved.get('members', {}):
+                    value = discord.Member(
+                        data={**resolved['members'][value], 'user': user},
+                        guild=self.guild,
+                        state=self.bot._connection,
+                    )
+                else:
+                    value = discord.User(data=user, state=self.bot._connection)
+            options[opt['name']] = value
+        return options
+
+    async def defer(self, hidden=False):
+        await self._callback(DEFER, {'flags': EPHEMERAL} if hidden else {})
+        self.deferred = True
+
+    async def send(self, content, hidden=False):
+        """Replies to the command. `hidden` replies are only shown to its user.
+
+        After a `defer()`, the first reply replaces the "thinking..." message
+        (so it can't be hidden unless the defer was).
+        """
+
+        data = {'content': content, 'allowed_mentions': {'parse': ['users']}}
+        if hidden:
+            data['flags'] = EPHEMERAL
+
+        if not self.deferred and not self.responded:
+            await self._callback(RESPOND, data)
+        elif not self.responded:
+            await self.bot.http.request(Route(
+                'PATCH', '/webhooks/{application_id}/{token}/messages/@original',
+                application_id=self.application_id, token=self.token,
+            ), json=data)
+        else:
+            await self.bot.http.request(Route(
+                'POST', '/webhooks/{application_id}/{token}',
+                application_id=self.application_id, token=self.token,
+            ), json=data)
+        self.responded = True
+
+    async def _callback(self, type, data):
+        await self.bot.http.request(Route(
+            'POST', '/interactions/{id}/{token}/callback',
+            id=self.id, token=self.token,
+        ), json={'type': type, 'data': data})
+
+class SlashCommands:
+    """A bot's slash commands.
+
+    Use `command` to add them, `add_to` to start handling them in a bot, and
+    `sync` (once the bot is connected) to register them with discord.
+    """
+
+    def __init__(self, guild_ids=None):
+        # registered in these guilds only, or globally if there aren't any
+        self.guild_ids = guild_ids or []
+        self.commands = {}
+        self.on_error = None
+        self.after_invoke_hook = None
+
+    def command(self, name, description, options=()):
+        def decorator(func):
+            command = SlashCommand(func, name, description, list(options))
+            self.commands[name] = command
+            return command
+        return decorator
+
+    def error(self, func):
+        """Sets the handler for errors in slash commands (including failed checks)."""
+
+        self.on_error = func
+        return func
+
+    def after_invoke(self, func):
+        """Sets a coroutine to call with the context after each slash command."""
+
+        self.after_invoke_hook = func
+        return func
+
+    def add_to(self, bot):
+        async def on_socket_response(msg):
+            # type 2 is an application command
+            if msg.get('t') == 'INTERACTION_CREATE' and msg['d']['type'] == 2:
+                await self.handle(bot, msg['d'])
+
+        bot.add_listener(on_socket_response)
+
+    async def sync(self, bot):
+        """Registers the commands with discord, replacing any old ones."""
+
+        commands = [command.to_json() for command in self.commands.values()]
+        if self.guild_ids:
+            for guild_id in self.guild_ids:
+                await bot.http.request(Route(
+                    'PUT', '/applications/{application_id}/guilds/{guild_id}/commands',
+                    application_id=bot.user.id, guild_id=guild_id,
+                ), json=commands)
+        else:
+            await bot.http.request(Route(
+                'PUT', '/applications/{application_id}/commands',
+                application_id=bot.user.id,
+            ), json=commands)
+
+    async def handle(self, bot, interaction):
+        command = self.commands.get(interaction['data']['name'])
+        if command is None:
+            return
+
+        ctx = SlashContext(bot, interaction)
+        print(f'received /{ctx.name} cmd: {ctx.data.get("options", [])} from {ctx.author}')
+        try:
+            await command.invoke(ctx, **ctx.get_options(command))
+        except Exception as error:
+            if self.on_error is None:
+                raise
+            await self.on_error(ctx, error)
+        finally:
+            if self.after_invoke_hook is not None:
+                await self.after_invoke_hook(ctx)
@@ -1,9 +1,39 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, PermissionDenied, ValidationError
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Length
 from django.forms import BaseInlineFormSet
-from django.utils.html import format_html
-from django.urls import reverse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.utils.html import format_html, format_html_join
+from django.urls import path, reverse
+from django.utils.text import smart_split, unescape_string_literal
 
-from .models import Student, Challenge, Submission
+from . import caches, leaderboards, reports, stats
+from .models import (
+    Student,
+    Challenge,
+    Compaction,
+    Submission,
+    SubmissionHistory,
+    LevelPlacement,
+    PERCENTILES,
+    RatingChange,
+    best_submissions,
+    submission_activity,
+)
 
 class SubmissionsAdminSite(admin.AdminSite):
     site_header = 'BFA submissions administration'
@@ -26,6 +56,10 @@ class SubmissionInline(admin.TabularInline):
 
     ordering = ['-submitted_at']
 
+    def get_queryset(self, req):
+        # each row shows its student and challenge
+        return super().get_queryset(req).select_related('student', 'challenge')
+
     def has_add_permission(self, req, obj):
         return False
     def has_change_permission(self, req, obj):
@@ -33,29 +67,377 @@ class SubmissionInline(admin.TabularInline):
     def has_delete_permission(self, req, obj):
         return False
 
+class PageDataChangeList(ChangeList):
+    """A changelist that gives its model admin's `add_page_data` the objects
+    on the page, to load extra data for them all at once."""
+
+    def get_results(self, req):
+        super().get_results(req)
+        self.result_list = list(self.result_list)
+        self.model_admin.add_page_data(self.result_list)
+
+# query string parameters for keyset pages: the row a page starts after, or ends before
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+
+class KeysetChangeList(ChangeList):
+    """A changelist that pages by seeking past the rows already shown (keyset
+    pagination) instead of skipping them with OFFSET, so a page deep into the
+    list loads as fast as the first one, given an index on the ordering.
+
+    Pages link to the next and previous ones instead of numbered pages, and
+    the number of rows is the query planner's estimate when there are lots
+    (see `count_rows`), instead of counting them all on every load. Orderings
+    that can't be seeked (eg. by a related model's field, or a nullable
+    column) are paged like usual.
+    """
+
+    def __init__(self, req, *args, **kwargs):
+        self.after = req.GET.get(AFTER_VAR)
+        self.before = req.GET.get(BEFORE_VAR)
+        super().__init__(req, *args, **kwargs)
+        # links to other filters and orderings start from the first page
+        self.params.pop(AFTER_VAR, None)
+        self.params.pop(BEFORE_VAR, None)
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(AFTER_VAR, None)
+        params.pop(BEFORE_VAR, None)
+        return params
+
+    def get_results(self, req):
+        self.keys = self.keyset(self.get_ordering(req, self.queryset))
+        if self.keys is None:
+            self.keyset_paged = False
+            return super().get_results(req)
+        self.keyset_paged = True
+
+        queryset = self.queryset
+        cursor = self.before or self.after
+        if cursor:
+            queryset = queryset.filter(seek(self.keys, self.decode_cursor(cursor), backward=bool(self.before)))
+        if self.before:
+            queryset = queryset.reverse()
+        # one more row than fits, to tell if there's another page
+        rows = list(queryset[:self.list_per_page + 1])
+        more = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+        if self.before:
+            rows.reverse()
+
+        has_previous = bool(self.after) or (bool(self.before) and more)
+        has_next = bool(self.before) or (not self.before and more)
+        self.first_url = self.get_query_string(remove=[AFTER_VAR, BEFORE_VAR]) if cursor else None
+        self.previous_url = self.get_query_string({BEFORE_VAR: self.encode_cursor(rows[0])}, [AFTER_VAR]) if rows and has_previous else None
+        self.next_url = self.get_query_string({AFTER_VAR: self.encode_cursor(rows[-1])}, [BEFORE_VAR]) if rows and has_next else None
+
+        self.result_count, self.result_count_estimated = count_rows(self.queryset)
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = has_previous or has_next
+        self.paginator = None
+
+    def keyset(self, ordering):
+        """The (field, descending) pairs to seek by for an ordering, or None if it can't be seeked."""
+
+        keys = []
+        for name in ordering:
+            if not isinstance(name, str) or LOOKUP_SEP in name or name == '?':
+                return
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            try:
+                field = self.lookup_opts.pk if name == 'pk' else self.lookup_opts.get_field(name)
+            except FieldDoesNotExist:
+                return
+            # (related models' own orderings are what a foreign key orders by)
+            if field.null or (field.is_relation and field.related_model._meta.ordering):
+                return
+            keys.append((field, descending))
+        return keys
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field, _ in self.keys]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.keys):
+                raise ValueError
+            return [field.to_python(value) for (field, _), value in zip(self.keys, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise IncorrectLookupParameters
+
+def seek(keys, values, backward=False):
+    """A filter for the rows after the row with these values (or before it,
+    if `backward`) in the order given by keys, as from KeysetChangeList.keyset.
+    """
+
+    conditions = []
+    equal = {}
+    for (field, descending), value in zip(keys, values):
+        lookup = 'lt' if descending != backward else 'gt'
+        conditions.append(Q(**equal, **{f'{field.attname}__{lookup}': value}))
+        equal[field.attname] = value
+
+    # the same bound on the first column (which the rest only narrow), so
+    # postgres can start scanning the index there
+    field, descending = keys[0]
+    bound = Q(**{f'{field.attname}__{"lte" if descending != backward else "gte"}': values[0]})
+    return bound & reduce(or_, conditions)
+
+def count_rows(queryset):
+    """The number of rows in a queryset, as (count, whether it's an estimate).
+
+    Counting means reading every row, so when the query planner expects at
+    least settings.ESTIMATED_COUNT_THRESHOLD of them, its estimate is used
+    instead. It's based on the table's statistics (kept up to date by
+    autovacuum) and usually within a few percent.
+    """
+
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        # eg. filtered on an empty list
+        return 0, False
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        # (psycopg2 decodes the json)
+        estimate = cursor.fetchone()[0][0]['Plan']['Plan Rows']
+    if estimate >= settings.ESTIMATED_COUNT_THRESHOLD:
+        return estimate, True
+    return queryset.count(), False
+
 class StudentAdmin(admin.ModelAdmin):
     inlines = [SubmissionInline]
 
-    readonly_fields = ('discord_snowflake_id', )
-    list_display = ('discord_name', 'ddr_name', 'twitter', 'level')
+    exclude = ('rating', )
+    readonly_fields = (
+        'discord_snowflake_id', 'submissions', 'weeks', 'latest_submission', 'best_score',
+        'skill_rating', 'rating_history',
+    )
+    list_display = (
+        'discord_name', 'ddr_name', 'twitter', 'level',
+        'submissions', 'weeks', 'latest_submission', 'best_score', 'skill_rating',
+    )
     list_display_links = ('discord_name', 'ddr_name')
     list_filter = ('level', )
     ordering = ('discord_name', )
-    search_fields = ['discord_name', 'ddr_name', 'twitter']
+    search_fields = ['discord_name__fuzzy', 'ddr_name__fuzzy', 'twitter__fuzzy']
+
+    def get_changelist(self, req, **kwargs):
+        return PageDataChangeList
+
+    def add_page_data(self, students):
+        # the page's submission activity, in one query
+        activity = submission_activity([student.id for student in students])
+        for student in students:
+            student.activity = activity.get(student.id, {})
+
+    def get_object(self, req, object_id, from_field=None):
+        student = super().get_object(req, object_id, from_field)
+        if student is not None:
+            student.activity = submission_activity([student.id]).get(student.id, {})
+            student.rating_changes = list(
+                RatingChange.objects.filter(student=student).select_related('challenge').order_by('challenge')
+            )
+        return student
+
+    # submission activity, including archived submissions
+
+    @admin.display(description='submissions')
+    def submissions(self, obj):
+        return getattr(obj, 'activity', {}).get('submissions', 0)
+
+    @admin.display(description='weeks taken part')
+    def weeks(self, obj):
+        return getattr(obj, 'activity', {}).get('weeks', 0)
+
+    @admin.display(description='latest submission')
+    def latest_submission(self, obj):
+        return getattr(obj, 'activity', {}).get('latest')
+
+    @admin.display(description='best score (all time)')
+    def best_score(self, obj):
+        return getattr(obj, 'activity', {}).get('best')
+
+    @admin.display(description='rating', ordering='rating')
+    def skill_rating(self, obj):
+        return round(obj.rating) if obj.rating is not None else None
+
+    @admin.display(description='rating history')
+    def rating_history(self, obj):
+        """A chart of the student's rating after each week they were rated in."""
+
+        changes = getattr(obj, 'rating_changes', [])
+        if not changes:
+            return '-'
+
+        ratings = [change.rating_after for change in changes]
+        low, high = min(ratings), max(ratings)
+        width, height = max(20 * (len(changes) - 1), 1), 60
+        points = [
+            (20 * i, height - (height * (rating - low) / (high - low) if high > low else height / 2))
+            for i, rating in enumerate(ratings)
+        ]
+        return format_html(
+            '<svg width="{}" height="{}" viewBox="-4 -4 {} {}" style="overflow: visible">'
+            '<polyline points="{}" fill="none" stroke="#79aec8" stroke-width="2"/>{}</svg>'
+            '<div>{} to {}</div>',
+            width + 8, height + 8, width + 8, height + 8,
+            ' '.join(f'{x:.0f},{y:.1f}' for x, y in points),
+            format_html_join('', '<circle cx="{}" cy="{}" r="3" fill="#417690"><title>{}</title></circle>', (
+                (f'{x:.0f}', f'{y:.1f}', f'Week {change.challenge.week}: {change.challenge.name} - '
+                                        f'{round(change.rating_after)}, ranked {change.rank} of {change.players}')
+                for (x, y), change in zip(points, changes)
+            )),
+            round(low), round(high),
+        )
 
 class ChallengeAdmin(admin.ModelAdmin):
     ordering = ('-week', )
-    search_fields = ['week', 'name']
-    list_display = ('__str__', 'leaderboard', 'is_open')
+    search_fields = ['week', 'name__fuzzy']
+    list_display = (
+        '__str__', 'leaderboard', 'is_open',
+        'participants', 'submissions', 'top_score', 'median_score',
+    )
+    readonly_fields = ('score_distribution', )
+    actions = ['markdown_report', 'csv_report']
+
+    def get_changelist(self, req, **kwargs):
+        return PageDataChangeList
+
+    def add_page_data(self, challenges):
+        week_stats = stats.challenge_stats(challenges)
+        for challenge in challenges:
+            challenge.stats = week_stats[challenge.week]
+
+    def get_object(self, req, object_id, from_field=None):
+        challenge = super().get_object(req, object_id, from_field)
+        if challenge is not None:
+            challenge.stats = stats.challenge_stats([challenge])[challenge.week]
+        return challenge
+
+    # participation stats, per division (and None for the whole week)
+
+    @admin.display(description='participants')
+    def participants(self, obj):
+        if None not in obj.stats:
+            return 0
+        divisions = ', '.join(
+            f'{level or "?"} {obj.stats[level].participants}'
+            for level in leaderboards.DIVISION_ORDER
+            if level in obj.stats
+        )
+        return f'{obj.stats[None].participants} ({divisions})'
+
+    @admin.display(description='submissions')
+    def submissions(self, obj):
+        return obj.stats[None].submissions if None in obj.stats else 0
+
+    @admin.display(description='top score')
+    def top_score(self, obj):
+        return obj.stats[None].top_score if None in obj.stats else None
+
+    @admin.display(description='median score')
+    def median_score(self, obj):
+        return round(obj.stats[None].median_score) if None in obj.stats else None
+
+    @admin.display(description='score distribution')
+    def score_distribution(self, obj):
+        """A table of each division's best scores: mean, standard deviation, percentiles and a histogram."""
+
+        week_stats = getattr(obj, 'stats', {})
+        if None not in week_stats:
+            return '-'
+
+        rows = [(level, week_stats[level]) for level in leaderboards.DIVISION_ORDER if level in week_stats]
+        rows.append(('total', week_stats[None]))
+        return format_html(
+            '<table><thead><tr><th>division</th><th>participants</th><th>mean</th><th>std dev</th>{}<th>histogram</th></tr></thead>'
+            '<tbody>{}</tbody></table>',
+            format_html_join('', '<th>p{}</th>', ((round(p * 100), ) for p in PERCENTILES)),
+            format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td>{}<td>{}</td></tr>', (
+                (
+                    level or '?',
+                    row.participants,
+                    f'{row.mean_best_score:,.0f}',
+                    f'{row.stddev_best_score:,.0f}',
+                    format_html_join('', '<td>{}</td>', ((f'{score:,.0f}', ) for score in row.percentiles)),
+                    histogram_bars(row.histogram, row.histogram_bounds),
+                )
+                for level, row in rows
+            )),
+        )
+
+    @admin.action(description='Download report for selected weeks (Markdown)')
+    def markdown_report(self, req, queryset):
+        return self.report(queryset, 'markdown', 'text/markdown', 'md')
+
+    @admin.action(description='Download report for selected weeks (CSV)')
+    def csv_report(self, req, queryset):
+        return self.report(queryset, 'csv', 'text/csv', 'csv')
+
+    def report(self, queryset, format, content_type, extension):
+        weeks = sorted(queryset.values_list('week', flat=True))
+        resp = StreamingHttpResponse(reports.report(weeks, format), content_type=content_type)
+        name = f'week{weeks[0]}' if len(weeks) == 1 else f'weeks{weeks[0]}-{weeks[-1]}'
+        resp['Content-Disposition'] = f'attachment; filename="{name}-report.{extension}"'
+        return resp
 
     @admin.display()
     def leaderboard(self, obj):
         r = reverse('admin:submissions_submission_changelist')
         return format_html(
-            '<a href="{}?leaderboard=true&challenge__week__exact={}">Leaderboard</a>',
-            r, obj.week
+            '<a href="{}?leaderboard=true&challenge__week__exact={}">Leaderboard</a> '
+            '(<a href="{}">live</a>)',
+            r, obj.week, reverse('admin:submissions_challenge_live', args=[obj.week]),
         )
 
+    def get_urls(self):
+        return [
+            path(
+                '<int:week>/live/',
+                self.admin_site.admin_view(self.live_leaderboard_view),
+                name='submissions_challenge_live',
+            ),
+        ] + super().get_urls()
+
+    def live_leaderboard_view(self, req, week):
+        """A leaderboard that updates itself as submissions come in (needs the ASGI server)."""
+
+        if not self.has_view_permission(req):
+            raise PermissionDenied
+        return TemplateResponse(req, 'admin/submissions/live_leaderboard.html', {
+            **self.admin_site.each_context(req),
+            'challenge': get_object_or_404(Challenge, week=week),
+            'divisions': [
+                (level, LevelPlacement(level).label) for level in leaderboards.DIVISION_ORDER
+            ],
+        })
+
+def histogram_bars(histogram, bounds):
+    """A small bar chart of a ChallengeStats histogram, with each bar's range and count on hover."""
+
+    tallest = max(histogram) or 1
+    bounds = [*bounds, None]
+    return format_html_join('', (
+        '<span title="{}: {}" style="display: inline-block; width: 8px; height: {}px; '
+        'margin-right: 1px; background: #79aec8; vertical-align: bottom"></span>'
+    ), (
+        (
+            f'{bounds[i]:,}+' if bounds[i + 1] is None else f'{bounds[i]:,}-{bounds[i + 1] - 1:,}',
+            count,
+            1 + round(29 * count / tallest),
+        )
+        for i, count in enumerate(histogram)
+    ))
+
 class TopScoresFilter(admin.SimpleListFilter):
     title = 'Leaderboard View'
     parameter_name = 'leaderboard'
@@ -67,39 +449,156 @@ class TopScoresFilter(admin.SimpleListFilter):
 
     def queryset(self, req, queryset):
         if self.value() == 'true':
-            # this nested for loop is probably gonna get gross if we use this
-            # bot for long enough haha sorryyyy
-            tops=[]
-            for s in Student.objects.all():
-                for c in Challenge.objects.all():
-                    top = s.top_score(c)
-                    if top is not None:
-                        tops.append(top.id)
-            return queryset.filter(id__in=tops)
+            return queryset.filter(id__in=best_submissions().values('id'))
+        else:
+            return queryset
+
+class ChallengeFilter(admin.SimpleListFilter):
+    """Filter by challenge, with (cached) submission counts."""
+
+    title = 'challenge'
+    parameter_name = 'challenge__week__exact'
+
+    def lookups(self, req, model_admin):
+        return [
+            (week, f'Week {week}: {name} ({count})')
+            for week, name, count in caches.submission_facets()['challenge']
+        ]
+
+    def queryset(self, req, queryset):
+        if self.value() is not None:
+            return queryset.filter(challenge=self.value())
+        else:
+            return queryset
+
+class LevelFilter(admin.SimpleListFilter):
+    """Filter by division (at submission time), with (cached) submission counts."""
+
+    title = 'division (at submission time)'
+    parameter_name = 'level__exact'
+
+    def lookups(self, req, model_admin):
+        counts = caches.submission_facets()['level']
+        return [
+            (level, f'{label} ({counts.get(level, 0)})')
+            for level, label in LevelPlacement.choices
+        ]
+
+    def queryset(self, req, queryset):
+        if self.value() is not None:
+            return queryset.filter(level=self.value())
+        else:
+            return queryset
+
+class StudentSearchFilter(admin.SimpleListFilter):
+    """Filter by student name, typed into a search box instead of picked from a list."""
+
+    title = 'student'
+    parameter_name = 'student'
+    template = 'admin/submissions/search_filter.html'
+
+    def lookups(self, req, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, req, queryset):
+        if self.value():
+            students = Student.objects.filter(
+                Q(discord_name__fuzzy=self.value()) | Q(ddr_name__fuzzy=self.value())
+            ).values_list('id', flat=True)
+            return queryset.filter(student__in=list(students))
+        else:
+            return queryset
+
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            'clear_query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'hidden_params': [
+                (key, value) for key, value in changelist.params.items()
+                if key not in (self.parameter_name, PAGE_VAR)
+            ],
+        }
+
+class PictureCheckFilter(admin.SimpleListFilter):
+    title = 'Picture Check'
+    parameter_name = 'picture_check'
+
+    def lookups(self, req, model_admin):
+        return (
+            ('mismatch', "Score doesn't match picture"),
+            ('match', 'Score matches picture'),
+            ('unchecked', 'Not checked'),
+        )
+
+    def queryset(self, req, queryset):
+        if self.value() == 'mismatch':
+            return queryset.filter(ocr_score__isnull=False).exclude(ocr_score=F('score'))
+        elif self.value() == 'match':
+            return queryset.filter(ocr_score=F('score'))
+        elif self.value() == 'unchecked':
+            return queryset.filter(ocr_score__isnull=True)
         else:
             return queryset
 
 class SubmissionAdmin(admin.ModelAdmin):
     autocomplete_fields = ['student', 'challenge']
-    readonly_fields = ('submitted_at', 'submission_picture')
+    readonly_fields = ('submitted_at', 'ocr_score', 'submission_picture')
 
-    list_display = ('challenge', 'score', 'student', 'level', 'submitted_at')
+    list_display = ('challenge', 'score', 'student', 'level', 'submitted_at', 'picture_check')
     list_display_links = ('score', )
     list_filter = (
         TopScoresFilter,
-        ('challenge', admin.RelatedOnlyFieldListFilter),
-        'level',
-        ('student', admin.RelatedOnlyFieldListFilter)
+        ChallengeFilter,
+        LevelFilter,
+        StudentSearchFilter,
+        PictureCheckFilter,
     ) # TODO: maybe also filter by verification
     list_select_related = ('student', 'challenge')
+    # with submission_changelist_idx, for keyset pages (see KeysetChangeList)
     ordering = ('-challenge', 'level', '-score', 'submitted_at', )
+    change_list_template = 'admin/submissions/keyset_change_list.html'
     search_fields = [
-        'student__discord_name',
-        'student__ddr_name',
+        'student__discord_name__fuzzy',
+        'student__ddr_name__fuzzy',
         'challenge__week',
-        'challenge__name'
+        'challenge__name__fuzzy'
     ]
 
+    def get_changelist(self, req, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, req, queryset, search_term):
+        """Looks up matching students and challenges first, then their submissions.
+
+        Searching the student and challenge tables on their own lets postgres use
+        the trigram indexes on them, and the submission foreign key indexes,
+        instead of filtering every submission on the joined columns.
+        """
+
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+
+            students = Q(discord_name__fuzzy=bit) | Q(ddr_name__fuzzy=bit)
+            challenges = Q(name__fuzzy=bit)
+            if bit.isdigit():
+                challenges |= Q(week=bit)
+
+            student_ids = Student.objects.filter(students).values_list('id', flat=True)
+            challenge_ids = Challenge.objects.filter(challenges).values_list('week', flat=True)
+
+            queryset = queryset.filter(
+                Q(student__in=list(student_ids)) | Q(challenge__in=list(challenge_ids))
+            )
+        return queryset, False
+
+    @admin.display(boolean=True, description='matches picture')
+    def picture_check(self, obj):
+        return obj.score_matches_picture
+
     @admin.display()
     def submission_picture(self, obj):
         return format_html(
@@ -109,8 +608,111 @@ class SubmissionAdmin(admin.ModelAdmin):
             obj.pic_url, obj.pic_url
         )
 
+class SubmissionHistoryAdmin(SubmissionAdmin):
+    """All submissions, including archived ones. Read only."""
+
+    list_display = SubmissionAdmin.list_display + ('archived', )
+    list_filter = (
+        TopScoresFilter,
+        ('challenge', admin.RelatedFieldListFilter),
+        'level',
+        StudentSearchFilter,
+        'archived',
+    )
+
+    def get_changelist(self, req, **kwargs):
+        # there's no index to seek with on the view
+        return ChangeList
+
+    def has_add_permission(self, req):
+        return False
+    def has_change_permission(self, req, obj=None):
+        return False
+    def has_delete_permission(self, req, obj=None):
+        return False
+
+class CompactionAdmin(admin.ModelAdmin):
+    """What was compacted when, with downloads of the compacted submissions. Read only."""
+
+    list_display = ('challenge', 'compacted_at', 'submission_count', 'keep_latest', 'size', 'download')
+    list_filter = (('challenge', admin.RelatedFieldListFilter), )
+    list_select_related = ('challenge', )
+    exclude = ('data', )
+    readonly_fields = ('size', 'download')
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='submissions_compaction_download',
+            ),
+        ] + super().get_urls()
+
+    def get_queryset(self, req):
+        # the compacted submissions themselves are only loaded to download them
+        return super().get_queryset(req).annotate(data_size=Length('data')).defer('data')
+
+    def download_view(self, req, pk):
+        if not self.has_view_permission(req):
+            raise PermissionDenied
+        compaction = get_object_or_404(Compaction, pk=pk)
+        resp = HttpResponse(bytes(compaction.data), content_type='application/gzip')
+        name = f'week{compaction.challenge_id}-compaction{compaction.pk}.jsonl.gz'
+        resp['Content-Disposition'] = f'attachment; filename="{name}"'
+        return resp
+
+    @admin.display(description='compressed size')
+    def size(self, obj):
+        return f'{obj.data_size:,} bytes'
+
+    @admin.display()
+    def download(self, obj):
+        return format_html(
+            '<a href="{}">Download</a>',
+            reverse('admin:submissions_compaction_download', args=[obj.pk]),
+        )
+
+    def has_add_permission(self, req):
+        return False
+    def has_change_permission(self, req, obj=None):
+        return False
+    def has_delete_permission(self, req, obj=None):
+        return False
+
+class RatingChangeAdmin(admin.ModelAdmin):
+    """How each closed week changed students' ratings (see ratings.py). Read only."""
+
+    list_display = ('challenge', 'student', 'level', 'rank', 'players', 'before', 'after', 'change')
+    list_filter = (('challenge', admin.RelatedFieldListFilter), 'level')
+    list_select_related = ('challenge', 'student')
+    search_fields = ['student__discord_name__fuzzy', 'student__ddr_name__fuzzy']
+
+    @admin.display(description='rating before', ordering='rating_before')
+    def before(self, obj):
+        return round(obj.rating_before) if obj.rating_before is not None else None
+
+    @admin.display(description='rating after', ordering='rating_after')
+    def after(self, obj):
+        return round(obj.rating_after)
+
+    @admin.display()
+    def change(self, obj):
+        before = obj.rating_before if obj.rating_before is not None else settings.RATING_INITIAL
+        return f'{obj.rating_after - before:+.0f}'
+
+    def has_add_permission(self, req):
+        return False
+    def has_change_permission(self, req, obj=None):
+        return False
+    def has_delete_permission(self, req, obj=None):
+        return False
+
 admin_site = SubmissionsAdminSite()
 
 admin_site.register(Student, StudentAdmin)
 admin_site.register(Challenge, ChallengeAdmin)
 admin_site.register(Submission, SubmissionAdmin)
+admin_site.register(SubmissionHistory, SubmissionHistoryAdmin)
+admin_site.register(Compaction, CompactionAdmin)
+admin_site.register(RatingChange, RatingChangeAdmin)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SubmissionsConfig(AppConfig):
     default_auto_field = 'django.db.models.AutoField'
     name = 'submissions'
+
+    def ready(self):
+        from . import lookups, signals
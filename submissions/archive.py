@@ -0,0 +1,137 @@
+import gzip
+import io
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import caches
+from .bus import SubmissionsChanged, emit
+from .models import ArchivedSubmission, Challenge, Compaction, Submission, SubmissionHistory
+
+COLUMNS = 'id, student_id, challenge_id, score, pic_url, level, submitted_at, ocr_score'
+
+def archivable_weeks(after_days=None):
+    """Closed challenge weeks that were closed at least `after_days` days ago."""
+
+    if after_days is None:
+        after_days = settings.ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=after_days)
+    return Challenge.objects.filter(is_open=False, closed_at__lte=cutoff)
+
+def archive_closed_weeks(after_days=None):
+    """Moves submissions for old closed weeks to the ArchivedSubmission table.
+
+    Each student's best submission for the week stays put (so leaderboards
+    don't need the archive). Everything else is moved over in one statement.
+    Returns the number of submissions archived.
+    """
+
+    weeks = list(archivable_weeks(after_days).values_list('week', flat=True))
+    if not weeks:
+        return 0
+
+    best = Submission.objects.filter(challenge__in=weeks).order_by(
+        'challenge', 'student', '-score', '-id'
+    ).distinct('challenge', 'student').values('id')
+    best_sql, best_params = best.query.sql_with_params()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            WITH moved AS (
+                DELETE FROM {Submission._meta.db_table}
+                WHERE challenge_id = ANY(%s) AND id NOT IN ({best_sql})
+                RETURNING {COLUMNS}
+            )
+            INSERT INTO {ArchivedSubmission._meta.db_table} ({COLUMNS})
+            SELECT {COLUMNS} FROM moved
+            ''',
+            [weeks, *best_params],
+        )
+        archived = cursor.rowcount
+        for week in weeks:
+            emit(SubmissionsChanged(week))
+
+    caches.invalidate_submission_facets()
+    return archived
+
+def compact_closed_weeks(after_days=None, keep_latest=None):
+    """Compacts the submissions for closed weeks, a while after they close.
+
+    For each student and week, only their best submission and their
+    `keep_latest` latest ones are kept (current or archived). The rest are
+    deleted from the database and kept as gzipped JSON lines on a Compaction
+    for the week instead. Returns the Compactions made (weeks with nothing to
+    compact don't get one).
+    """
+
+    if after_days is None:
+        after_days = settings.COMPACT_AFTER_DAYS
+    if keep_latest is None:
+        keep_latest = settings.COMPACT_KEEP_LATEST
+
+    compactions = []
+    for challenge in archivable_weeks(after_days).order_by('week'):
+        compaction = compact_week(challenge, keep_latest)
+        if compaction is not None:
+            compactions.append(compaction)
+
+    if compactions:
+        caches.invalidate_submission_facets()
+    return compactions
+
+def compact_week(challenge, keep_latest):
+    """Compacts one week's submissions (see compact_closed_weeks).
+
+    Returns the Compaction, or None if there was nothing to compact.
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # best_rank breaks ties like best_submissions, so the same one is kept
+        cursor.execute(
+            f'''
+            SELECT {COLUMNS}, archived FROM (
+                SELECT *,
+                    row_number() OVER (
+                        PARTITION BY student_id ORDER BY score DESC, id DESC
+                    ) AS best_rank,
+                    row_number() OVER (
+                        PARTITION BY student_id ORDER BY submitted_at DESC, id DESC
+                    ) AS latest_rank
+                FROM {SubmissionHistory._meta.db_table}
+                WHERE challenge_id = %s
+            ) AS ranked
+            WHERE best_rank > 1 AND latest_rank > %s
+            ORDER BY student_id, submitted_at, id
+            ''',
+            [challenge.week, keep_latest],
+        )
+        names = [column.name for column in cursor.description]
+
+        ids = []
+        data = io.BytesIO()
+        # mtime=0 so compacting the same submissions always gives the same bytes
+        with gzip.GzipFile(fileobj=data, mode='wb', mtime=0) as out:
+            while rows := cursor.fetchmany(1000):
+                for row in rows:
+                    subm = dict(zip(names, row))
+                    ids.append(subm['id'])
+                    out.write(json.dumps(subm, cls=DjangoJSONEncoder).encode() + b'\n')
+
+        if not ids:
+            return
+
+        for model in (Submission, ArchivedSubmission):
+            cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE id = ANY(%s)', [ids])
+        emit(SubmissionsChanged(challenge.week))
+
+        return Compaction.objects.create(
+            challenge=challenge,
+            keep_latest=keep_latest,
+            submission_count=len(ids),
+            data=data.getvalue(),
+        )
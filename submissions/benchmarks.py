@@ -0,0 +1,141 @@
+import math
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+
+from . import fakedata, leaderboards, ratings, stats
+from .admin import admin_site
+from .models import Challenge, Student, Submission, save_scores
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """Adds a benchmark: a function that's timed, given a Setup."""
+
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+class Setup:
+    """Things the benchmarks need from the fake data."""
+
+    def __init__(self):
+        self.factory = RequestFactory()
+        self.user = User(username='benchmark', is_staff=True, is_superuser=True, is_active=True)
+        self.week = Challenge.latest_week()
+        # a busy week in the middle of the season
+        self.middle_week = self.week // 2 or 1
+        self.student = Student.objects.order_by('id').first()
+        self.search = self.student.ddr_name or self.student.discord_name.partition('#')[0]
+        # where the page halfway down the submission changelist starts
+        cl = self.changelist(Submission).context_data['cl']
+        self.middle_page = cl.encode_cursor(cl.queryset[Submission.objects.count() // 2])
+
+    def changelist(self, model, **params):
+        req = self.factory.get('/', params)
+        req.user = self.user
+        return admin_site._registry[model].changelist_view(req).render()
+
+@benchmark('submit')
+def submit(setup):
+    save_scores([{
+        'discord_snowflake_id': setup.student.discord_snowflake_id,
+        'discord_name': setup.student.discord_name,
+        'level': setup.student.level,
+        'score': 999_999,
+        'pic_url': 'https://media.discordapp.net/attachments/1/score.png',
+    }])
+
+@benchmark('leaderboards')
+def leaderboard_data(setup):
+    leaderboards.leaderboards(setup.week)
+
+@benchmark('season score distributions')
+def season_score_distributions(setup):
+    stats.compute_stats(range(1, setup.week + 1))
+
+@benchmark('update ratings')
+def update_ratings(setup):
+    # rating the last closed week again, as closing it does (the warm up run
+    # rates the ones before it)
+    ratings.unrate_from(setup.week - 1)
+    ratings.update_ratings()
+
+@benchmark('leaderboard filter')
+def leaderboard_filter(setup):
+    cache.clear()
+    setup.changelist(Submission, leaderboard='true', challenge__week__exact=setup.middle_week)
+
+@benchmark('submission changelist')
+def submission_changelist(setup):
+    cache.clear()
+    setup.changelist(Submission)
+
+@benchmark('submission changelist, middle page')
+def submission_changelist_middle_page(setup):
+    cache.clear()
+    setup.changelist(Submission, after=setup.middle_page)
+
+@benchmark('student changelist')
+def student_changelist(setup):
+    setup.changelist(Student)
+
+@benchmark('submission search')
+def submission_search(setup):
+    cache.clear()
+    setup.changelist(Submission, q=setup.search)
+
+@benchmark('student search')
+def student_search(setup):
+    setup.changelist(Student, q=setup.search)
+
+def time_it(func, setup, repeat):
+    """The median time (in seconds) of running `func` `repeat` times, after a warm up run."""
+
+    func(setup)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(setup)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+# the admin pages are rendered directly (without collectstatic or the replica)
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+def run(sizes, weeks, repeat=5, seed=0, log=print):
+    """Times each benchmark with fake data for each number of students in `sizes`.
+
+    The fake data is made in a transaction that's rolled back afterwards
+    (along with everything the benchmarks did), so the database is left as
+    it was. Returns {benchmark name: [seconds for each size]}.
+    """
+
+    results = {name: [] for name in BENCHMARKS}
+    for size in sizes:
+        with transaction.atomic():
+            fakedata.clear()
+            fakedata.generate(size, weeks, seed=seed, log=lambda msg: None)
+            setup = Setup()
+            log(f'{size} students, {Submission.objects.count()} submissions')
+
+            for name, func in BENCHMARKS.items():
+                results[name].append(time_it(func, setup, repeat))
+
+            transaction.set_rollback(True)
+    cache.clear()
+    return results
+
+def scaling(sizes, times):
+    """Roughly how a benchmark's time grows with the data: k in O(n^k).
+
+    0 means it doesn't grow, 1 that it grows in proportion.
+    """
+
+    if len(sizes) < 2 or min(times) <= 0:
+        return
+    return math.log(times[-1] / times[0]) / math.log(sizes[-1] / sizes[0])
@@ -0,0 +1,152 @@
+"""Events between processes (the bot and the web), over postgres' LISTEN/NOTIFY.
+
+Model changes `emit` typed events, which go out when their transaction
+commits. Each process runs a listener that hands them to whatever
+`subscribe`d to them, mostly to clear caches the change made stale, so
+caches can be kept for a long time in every process.
+"""
+
+import asyncio
+import json
+import select
+import threading
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+import psycopg2
+from django.db import connection, connections
+
+NOTIFY_CHANNEL = 'bfa_events'
+
+class ChallengeChanged(NamedTuple):
+    """A challenge week was added, changed (eg. opened or closed) or deleted."""
+
+    week: int
+
+class SubmissionAdded(NamedTuple):
+    week: int
+    student: int
+    # the student's name to show on leaderboards
+    name: str
+    level: str
+    score: int
+
+class SubmissionsChanged(NamedTuple):
+    """A week's submissions were changed or deleted (or archived, or compacted)."""
+
+    week: Optional[int]
+
+EVENTS = {event.__name__: event for event in (ChallengeChanged, SubmissionAdded, SubmissionsChanged)}
+
+# a fake event for when the listener (re)connects, after which anything that
+# happened while it wasn't listening should be assumed to have changed
+class Reconnected(NamedTuple):
+    pass
+
+def emit(event):
+    """Sends an event to every process (including this one) once the current transaction commits."""
+
+    payload = json.dumps({'type': type(event).__name__, **event._asdict()})
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, payload])
+
+class Bus:
+    """Runs handlers for events from any process.
+
+    Listens in a background thread, on its own database connection. Handlers
+    run in that thread, except coroutine handlers subscribed with a `loop`,
+    which are run in that event loop.
+    """
+
+    def __init__(self, retry_delay=5):
+        self.retry_delay = retry_delay
+        self._handlers = defaultdict(list)
+        self._thread = None
+        self._stopping = threading.Event()
+        self._listening = threading.Event()
+
+    def subscribe(self, event_type, handler, loop=None):
+        self._handlers[event_type].append((handler, loop))
+
+    def unsubscribe(self, event_type, handler):
+        self._handlers[event_type] = [
+            (other, loop) for other, loop in self._handlers[event_type] if other is not handler
+        ]
+
+    def start(self):
+        """Starts listening in the background (if it isn't already)."""
+
+        if self._thread is not None:
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name='event bus', daemon=True)
+        self._thread.start()
+
+    def wait_until_listening(self, timeout=None):
+        return self._listening.wait(timeout)
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def deliver(self, payload):
+        try:
+            data = json.loads(payload)
+            event_type = EVENTS.get(data.pop('type'))
+            if event_type is None:
+                # from a newer version of the code
+                return
+            event = event_type(**data)
+        except Exception as error:
+            # (or from a different one, with other fields)
+            print(f"Couldn't read event {payload!r}: {error.__class__.__name__}: {error}")
+            return
+        self.handle(event)
+
+    def handle(self, event):
+        for handler, loop in self._handlers[type(event)]:
+            try:
+                if loop is not None:
+                    asyncio.run_coroutine_threadsafe(handler(event), loop)
+                else:
+                    handler(event)
+            except Exception as error:
+                print(f'Error handling {event}: {error.__class__.__name__}: {error}')
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**connections['default'].get_connection_params())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+                self._listening.set()
+                self.handle(Reconnected())
+
+                while not self._stopping.is_set():
+                    # wake up every so often to check if it's stopping
+                    if select.select([conn], [], [], 1) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.deliver(conn.notifies.pop(0).payload)
+            except psycopg2.Error as error:
+                print(f'Lost the event bus connection, reconnecting in {self.retry_delay}s: {error}')
+                self._stopping.wait(self.retry_delay)
+            except Exception as error:
+                # keep listening whatever went wrong, or every process's
+                # caches would quietly go stale
+                print(f'Event bus error, restarting in {self.retry_delay}s: {error.__class__.__name__}: {error}')
+                self._stopping.wait(self.retry_delay)
+            finally:
+                self._listening.clear()
+                if conn is not None:
+                    conn.close()
+
+bus = Bus()
@@ -0,0 +1,79 @@
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+
+from .models import Challenge, Submission, best_submissions
+
+SUBMISSION_FACETS_KEY = 'submission_facets'
+CURRENT_CHALLENGE_KEY = 'current_challenge'
+
+_missing = object()
+
+def submission_facets():
+    """Counts submissions per challenge and per division, for the admin filters.
+
+    Returns a dict like:
+        {'challenge': [(week, name, count), ...], 'level': {level: count}}
+
+    The counts are cached until a submission (or challenge) is saved or deleted.
+    """
+
+    facets = cache.get(SUBMISSION_FACETS_KEY)
+    if facets is None:
+        subms = Submission.objects.order_by()
+        facets = {
+            'challenge': list(
+                subms.values_list('challenge', 'challenge__name')
+                .annotate(Count('id'))
+                .order_by('-challenge')
+            ),
+            'level': dict(subms.values_list('level').annotate(Count('id'))),
+        }
+        cache.set(SUBMISSION_FACETS_KEY, facets, settings.FACET_CACHE_TIMEOUT)
+    return facets
+
+def invalidate_submission_facets():
+    cache.delete(SUBMISSION_FACETS_KEY)
+
+def current_challenge():
+    """The latest challenge, or None if there aren't any.
+
+    Cached until a challenge is saved or deleted, since the bot checks it for
+    every submission.
+    """
+
+    return cache.get_or_set(
+        CURRENT_CHALLENGE_KEY,
+        lambda: Challenge.objects.order_by('-week').first(),
+        settings.CURRENT_CHALLENGE_CACHE_TIMEOUT,
+    )
+
+async def async_current_challenge():
+    # only go to the database thread if it isn't cached
+    challenge = cache.get(CURRENT_CHALLENGE_KEY, _missing)
+    if challenge is _missing:
+        challenge = await database_sync_to_async(current_challenge)()
+    return challenge
+
+def invalidate_current_challenge():
+    cache.delete(CURRENT_CHALLENGE_KEY)
+
+@database_sync_to_async
+def async_warm_up():
+    return warm_up()
+
+def warm_up():
+    """Connects to the database and loads what the bot's first commands need.
+
+    Returns the current challenge.
+    """
+
+    connection.ensure_connection()
+    challenge = current_challenge()
+    if challenge is not None:
+        # the first upscores (see Student.save_score) look up this week's
+        # best scores, so get those into postgres' memory
+        list(best_submissions().filter(challenge=challenge).values_list('score', flat=True))
+    return challenge
@@ -0,0 +1,86 @@
+"""Memory numbers for a long-running process, for the bot's !diagnostics.
+
+Allocation sites come from tracemalloc, which is off unless started (with
+`start_tracing`, or PYTHONTRACEMALLOC=1 from startup), since tracing slows
+everything down and takes memory of its own.
+"""
+
+import linecache
+import os
+import resource
+import sys
+import tracemalloc
+
+from django.core.cache import cache
+
+# what allocations are compared to, from when tracing started
+_baseline = None
+
+def rss():
+    """The process' resident memory (in bytes), or None where /proc isn't available."""
+
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return
+
+def peak_rss():
+    """The most resident memory the process has used (in bytes)."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on macos
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def start_tracing(frames=1):
+    """Starts tracing allocations (or restarts), counting growth from now."""
+
+    global _baseline
+    tracemalloc.stop()
+    tracemalloc.start(frames)
+    _baseline = tracemalloc.take_snapshot()
+
+def stop_tracing():
+    global _baseline
+    tracemalloc.stop()
+    _baseline = None
+
+def top_allocations(limit=10):
+    """The allocation sites holding the most memory, as [(site, bytes, bytes grown), ...].
+
+    Growth is since tracing started with `start_tracing` (or the bytes held,
+    when it was started some other way). Empty when tracing is off.
+    """
+
+    if not tracemalloc.is_tracing():
+        return []
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        # its own bookkeeping
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, linecache.__file__),
+    ])
+    if _baseline is not None:
+        stats = snapshot.compare_to(_baseline, 'lineno')
+        stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+        sites = [(stat.traceback[0], stat.size, stat.size_diff) for stat in stats]
+    else:
+        sites = [(stat.traceback[0], stat.size, stat.size) for stat in snapshot.statistics('lineno')]
+    return [(f'{short_path(frame.filename)}:{frame.lineno}', size, grown) for frame, size, grown in sites[:limit]]
+
+def short_path(filename):
+    """A file's path relative to where it was imported from (eg. site-packages)."""
+
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + os.sep):
+            return filename[len(path) + 1:]
+    return filename
+
+def cache_size():
+    """The number of entries in django's cache and their size in bytes, or None if it isn't in memory."""
+
+    # LocMemCache keeps pickled values in a dict
+    entries = getattr(cache, '_cache', None)
+    if entries is None:
+        return
+    return len(entries), sum(len(value) for value in list(entries.values()))
@@ -0,0 +1,153 @@
+import random
+import string
+from datetime import timedelta
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import caches
+from .bus import ChallengeChanged, emit
+from .models import (
+    ArchivedSubmission,
+    Challenge,
+    Compaction,
+    LevelPlacement,
+    Student,
+    Submission,
+)
+
+SONGS = [
+    'PARANOiA', 'MAX 300', 'Healing-D-Vision', 'CHAOS', 'Fascination MAXX',
+    'Valkyrie dimension', 'ENDYMION', 'Over The "Period"', 'Pluto Relinquish',
+    'PARANOiA Revolution', 'Tohoku EVOLVED', 'EGOISM 440', 'Lachryma《Re:Queen\'M》',
+    'ACE FOR ACES', 'Emera', 'DEATH†ZIGOKU', 'MAX.(period)', 'Trip Machine Survivor',
+    'Xepher', 'Sky High',
+]
+
+# how many students are in each division
+LEVEL_WEIGHTS = {
+    LevelPlacement.JUNIOR_VARSITY: 15,
+    LevelPlacement.FRESHMAN: 35,
+    LevelPlacement.VARSITY: 30,
+    LevelPlacement.GRADUATE: 15,
+    LevelPlacement.UNKNOWN: 5,
+}
+
+# first fake discord id, well past any real account's
+SNOWFLAKE_BASE = 9 * 10 ** 17
+
+def clear():
+    """Deletes all students, challenges and submissions (and compactions)."""
+
+    with transaction.atomic():
+        for model in (Compaction, ArchivedSubmission, Submission, Student, Challenge):
+            model.objects.all().delete()
+    caches.invalidate_submission_facets()
+    caches.invalidate_current_challenge()
+
+def generate(students, weeks, seed=None, batch_size=5000, log=print):
+    """Fills an empty database with fake students, challenge weeks and submissions.
+
+    Students' activity is skewed like the real thing: most submit once in a
+    while, a few nearly every week and many times. All weeks but the last are
+    closed, a week apart. Rows are added with bulk inserts, `batch_size` at a
+    time. Returns the number of submissions made.
+    """
+
+    if Challenge.objects.exists() or Student.objects.exists():
+        raise ValueError('The database already has students or challenges.')
+
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    challenges = Challenge.objects.bulk_create(
+        Challenge(
+            week=week,
+            name=rng.choice(SONGS),
+            is_open=week == weeks,
+            closed_at=None if week == weeks else now - timedelta(weeks=weeks - week),
+        )
+        for week in range(1, weeks + 1)
+    )
+
+    made = []
+    for batch in batches(fake_students(rng, students), batch_size):
+        made += Student.objects.bulk_create(batch)
+    log(f'Made {weeks} weeks and {len(made)} students')
+
+    # (student, chance of submitting in a week, average submissions in a week)
+    activity = []
+    for student in made:
+        # pareto: the 80/20 rule
+        weight = min(rng.paretovariate(1.16), 40)
+        activity.append((student, min(0.05 * weight, 0.95), weight / 4))
+
+    total = 0
+    for challenge in challenges:
+        subms = fake_submissions(rng, challenge, activity)
+        for batch in batches(subms, batch_size):
+            total += len(Submission.objects.bulk_create(batch))
+        spread_submission_times(challenge, now)
+        log(f'Week {challenge.week}: {total} submissions so far')
+
+    # bulk inserts don't send the signals that would tell the other processes
+    for challenge in challenges:
+        emit(ChallengeChanged(challenge.week))
+    caches.invalidate_submission_facets()
+    caches.invalidate_current_challenge()
+    return total
+
+def fake_students(rng, count):
+    levels, weights = zip(*LEVEL_WEIGHTS.items())
+    for i in range(count):
+        name = ''.join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 8)))
+        yield Student(
+            discord_snowflake_id=SNOWFLAKE_BASE + i,
+            discord_name=f'{name.lower()}{i}#{rng.randint(1000, 9999)}',
+            ddr_name=name if rng.random() < 0.8 else '',
+            twitter=f'{name.lower()}_ddr' if rng.random() < 0.3 else '',
+            level=rng.choices(levels, weights)[0],
+        )
+
+def fake_submissions(rng, challenge, activity):
+    for student, chance, average in activity:
+        if rng.random() >= chance:
+            continue
+        count = min(1 + int(rng.expovariate(1 / average)), 30)
+        score = rng.randint(500_000, 900_000)
+        for _ in range(count):
+            score = min(score + rng.randint(-20_000, 40_000), 1_000_000)
+            yield Submission(
+                student=student,
+                challenge=challenge,
+                score=score,
+                pic_url=f'https://media.discordapp.net/attachments/{rng.getrandbits(60)}/score.png',
+                level=student.level,
+            )
+
+def spread_submission_times(challenge, now):
+    """Spreads a week's submissions over the week, in the order they were made.
+
+    (bulk inserts set them all to now.)
+    """
+
+    end = challenge.closed_at or now
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            UPDATE {Submission._meta.db_table} AS subm
+            SET submitted_at = %s + (ordered.n * %s / ordered.total) * interval '1 second'
+            FROM (
+                SELECT id, row_number() OVER (ORDER BY id) AS n, count(*) OVER () AS total
+                FROM {Submission._meta.db_table} WHERE challenge_id = %s
+            ) AS ordered
+            WHERE subm.id = ordered.id
+            ''',
+            [end - timedelta(weeks=1), timedelta(weeks=1).total_seconds(), challenge.week],
+        )
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import LevelPlacement, best_submissions
+
+# highest division first
+DIVISION_ORDER = [
+    LevelPlacement.GRADUATE,
+    LevelPlacement.VARSITY,
+    LevelPlacement.FRESHMAN,
+    LevelPlacement.JUNIOR_VARSITY,
+    LevelPlacement.UNKNOWN,
+]
+
+def leaderboards(week):
+    """Each division's leaderboard for a week, from students' best submissions.
+
+    Returns a list of (division, [(rank, name, score), ...]) for the divisions
+    (at submission time) that have any submissions, highest division first.
+    Tied scores share a rank.
+    """
+
+    subms = (
+        best_submissions()
+        .filter(challenge=week)
+        .values_list('level', 'student__ddr_name', 'student__discord_name', 'score')
+    )
+
+    boards = {}
+    for level, ddr_name, discord_name, score in subms:
+        boards.setdefault(level, []).append((ddr_name or discord_name or '(no name)', score))
+
+    result = []
+    for level in DIVISION_ORDER:
+        if level not in boards:
+            continue
+        rows = []
+        for i, (name, score) in enumerate(sorted(boards[level], key=lambda row: -row[1])):
+            rank = rows[-1][0] if rows and rows[-1][2] == score else i + 1
+            rows.append((rank, name, score))
+        result.append((level, rows))
+    return result
+
+def data_version(data):
+    """A short hash of some (JSON-able) data, which changes whenever it does."""
+
+    return hashlib.sha1(json.dumps(data).encode()).hexdigest()[:12]
+
+def draw_right_aligned(draw, xy, text, font):
+    """Draws text with its top right corner at xy."""
+
+    from PIL import ImageFont
+
+    x, y = xy
+    if isinstance(font, ImageFont.FreeTypeFont):
+        draw.text((x, y), text, fill='black', font=font, anchor='ra')
+    else:
+        # the bitmap fallback font ignores anchors
+        text_width, _ = font.getmask(text).size
+        draw.text((x - text_width, y), text, fill='black', font=font)
+
+def render_leaderboard(title, rows):
+    """Draws a leaderboard as a PNG image. Returns the image's bytes.
+
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+
+    # imported here so the admin doesn't need Pillow
+    from PIL import Image, ImageDraw, ImageFont
+
+    try:
+        font = ImageFont.truetype('DejaVuSans.ttf', 20)
+        title_font = ImageFont.truetype('DejaVuSans-Bold.ttf', 26)
+    except OSError:
+        font = title_font = ImageFont.load_default()
+
+    width, row_height, margin = 600, 32, 24
+    image = Image.new('RGB', (width, margin * 2 + row_height * (len(rows) + 2)), 'white')
+    draw = ImageDraw.Draw(image)
+
+    draw.text((margin, margin), title, fill='black', font=title_font)
+    y = margin + row_height * 2
+    for rank, name, score in rows:
+        draw.text((margin, y), f'{rank}.', fill='gray', font=font)
+        draw.text((margin + 60, y), name, fill='black', font=font)
+        draw_right_aligned(draw, (width - margin, y), f'{score:,}', font)
+        y += row_height
+
+    out = io.BytesIO()
+    image.save(out, format='PNG')
+    return out.getvalue()
+
+class LeaderboardRenderer:
+    """Renders leaderboard images in a pool of worker processes.
+
+    Images are cached by week and data version (see data_version), so
+    rendering a week again only redraws divisions whose leaderboards changed.
+    """
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self._pool = None
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        self._pool = None
+
+    async def render(self, challenge):
+        """Returns [(division, png bytes), ...] for a challenge's leaderboards."""
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        loop = asyncio.get_running_loop()
+        boards = await database_sync_to_async(leaderboards)(challenge.week)
+
+        images = []
+        for level, rows in boards:
+            title = f'Week {challenge.week}: {challenge.name} - {LevelPlacement(level).label}'
+            key = f'leaderboard_image:{challenge.week}:{level}:{data_version([title, rows])}'
+            image = cache.get(key)
+            if image is None:
+                image = await loop.run_in_executor(self._pool, render_leaderboard, title, rows)
+                cache.set(key, image, settings.LEADERBOARD_IMAGE_CACHE_TIMEOUT)
+            images.append((level, image))
+        return images
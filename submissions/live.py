@@ -0,0 +1,74 @@
+"""Live leaderboards, pushed to the admin over websockets.
+
+New submissions come in on the event bus (from whichever process saved them,
+usually the bot), and each is forwarded to the websockets watching its week,
+so viewers get just the new score instead of reloading the whole leaderboard.
+"""
+
+import asyncio
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+
+from .bus import SubmissionAdded, bus
+from .models import best_submissions
+
+def group_name(week):
+    return f'leaderboard_{week}'
+
+def board(week):
+    """Each student's best score for a week, for a live leaderboard to start from."""
+
+    return [
+        {'student': student, 'name': ddr_name or discord_name or '(no name)', 'level': level, 'score': score}
+        for student, ddr_name, discord_name, level, score in (
+            best_submissions()
+            .filter(challenge=week)
+            .values_list('student', 'student__ddr_name', 'student__discord_name', 'level', 'score')
+        )
+    ]
+
+_loop = None
+
+def listen():
+    """Starts forwarding new submissions to the live leaderboards in this event loop."""
+
+    global _loop
+    loop = asyncio.get_running_loop()
+    if _loop is not loop:
+        bus.unsubscribe(SubmissionAdded, dispatch)
+        bus.subscribe(SubmissionAdded, dispatch, loop)
+        _loop = loop
+    bus.start()
+
+async def dispatch(event):
+    await get_channel_layer().group_send(group_name(event.week), {'type': 'score', **event._asdict()})
+
+class LeaderboardConsumer(AsyncJsonWebsocketConsumer):
+    """A live leaderboard for a week, for staff.
+
+    Sends {'type': 'board', 'rows': [...]} (see `board`) when it connects,
+    then {'type': 'score', ...} for each new submission (see bus.SubmissionAdded).
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_staff:
+            await self.close()
+            return
+
+        self.group = group_name(self.scope['url_route']['kwargs']['week'])
+        listen()
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+        rows = await database_sync_to_async(board)(self.scope['url_route']['kwargs']['week'])
+        await self.send_json({'type': 'board', 'rows': rows})
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group'):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def score(self, event):
+        await self.send_json(event)
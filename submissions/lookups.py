@@ -0,0 +1,24 @@
+from django.db.models import CharField, TextField
+from django.db.models.lookups import PostgresOperatorLookup
+
+
+@CharField.register_lookup
+@TextField.register_lookup
+class Fuzzy(PostgresOperatorLookup):
+    """Case-insensitive "contains" that also matches approximately.
+
+    `ddr_name__fuzzy='KEKSTER'` matches KEEKSTER, as well as anything that has
+    KEKSTER in it. Unlike `icontains` this compares the bare column, so both
+    halves can use a pg_trgm (gin_trgm_ops) index on it.
+    """
+
+    lookup_name = 'fuzzy'
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        pattern = '%%%s%%' % connection.ops.prep_for_like_query(rhs_params[0])
+
+        sql = f'({lhs} ILIKE %s OR {lhs} %%> {rhs})'
+        params = (*lhs_params, pattern, *lhs_params, *rhs_params)
+        return sql, params
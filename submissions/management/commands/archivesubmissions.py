@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from submissions.archive import archive_closed_weeks, archivable_weeks
+
+class Command(BaseCommand):
+    help = (
+        "Moves submissions for old closed challenge weeks to the archive, "
+        "except each student's best submission."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.ARCHIVE_AFTER_DAYS,
+            help='only archive weeks closed at least this many days ago (default: %(default)s)',
+        )
+
+    def handle(self, *args, days, **options):
+        weeks = ', '.join(str(c.week) for c in archivable_weeks(days)) or 'none'
+        archived = archive_closed_weeks(days)
+        self.stdout.write(f'Archived {archived} submissions (weeks: {weeks})')
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from submissions import benchmarks
+
+class Command(BaseCommand):
+    help = (
+        "Times the submit path, leaderboards, admin changelists and search with "
+        "fake data of several sizes, and shows how each one scales. Run it "
+        "against a local database: the fake data is rolled back afterwards, "
+        "but everything else is locked while it runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='500,2000,8000',
+            help='numbers of students to try, comma separated (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--weeks',
+            type=int,
+            default=20,
+            help='(default: %(default)s)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='times to run each benchmark at each size; the median is shown (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='random seed for the fake data (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--max-scaling',
+            type=float,
+            help='fail if any benchmark scales worse than O(n^this), eg. 0.5',
+        )
+        parser.add_argument(
+            '--output',
+            help='also write the results to this file, as JSON',
+        )
+
+    def handle(self, *args, sizes, weeks, repeat, seed, max_scaling, output, **options):
+        try:
+            sizes = sorted(int(size) for size in sizes.split(','))
+        except ValueError:
+            raise CommandError(f'"{sizes}" should be numbers of students, eg. 500,2000,8000')
+
+        results = benchmarks.run(sizes, weeks, repeat, seed, log=self.stderr.write)
+
+        width = max(map(len, results))
+        self.stdout.write(
+            'benchmark'.ljust(width)
+            + ''.join(f'{size:>12,}' for size in sizes)
+            + '  scaling'
+        )
+        too_slow = []
+        for name, times in results.items():
+            k = benchmarks.scaling(sizes, times)
+            self.stdout.write(
+                name.ljust(width)
+                + ''.join(f'{t * 1000:>10.1f}ms' for t in times)
+                + ('' if k is None else f'  O(n^{k:.2f})')
+            )
+            if max_scaling is not None and k is not None and k > max_scaling:
+                too_slow.append(name)
+
+        if output:
+            with open(output, 'w') as out:
+                json.dump({'sizes': sizes, 'weeks': weeks, 'results': results}, out, indent=2)
+
+        if too_slow:
+            raise CommandError(f'Scales worse than O(n^{max_scaling}): {", ".join(too_slow)}')
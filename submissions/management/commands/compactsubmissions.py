@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from submissions.archive import compact_closed_weeks
+
+class Command(BaseCommand):
+    help = (
+        "Compacts submissions for old closed challenge weeks down to each "
+        "student's best and latest submissions. The rest are kept compressed "
+        "in the Compactions admin page."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.COMPACT_AFTER_DAYS,
+            help='only compact weeks closed at least this many days ago (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=settings.COMPACT_KEEP_LATEST,
+            help="how many of each student's latest submissions to keep, besides their best (default: %(default)s)",
+        )
+
+    def handle(self, *args, days, keep, **options):
+        compactions = compact_closed_weeks(days, keep)
+        for compaction in compactions:
+            self.stdout.write(
+                f'Week {compaction.challenge_id}: compacted {compaction.submission_count} submissions '
+                f'({len(compaction.data):,} bytes)'
+            )
+        if not compactions:
+            self.stdout.write('Nothing to compact')
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from submissions import fakedata
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with fake students, challenge weeks and submissions, "
+        "to try things out at production scale. Only for local databases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--students',
+            type=int,
+            default=5000,
+            help='(default: %(default)s)',
+        )
+        parser.add_argument(
+            '--weeks',
+            type=int,
+            default=20,
+            help='(default: %(default)s)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='random seed, to make the same data again',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='rows per insert (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='delete all students, challenges and submissions first',
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false',
+            dest='interactive',
+            help="don't ask before deleting everything with --clear",
+        )
+
+    def handle(self, *args, students, weeks, seed, batch_size, clear, interactive, **options):
+        if clear:
+            if interactive:
+                confirm = input(
+                    'This deletes ALL students, challenges and submissions. '
+                    "Type 'yes' to continue: "
+                )
+                if confirm != 'yes':
+                    raise CommandError('Cancelled.')
+            fakedata.clear()
+
+        try:
+            total = fakedata.generate(students, weeks, seed, batch_size, log=self.stdout.write)
+        except ValueError as error:
+            raise CommandError(f'{error} Use --clear to start over.')
+        self.stdout.write(f'Made {total} submissions')
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from submissions import traces
+
+class Command(BaseCommand):
+    help = (
+        "Replays a trace of the bot's commands (recorded with BOT_TRACE_PATH) "
+        "through the bot, against a new, empty test database, and shows each "
+        "command's latency percentiles and queries. The database is created "
+        "like the tests' (test_<name>) and dropped afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('trace', help='the trace file (JSON Lines)')
+        parser.add_argument(
+            '--speed',
+            type=float,
+            default=1.0,
+            help='how many times faster than recorded to send commands, or 0 to send each once the last is done (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--max-gap',
+            type=float,
+            default=60.0,
+            help='longest pause (in recorded seconds) between commands; longer ones are shortened (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--no-week',
+            action='store_true',
+            help="don't start with an open week (for traces that start with !newweek)",
+        )
+        parser.add_argument(
+            '--output',
+            help='also write the results to this file, as JSON',
+        )
+
+    def handle(self, *args, trace, speed, max_gap, no_week, output, **options):
+        if speed < 0:
+            raise CommandError('--speed must be 0 or more')
+        try:
+            events = traces.read_trace(trace)
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Couldn't read {trace}: {error}")
+        if not events:
+            raise CommandError(f'{trace} has no commands')
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            replayed = asyncio.run(traces.replay(
+                events, speed=speed, max_gap=max_gap, open_week=not no_week, log=self.stderr.write,
+            ))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        summary = traces.summarize(replayed)
+        width = max(map(len, summary))
+        self.stdout.write(
+            'command'.ljust(width)
+            + f'{"count":>8}{"p50":>10}{"p90":>10}{"p99":>10}{"max":>10}{"queries":>9}{"max":>5}{"errors":>8}'
+        )
+        for command, row in summary.items():
+            self.stdout.write(
+                command.ljust(width)
+                + f'{row["count"]:>8}'
+                + ''.join(f'{row[p] * 1000:>8.1f}ms' for p in ('p50', 'p90', 'p99', 'max'))
+                + f'{row["mean_queries"]:>9.1f}{row["max_queries"]:>5}{row["errors"]:>8}'
+            )
+
+        if output:
+            with open(output, 'w') as out:
+                json.dump({'trace': trace, 'speed': speed, 'results': summary}, out, indent=2)
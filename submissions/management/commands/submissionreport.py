@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from submissions.models import Challenge
+from submissions.reports import FORMATS, report
+
+class Command(BaseCommand):
+    help = (
+        "Writes a digest of a challenge week, or a season of weeks: participation "
+        "per division, new students, repeat submitters and the biggest upscores."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'weeks',
+            nargs='?',
+            help='a week (eg. 12) or a range of weeks (eg. 1-12). Defaults to the latest week.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default='markdown',
+            help='(default: %(default)s)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='how many of the biggest upscores to list (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--output',
+            help='file to write the report to (default: stdout)',
+        )
+
+    def handle(self, *args, weeks, format, top, output, **options):
+        weeks = self.parse_weeks(weeks)
+
+        if output:
+            with open(output, 'w', newline='') as out:
+                for text in report(weeks, format, top):
+                    out.write(text)
+            self.stderr.write(f'Wrote report to {output}')
+        else:
+            for text in report(weeks, format, top):
+                self.stdout.write(text, ending='')
+
+    def parse_weeks(self, weeks):
+        if weeks is None:
+            latest = Challenge.latest_week()
+            if latest is None:
+                raise CommandError('There are no challenge weeks yet.')
+            return [latest]
+
+        try:
+            first, _, last = weeks.partition('-')
+            return list(range(int(first), int(last or first) + 1))
+        except ValueError:
+            raise CommandError(f'"{weeks}" is not a week or range of weeks (eg. 12 or 1-12).')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from submissions.ratings import rebuild_ratings, update_ratings
+
+class Command(BaseCommand):
+    help = (
+        "Updates students' skill ratings from closed challenge weeks that "
+        "haven't been rated yet (weeks are rated as they close, so this is "
+        "mostly for catching up)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='rate every closed week again from scratch (eg. after changing RATING_K or editing old scores)',
+        )
+
+    def handle(self, *args, rebuild, **options):
+        changes = rebuild_ratings() if rebuild else update_ratings()
+        weeks = sorted({change.challenge_id for change in changes})
+        for week in weeks:
+            self.stdout.write(f'Week {week}: rated {sum(change.challenge_id == week for change in changes)} students')
+        if not weeks:
+            self.stdout.write('Nothing to rate')
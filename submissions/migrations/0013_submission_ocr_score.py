@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2026-10-19 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0012_update_level_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='ocr_score',
+            field=models.PositiveIntegerField(blank=True, help_text='empty if the picture has not been checked (or was unreadable)', null=True, verbose_name='score read from picture'),
+        ),
+    ]
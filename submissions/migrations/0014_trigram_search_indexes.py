@@ -0,0 +1,32 @@
+# Generated by Django 3.2.5 on 2026-10-19 13:13
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0013_submission_ocr_score'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='challenge',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='challenge_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['discord_name'], name='student_discord_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ddr_name'], name='student_ddr_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['twitter'], name='student_twitter_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 3.2.5 on 2026-10-19 13:16
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+import submissions.models
+
+
+def backfill_closed_at(apps, schema_editor):
+    """Use the last submission time of weeks that were closed before closed_at existed."""
+
+    Challenge = apps.get_model('submissions', 'Challenge')
+    Submission = apps.get_model('submissions', 'Submission')
+
+    for challenge in Challenge.objects.filter(is_open=False, closed_at__isnull=True):
+        last = Submission.objects.filter(challenge=challenge).order_by('submitted_at').last()
+        challenge.closed_at = last.submitted_at if last else timezone.now()
+        challenge.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0014_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionHistory',
+            fields=[
+                ('score', models.PositiveIntegerField()),
+                ('pic_url', models.URLField(verbose_name='submission picture url')),
+                ('level', models.CharField(choices=[('JV', 'Junior Varsity'), ('FR', 'Freshman'), ('VA', 'Varsity'), ('GR', 'Graduate'), ('', 'Unknown')], default='', max_length=2, verbose_name='division (at submission time)')),
+                ('submitted_at', models.DateTimeField(auto_now_add=True, verbose_name='submission time')),
+                ('ocr_score', models.PositiveIntegerField(blank=True, help_text='empty if the picture has not been checked (or was unreadable)', null=True, verbose_name='score read from picture')),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('archived', models.BooleanField()),
+            ],
+            options={
+                'verbose_name_plural': 'submission history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedSubmission',
+            fields=[
+                ('score', models.PositiveIntegerField()),
+                ('pic_url', models.URLField(verbose_name='submission picture url')),
+                ('level', models.CharField(choices=[('JV', 'Junior Varsity'), ('FR', 'Freshman'), ('VA', 'Varsity'), ('GR', 'Graduate'), ('', 'Unknown')], default='', max_length=2, verbose_name='division (at submission time)')),
+                ('submitted_at', models.DateTimeField(auto_now_add=True, verbose_name='submission time')),
+                ('ocr_score', models.PositiveIntegerField(blank=True, help_text='empty if the picture has not been checked (or was unreadable)', null=True, verbose_name='score read from picture')),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['challenge', 'student', '-score'], name='submission_best_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedsubmission',
+            name='challenge',
+            field=models.ForeignKey(default=submissions.models.Challenge.latest_week, on_delete=django.db.models.deletion.PROTECT, to='submissions.challenge'),
+        ),
+        migrations.AddField(
+            model_name='archivedsubmission',
+            name='student',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='submissions.student'),
+        ),
+        migrations.RunPython(backfill_closed_at, migrations.RunPython.noop),
+        migrations.RunSQL(
+            """
+            CREATE VIEW submissions_submissionhistory AS
+                SELECT id, student_id, challenge_id, score, pic_url, level, submitted_at, ocr_score,
+                    false AS archived
+                FROM submissions_submission
+                UNION ALL
+                SELECT id, student_id, challenge_id, score, pic_url, level, submitted_at, ocr_score,
+                    true AS archived
+                FROM submissions_archivedsubmission
+            """,
+            'DROP VIEW submissions_submissionhistory',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.5 on 2026-10-19 13:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0015_archived_submissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Compaction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('compacted_at', models.DateTimeField(auto_now_add=True)),
+                ('keep_latest', models.PositiveIntegerField(help_text="how many of each student's latest submissions were kept (besides their best)")),
+                ('submission_count', models.PositiveIntegerField(verbose_name='submissions compacted')),
+                ('data', models.BinaryField(help_text='the compacted submissions, as gzipped JSON lines')),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='submissions.challenge')),
+            ],
+            options={
+                'ordering': ['-compacted_at'],
+            },
+        ),
+    ]
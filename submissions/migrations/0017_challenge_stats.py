@@ -0,0 +1,30 @@
+# Generated by Django 3.2.5 on 2026-10-19 13:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0016_submission_compaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChallengeStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(blank=True, choices=[('JV', 'Junior Varsity'), ('FR', 'Freshman'), ('VA', 'Varsity'), ('GR', 'Graduate'), ('', 'Unknown')], help_text='empty for the whole week', max_length=2, null=True, verbose_name='division (at submission time)')),
+                ('participants', models.PositiveIntegerField()),
+                ('submissions', models.PositiveIntegerField()),
+                ('top_score', models.PositiveIntegerField()),
+                ('median_score', models.FloatField(blank=True, help_text='empty if it needs recomputing', null=True)),
+                ('final', models.BooleanField(default=False)),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='submissions.challenge')),
+            ],
+            options={
+                'verbose_name_plural': 'challenge stats',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.5 on 2026-10-19 14:01
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0017_challenge_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengestats',
+            name='histogram',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), blank=True, help_text='number of best scores from each of models.SCORE_BUCKETS to the next', null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='challengestats',
+            name='mean_best_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='challengestats',
+            name='percentiles',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), blank=True, help_text='of best scores, at models.PERCENTILES', null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='challengestats',
+            name='stddev_best_score',
+            field=models.FloatField(blank=True, null=True, verbose_name='standard deviation of best scores'),
+        ),
+    ]
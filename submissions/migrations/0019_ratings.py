@@ -0,0 +1,39 @@
+# Generated by Django 3.2.5 on 2026-10-19 14:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0018_challenge_stats_distribution'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='rating',
+            field=models.FloatField(blank=True, help_text='skill rating from closed weeks (see ratings.py), empty until rated', null=True),
+        ),
+        migrations.CreateModel(
+            name='RatingChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(blank=True, choices=[('JV', 'Junior Varsity'), ('FR', 'Freshman'), ('VA', 'Varsity'), ('GR', 'Graduate'), ('', 'Unknown')], max_length=2, verbose_name='division (of their best submission)')),
+                ('rank', models.PositiveIntegerField(help_text='by best score in the division, ties sharing a rank')),
+                ('players', models.PositiveIntegerField(help_text='number of students in the division')),
+                ('rating_before', models.FloatField(blank=True, help_text='empty if they were unrated', null=True)),
+                ('rating_after', models.FloatField()),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='submissions.challenge')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='submissions.student')),
+            ],
+            options={
+                'ordering': ['challenge', 'level', 'rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ratingchange',
+            constraint=models.UniqueConstraint(fields=('student', 'challenge'), name='one_rating_change_per_week'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.5 on 2026-10-19 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0019_ratings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['-challenge', 'level', '-score', 'submitted_at', '-id'], name='submission_changelist_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.5 on 2026-10-19 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0020_submission_changelist_index'),
+    ]
+
+    operations = [
+        # keep the latest of any duplicates left by refreshes that overlapped
+        migrations.RunSQL(
+            """
+            DELETE FROM submissions_challengestats AS stats
+            USING submissions_challengestats AS newer
+            WHERE stats.challenge_id = newer.challenge_id
+                AND stats.level IS NOT DISTINCT FROM newer.level
+                AND stats.id < newer.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='challengestats',
+            constraint=models.UniqueConstraint(fields=('challenge', 'level'), name='one_stats_per_division'),
+        ),
+        migrations.AddConstraint(
+            model_name='challengestats',
+            constraint=models.UniqueConstraint(condition=models.Q(('level__isnull', True)), fields=('challenge',), name='one_total_stats_per_week'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.5 on 2026-10-19 15:07
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0021_challenge_stats_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengestats',
+            name='histogram_bounds',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), blank=True, help_text='lowest score of each bar of the histogram', null=True, size=None),
+        ),
+        migrations.AlterField(
+            model_name='challengestats',
+            name='histogram',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), blank=True, help_text='number of best scores from each of histogram_bounds to the next', null=True, size=None),
+        ),
+        # the histograms so far used the fixed (money score) bounds
+        migrations.RunSQL(
+            """
+            UPDATE submissions_challengestats
+            SET histogram_bounds = '{0, 500000, 700000, 800000, 850000, 900000, 925000, 950000, 975000, 990000}'
+            WHERE histogram IS NOT NULL
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2026-10-19 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0022_challenge_stats_histogram_bounds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='score_type',
+            field=models.CharField(choices=[('money', 'Money'), ('ex', 'Ex')], default='money', help_text='which score is submitted (and read off the pictures)', max_length=5),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.5 on 2026-10-19 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0023_challenge_score_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengestats',
+            name='stale_since',
+            field=models.DateTimeField(blank=True, help_text='when the first submission since the median and distribution were computed came in', null=True),
+        ),
+        migrations.AlterField(
+            model_name='challengestats',
+            name='median_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
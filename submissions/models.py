@@ -1,5 +1,11 @@
-from django.db import models
+import gzip
+import json
+
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models, transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from channels.db import database_sync_to_async
 
 class LevelPlacement(models.TextChoices):
@@ -9,6 +15,12 @@ class LevelPlacement(models.TextChoices):
     GRADUATE = 'GR'
     UNKNOWN = ''
 
+class ScoreType(models.TextChoices):
+    """What a challenge week's scores are (the picture shows both)."""
+
+    MONEY = 'money'
+    EX = 'ex'
+
 class Student(models.Model):
     # primary key: id (auto set by django)
     discord_snowflake_id = models.BigIntegerField(
@@ -36,25 +48,52 @@ class Student(models.Model):
         choices=LevelPlacement.choices,
         default=LevelPlacement.UNKNOWN,
     )
+    rating = models.FloatField(
+        help_text='skill rating from closed weeks (see ratings.py), empty until rated',
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        indexes = [
+            # trigram indexes for (fuzzy) admin search
+            GinIndex(name='student_discord_name_trgm', fields=['discord_name'], opclasses=['gin_trgm_ops']),
+            GinIndex(name='student_ddr_name_trgm', fields=['ddr_name'], opclasses=['gin_trgm_ops']),
+            GinIndex(name='student_twitter_trgm', fields=['twitter'], opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f'discord: {self.discord_name} | ddr: {self.ddr_name or "<unknown>"}'
 
-    def save_score(self, score, pic_url):
+    def save_score(self, score, pic_url, week=None, submitted_at=None):
         """Adds new Submission for a Student. Returns score diff from best submission.
 
         Adds Submission for given student, and returns the difference between the
         given score and the previous best submission if it exists.
         Returns None if this is the first submission.
+
+        The submission goes in the latest week at the current time, unless
+        `week` and `submitted_at` say otherwise (for ones saved late).
         """
 
-        highest_subm = self.top_score(Challenge.latest_week())
-        new_subm = self.submission_set.create(score=score, pic_url=pic_url, level=self.level)
+        return self.add_submission(score, pic_url, week, submitted_at)[1]
+
+    def add_submission(self, score, pic_url, week=None, submitted_at=None):
+        """Like save_score, but returns (the new Submission, upscore)."""
+
+        if week is None:
+            week = Challenge.latest_week()
+        highest_subm = self.top_score(week)
+        new_subm = self.submission_set.create(challenge_id=week, score=score, pic_url=pic_url, level=self.level)
+        if submitted_at is not None:
+            # submitted_at is auto_now_add, so it can only be changed after creating
+            self.submission_set.filter(id=new_subm.id).update(submitted_at=submitted_at)
+            new_subm.submitted_at = submitted_at
 
         if highest_subm is not None:
-            return new_subm.score - highest_subm.score
+            return new_subm, new_subm.score - highest_subm.score
 
-        return
+        return new_subm, None
 
     def top_score(self, week):
         return self.submission_set.filter(challenge=week).order_by('score').last()
@@ -65,33 +104,47 @@ class Challenge(models.Model):
     )
     name = models.TextField()
     is_open = models.BooleanField(default=True)
+    score_type = models.CharField(
+        help_text='which score is submitted (and read off the pictures)',
+        max_length=5,
+        choices=ScoreType.choices,
+        default=ScoreType.MONEY,
+    )
+    closed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
 
     def __str__(self):
         return f'Week {self.week}: {self.name}'
 
     def open(self):
         self.is_open = True
+        self.closed_at = None
         self.save()
 
     def close(self):
         self.is_open = False
+        self.closed_at = timezone.now()
         self.save()
 
     @classmethod
     def latest_week(cls):
         """Find the latest challenge week."""
 
-        try:
-            latest = cls.objects.latest()
-            return latest.week
-        except cls.DoesNotExist:
-            return
+        # (only the week, as the default of a migration that runs before
+        # the table has all of this model's columns)
+        return cls.objects.order_by('-week').values_list('week', flat=True).first()
 
     class Meta:
         get_latest_by = 'week'
+        indexes = [
+            GinIndex(name='challenge_name_trgm', fields=['name'], opclasses=['gin_trgm_ops']),
+        ]
+
+class BaseSubmission(models.Model):
+    """Fields shared by current and archived submissions."""
 
-class Submission(models.Model):
-    # primary key: id (auto set by django)
     student = models.ForeignKey(
         Student,
         on_delete=models.PROTECT,
@@ -115,10 +168,277 @@ class Submission(models.Model):
         'submission time',
         auto_now_add=True,
     )
+    ocr_score = models.PositiveIntegerField(
+        'score read from picture',
+        help_text='empty if the picture has not been checked (or was unreadable)',
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        abstract = True
 
     def __str__(self):
         return f'{self.score} for {self.student.discord_name or self.student.ddr_name}'
 
+    @property
+    def score_matches_picture(self):
+        """Whether the score read from the picture matches the submitted score.
+
+        None if the picture hasn't been checked.
+        """
+
+        if self.ocr_score is None:
+            return
+        return self.ocr_score == self.score
+
+class Submission(BaseSubmission):
+    # primary key: id (auto set by django)
+
+    class Meta:
+        indexes = [
+            # for finding each student's best submission in a challenge
+            models.Index(name='submission_best_idx', fields=['challenge', 'student', '-score']),
+            # the admin changelist's ordering, to seek to its pages (see admin.KeysetChangeList)
+            models.Index(name='submission_changelist_idx', fields=['-challenge', 'level', '-score', 'submitted_at', '-id']),
+        ]
+
+class ArchivedSubmission(BaseSubmission):
+    """A submission from a closed week that was moved out of the Submission table.
+
+    Each student's best submission for a week is never archived.
+    See archive.archive_closed_weeks.
+    """
+
+    # keeps the id it had as a Submission
+    id = models.IntegerField(primary_key=True)
+
+class SubmissionHistory(BaseSubmission):
+    """All submissions, current and archived (a database view over both tables).
+
+    The view is created by migration 0015, and has to be recreated there if
+    the submission fields ever change.
+    """
+
+    id = models.IntegerField(primary_key=True)
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+    challenge = models.ForeignKey(
+        Challenge,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+    archived = models.BooleanField()
+
+    class Meta:
+        managed = False
+        verbose_name_plural = 'submission history'
+
+# percentiles kept in ChallengeStats.percentiles
+PERCENTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+# number of bars in ChallengeStats.histogram
+HISTOGRAM_BARS = 10
+
+class ChallengeStats(models.Model):
+    """Participation numbers for a challenge week, per division and for the
+    whole week (an empty division), and how its scores were distributed.
+
+    Kept up to date as submissions come in while the week is open, and final
+    (never recomputed) once it closes. See stats.py.
+    """
+
+    challenge = models.ForeignKey(
+        Challenge,
+        on_delete=models.CASCADE,
+    )
+    level = models.CharField(
+        'division (at submission time)',
+        help_text='empty for the whole week',
+        max_length=2,
+        choices=LevelPlacement.choices,
+        blank=True,
+        null=True,
+    )
+    participants = models.PositiveIntegerField()
+    submissions = models.PositiveIntegerField()
+    top_score = models.PositiveIntegerField()
+    median_score = models.FloatField(
+        blank=True,
+        null=True,
+    )
+    # the distribution of each participant's best score (the one that counts
+    # for the leaderboard)
+    mean_best_score = models.FloatField(
+        blank=True,
+        null=True,
+    )
+    stddev_best_score = models.FloatField(
+        'standard deviation of best scores',
+        blank=True,
+        null=True,
+    )
+    percentiles = ArrayField(
+        models.FloatField(),
+        help_text='of best scores, at models.PERCENTILES',
+        blank=True,
+        null=True,
+    )
+    histogram = ArrayField(
+        models.PositiveIntegerField(),
+        help_text='number of best scores from each of histogram_bounds to the next',
+        blank=True,
+        null=True,
+    )
+    # the bars evenly split the range of this row's best scores, as they're
+    # money scores some weeks and EX scores others
+    histogram_bounds = ArrayField(
+        models.PositiveIntegerField(),
+        help_text='lowest score of each bar of the histogram',
+        blank=True,
+        null=True,
+    )
+    final = models.BooleanField(
+        default=False,
+    )
+    # the median and distribution are behind the counts above until they're
+    # next recomputed
+    stale_since = models.DateTimeField(
+        help_text='when the first submission since the median and distribution were computed came in',
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        verbose_name_plural = 'challenge stats'
+        constraints = [
+            models.UniqueConstraint(fields=['challenge', 'level'], name='one_stats_per_division'),
+            # (NULLs are never equal in the one above)
+            models.UniqueConstraint(
+                fields=['challenge'],
+                condition=models.Q(level__isnull=True),
+                name='one_total_stats_per_week',
+            ),
+        ]
+
+    def __str__(self):
+        return f'Week {self.challenge_id} {LevelPlacement(self.level).label if self.level is not None else "total"}'
+
+class RatingChange(models.Model):
+    """How a closed week changed a student's rating, as one of the players in
+    their division's match that week. See ratings.py.
+    """
+
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.CASCADE,
+    )
+    challenge = models.ForeignKey(
+        Challenge,
+        on_delete=models.CASCADE,
+    )
+    level = models.CharField(
+        'division (of their best submission)',
+        max_length=2,
+        choices=LevelPlacement.choices,
+        blank=True,
+    )
+    rank = models.PositiveIntegerField(
+        help_text='by best score in the division, ties sharing a rank',
+    )
+    players = models.PositiveIntegerField(
+        help_text='number of students in the division',
+    )
+    rating_before = models.FloatField(
+        help_text='empty if they were unrated',
+        blank=True,
+        null=True,
+    )
+    rating_after = models.FloatField()
+
+    class Meta:
+        ordering = ['challenge', 'level', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'challenge'], name='one_rating_change_per_week'),
+        ]
+
+    def __str__(self):
+        return f'Week {self.challenge_id}: {self.student_id} ranked {self.rank} of {self.players}'
+
+class Compaction(models.Model):
+    """A record of submissions compacted out of the database for a closed week.
+
+    The compacted submissions are kept here as gzipped JSON lines (one
+    submission per line), so they can still be looked at or restored.
+    See archive.compact_closed_weeks.
+    """
+
+    challenge = models.ForeignKey(
+        Challenge,
+        on_delete=models.PROTECT,
+    )
+    compacted_at = models.DateTimeField(
+        auto_now_add=True,
+    )
+    keep_latest = models.PositiveIntegerField(
+        help_text="how many of each student's latest submissions were kept (besides their best)",
+    )
+    submission_count = models.PositiveIntegerField(
+        'submissions compacted',
+    )
+    data = models.BinaryField(
+        help_text='the compacted submissions, as gzipped JSON lines',
+    )
+
+    class Meta:
+        ordering = ['-compacted_at']
+
+    def __str__(self):
+        return f'{self.submission_count} submissions from week {self.challenge_id}'
+
+    def submissions(self):
+        """The compacted submissions, as dicts."""
+
+        return [json.loads(line) for line in gzip.decompress(self.data).splitlines()]
+
+def best_submissions():
+    """The highest scoring submission for each student in each challenge.
+
+    Ties go to the latest submission.
+    """
+
+    return (
+        Submission.objects
+        .order_by('challenge', 'student', '-score', '-id')
+        .distinct('challenge', 'student')
+    )
+
+def submission_activity(student_ids):
+    """Each student's submission count, weeks taken part in, latest submission
+    time and best score, including archived submissions. In one query.
+
+    Returns {student id: {'submissions': ..., 'weeks': ..., 'latest': ...,
+    'best': ...}}, without students that never submitted.
+    """
+
+    rows = (
+        SubmissionHistory.objects
+        .filter(student__in=student_ids)
+        .values('student')
+        .annotate(
+            submissions=models.Count('id'),
+            weeks=models.Count('challenge', distinct=True),
+            latest=models.Max('submitted_at'),
+            best=models.Max('score'),
+        )
+        .order_by()
+    )
+    return {row.pop('student'): row for row in rows}
+
 @database_sync_to_async
 def async_save_score(discord_snowflake_id, discord_name, level, score, pic_url):
     student = put_student(
@@ -126,7 +446,57 @@ def async_save_score(discord_snowflake_id, discord_name, level, score, pic_url):
         discord_name=discord_name,
         level=level,
     )
-    return student.save_score(score, pic_url)
+    submission, upscore = student.add_submission(score, pic_url)
+    return upscore, submission.id
+
+@database_sync_to_async
+def async_save_scores(entries):
+    return save_scores(entries)
+
+def save_scores(entries):
+    """Saves a batch of submissions in one transaction. Returns each one's (upscore, id).
+
+    Each entry is a dict of async_save_score's arguments, plus the
+    `challenge_id` and `submitted_at` (ISO 8601) it was sent with, so entries
+    saved late still go in the right week. Entries marked as
+    `replayed` (left over in the submission log after a restart) might already
+    have been saved, so they're skipped if the student already has a
+    submission with the same picture (and that one's id is returned, with no
+    upscore).
+    """
+
+    results = []
+    with transaction.atomic():
+        for entry in entries:
+            student = put_student(
+                entry['discord_snowflake_id'],
+                discord_name=entry['discord_name'],
+                level=entry['level'],
+            )
+            saved = None
+            if entry.get('replayed'):
+                saved = student.submission_set.filter(pic_url=entry['pic_url']).values_list('id', flat=True).first()
+            if saved is not None:
+                results.append((None, saved))
+            else:
+                submitted_at = entry.get('submitted_at')
+                submission, upscore = student.add_submission(
+                    entry['score'],
+                    entry['pic_url'],
+                    week=entry.get('challenge_id'),
+                    submitted_at=submitted_at and parse_datetime(submitted_at),
+                )
+                results.append((upscore, submission.id))
+    return results
+
+@database_sync_to_async
+def async_save_ocr_score(submission_id, ocr_score):
+    return save_ocr_score(submission_id, ocr_score)
+
+def save_ocr_score(submission_id, ocr_score):
+    """Stores the score read from a submission's picture."""
+
+    return Submission.objects.filter(id=submission_id).update(ocr_score=ocr_score)
 
 @database_sync_to_async
 def async_update_student(discord_snowflake_id, **kwargs):
@@ -151,6 +521,10 @@ def new_week(name):
     week = latest + 1
     return Challenge.objects.create(week=week, name=name)
 
+@database_sync_to_async
+def async_get_challenge(week):
+    return Challenge.objects.filter(week=week).first()
+
 @database_sync_to_async
 def close_submissions():
     latest = Challenge.latest_week()
@@ -166,11 +540,3 @@ def reopen_submissions():
         c = Challenge.objects.get(week=latest)
         c.open()
         return c
-
-@database_sync_to_async
-def is_latest_week_open():
-    latest = Challenge.latest_week()
-    if latest:
-        c = Challenge.objects.get(week=latest)
-        return c.is_open
-    return False
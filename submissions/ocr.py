@@ -0,0 +1,133 @@
+import asyncio
+import io
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from .models import ScoreType, async_save_ocr_score
+
+# the highest each type of score can be. EX scores (3 points for each
+# marvelous) stay in the thousands, so the money score in the same picture is
+# out of range.
+MAX_SCORES = {
+    ScoreType.MONEY: 1_000_000,
+    ScoreType.EX: 10_000,
+}
+
+def read_score(image_bytes, score_type, region=(0, 0, 1, 1)):
+    """Reads the score off a submission picture using tesseract.
+
+    Runs in a worker process, so it only takes and returns plain values.
+    `region` is the (left, top, right, bottom) part of the picture to look at,
+    as fractions of its width and height.
+    `score_type` is the week's (see ScoreType).
+    Returns the score found in the picture, or None if nothing was readable.
+    """
+
+    # imported here so the bot doesn't need the OCR libraries unless it's enabled
+    from PIL import Image, ImageOps
+    import pytesseract
+
+    image = Image.open(io.BytesIO(image_bytes))
+    left, top, right, bottom = region
+    image = image.crop((
+        int(left * image.width),
+        int(top * image.height),
+        int(right * image.width),
+        int(bottom * image.height),
+    ))
+    image = ImageOps.autocontrast(ImageOps.grayscale(image))
+
+    text = pytesseract.image_to_string(
+        image,
+        config='--psm 6 -c tessedit_char_whitelist=0123456789,.',
+    )
+    return parse_score(text, score_type)
+
+def parse_score(text, score_type=ScoreType.MONEY):
+    """Picks the most likely score of a type out of some OCR'd text.
+
+    That's the biggest number that could be that type of score: judgement
+    counts and combos are smaller, and on EX weeks the money score is too big.
+    The claimed score is deliberately not looked at, or any number in the
+    picture could "confirm" it; it's compared with this afterwards.
+    Returns None if the text doesn't have any numbers in it.
+    """
+
+    numbers = [
+        int(re.sub(r'[,.]', '', match))
+        for match in re.findall(r'\d[\d,.]*', text)
+    ]
+    numbers = [n for n in numbers if n <= MAX_SCORES[score_type]]
+
+    if numbers:
+        return max(numbers)
+    return
+
+class ScoreReader:
+    """Checks submission pictures in the background.
+
+    Pictures are queued up and read by a pool of worker processes. The queue
+    is bounded: if it's full (eg. during a deadline rush) the picture is
+    skipped rather than making anyone wait, and it's left unchecked.
+    """
+
+    def __init__(self, workers=2, queue_size=50, region=(0, 0, 1, 1)):
+        self.workers = workers
+        self.region = region
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.skipped = 0
+        self._pool = None
+        self._tasks = []
+
+    @property
+    def is_running(self):
+        return self._pool is not None
+
+    def start(self, loop):
+        if self.is_running:
+            return
+
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        self._pool = None
+        self._tasks = []
+
+    def submit(self, attachment, score_type, submission):
+        """Queues a submission's picture to have its score read.
+
+        `submission` is the submission's id, or while it waits in the
+        submission log, the log's future for its (upscore, id).
+
+        Never waits. Returns False if the picture was skipped.
+        """
+
+        try:
+            self.queue.put_nowait((attachment, score_type, submission))
+            return True
+        except asyncio.QueueFull:
+            self.skipped += 1
+            print(f'OCR queue full, skipping picture check for {attachment.proxy_url}')
+            return False
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            attachment, score_type, submission = await self.queue.get()
+            try:
+                image_bytes = await attachment.read(use_cached=True)
+                ocr_score = await loop.run_in_executor(
+                    self._pool, read_score, image_bytes, score_type, self.region
+                )
+                if isinstance(submission, asyncio.Future):
+                    _, submission = await submission
+                await async_save_ocr_score(submission, ocr_score)
+            except Exception as error:
+                print(f'Error reading score from {attachment.proxy_url}: {error.__class__.__name__}: {error}')
+            finally:
+                self.queue.task_done()
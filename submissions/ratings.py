@@ -0,0 +1,213 @@
+"""Skill ratings for students, from how they place in closed weeks.
+
+Each closed week is a match per division (the division of each student's best
+submission), where everyone plays everyone else: beating lower best scores,
+losing to higher ones and drawing with equal ones. Ratings are updated like
+multiplayer Elo. A student's change is K / (players - 1) times the sum, over
+their opponents, of their result minus the result expected from the two
+ratings. So a week moves a rating about as much as one two-player game,
+however many students took part.
+
+Weeks are rated once, in order, as they close (see signals.py), from the
+ratings before them, instead of replaying every week. Reopening a rated week
+undoes it (and any weeks rated after it, which are rated again).
+"""
+
+import math
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+
+from .models import Challenge, RatingChange, Student, Submission, best_submissions
+
+# matches up to this big sum the expected results over every pair, which is
+# quicker for them than expected_totals' integral
+PAIRWISE_PLAYERS = 100
+# expected_totals' sampling step, in log σ. The trapezoid rule's error is
+# about e^(-π² / step): far below rounding errors at this step.
+INTEGRAL_STEP = 0.25
+
+def expected_result(rating, other):
+    """The expected result (1 for a win, 0 for a loss) against someone with the other rating."""
+
+    return 1 / (1 + 10 ** ((other - rating) / 400))
+
+def expected_totals(ratings):
+    """Each rating's expected results against all the others, summed.
+
+    Summing over every pair is O(n²), so big matches use each rating's
+    strength a = 10^(rating / 400) instead. The expected result of a against b
+    is a / (a + b), which is
+
+        a ∫₀^∞ e^(-aσ) e^(-bσ) dσ
+
+    so the sum over every b only needs Σ_b e^(-bσ), at each point σ the
+    integral is sampled at (with the trapezoid rule over log σ, which
+    converges very quickly here). That's O(n log n): the number of points
+    grows with the log of the number of players (and the spread of ratings).
+    """
+
+    if len(ratings) <= PAIRWISE_PLAYERS:
+        return [
+            sum(expected_result(rating, other) for j, other in enumerate(ratings) if i != j)
+            for i, rating in enumerate(ratings)
+        ]
+
+    low = min(ratings)
+    strengths = [10 ** ((rating - low) / 400) for rating in ratings]
+    # from where a * σ * (number of players) is negligible for every a, to
+    # where e^(-aσ) is for every a (all at least 1)
+    start = math.log(1e-12 / (max(strengths) * len(ratings)))
+    stop = math.log(50)
+    points = [math.exp(start + i * INTEGRAL_STEP) for i in range(int((stop - start) / INTEGRAL_STEP) + 1)]
+    sums = [math.fsum(math.exp(-b * point) for b in strengths) for point in points]
+    return [
+        # (with dσ = σ d(log σ)), less the expected result of 1/2 against themselves
+        INTEGRAL_STEP * math.fsum(a * point * math.exp(-a * point) * total for point, total in zip(points, sums)) - 0.5
+        for a in strengths
+    ]
+
+def match_changes(players, k=None):
+    """The rating changes from one match, given [(rating, score), ...], in the same order.
+
+    O(n log n) in the number of players (see expected_totals).
+    """
+
+    if k is None:
+        k = settings.RATING_K
+    if len(players) < 2:
+        return [0.0] * len(players)
+
+    scores = sorted(score for _, score in players)
+    expected = expected_totals([rating for rating, _ in players])
+    changes = []
+    for (rating, score), expected_total in zip(players, expected):
+        # a win against each lower score, and a draw with each other equal one
+        lower = bisect_left(scores, score)
+        equal = bisect_right(scores, score) - lower - 1
+        changes.append(k * (lower + equal / 2 - expected_total) / (len(players) - 1))
+    return changes
+
+def rate_week(challenge):
+    """Updates ratings from a closed week's matches. Returns the RatingChanges made."""
+
+    best = list(best_submissions().filter(challenge=challenge).values_list('student', 'level', 'score'))
+    ratings = dict(Student.objects.filter(id__in=[student for student, _, _ in best]).values_list('id', 'rating'))
+
+    matches = defaultdict(list)
+    for student, level, score in best:
+        matches[level].append((student, score))
+
+    changes = []
+    for level, players in matches.items():
+        # tied scores share the higher rank
+        ranks = {}
+        for rank, score in enumerate(sorted((score for _, score in players), reverse=True), 1):
+            ranks.setdefault(score, rank)
+        deltas = match_changes([
+            (ratings[student] if ratings[student] is not None else settings.RATING_INITIAL, score)
+            for student, score in players
+        ])
+        for (student, score), delta in zip(players, deltas):
+            before = ratings[student]
+            changes.append(RatingChange(
+                student_id=student,
+                challenge=challenge,
+                level=level,
+                rank=ranks[score],
+                players=len(players),
+                rating_before=before,
+                rating_after=(before if before is not None else settings.RATING_INITIAL) + delta,
+            ))
+
+    # (no savepoint when it's part of update_ratings' transaction)
+    with transaction.atomic(savepoint=False):
+        RatingChange.objects.bulk_create(changes)
+        Student.objects.bulk_update(
+            [Student(id=change.student_id, rating=change.rating_after) for change in changes],
+            ['rating'],
+        )
+    return changes
+
+def unrated_weeks():
+    """Closed weeks with submissions that haven't been rated, in order."""
+
+    return Challenge.objects.filter(
+        Exists(Submission.objects.filter(challenge=OuterRef('week'))),
+        is_open=False,
+    ).exclude(
+        Exists(RatingChange.objects.filter(challenge=OuterRef('week'))),
+    ).order_by('week')
+
+def update_ratings():
+    """Rates the closed weeks that haven't been, in order. Returns the RatingChanges made.
+
+    If one of them is older than a week that has been rated (eg. an old week
+    that was reopened and closed again), that week and the ones after it are
+    rated again, so every week is rated from the ones before it.
+    """
+
+    weeks = list(unrated_weeks())
+    if not weeks:
+        return []
+
+    with transaction.atomic():
+        if RatingChange.objects.filter(challenge__gt=weeks[0].week).exists():
+            unrate_from(weeks[0].week)
+            weeks = list(unrated_weeks())
+
+        changes = []
+        for challenge in weeks:
+            changes += rate_week(challenge)
+    return changes
+
+def unrate_from(week):
+    """Undoes the ratings from a week and the weeks after it. Returns whether there were any."""
+
+    with transaction.atomic(savepoint=False):
+        undone = RatingChange.objects.filter(challenge__gte=week)
+        # everyone goes back to their rating from before the first week undone
+        first = list(undone.order_by('student', 'challenge').distinct('student').values_list('student', 'rating_before'))
+        if not first:
+            return False
+
+        Student.objects.bulk_update(
+            [Student(id=student, rating=rating) for student, rating in first],
+            ['rating'],
+        )
+        undone.delete()
+        return True
+
+def rebuild_ratings():
+    """Rates every closed week again, from scratch. Returns the RatingChanges made."""
+
+    with transaction.atomic():
+        RatingChange.objects.all().delete()
+        Student.objects.filter(rating__isnull=False).update(rating=None)
+        return update_ratings()
+
+@database_sync_to_async
+def async_student_rating(discord_snowflake_id, recent=3):
+    return student_rating(discord_snowflake_id, recent)
+
+def student_rating(discord_snowflake_id, recent=3):
+    """A student's rating, as (Student, rank among rated students, number of
+    rated students, their `recent` latest RatingChanges, latest first).
+
+    Returns None if they aren't rated.
+    """
+
+    student = Student.objects.filter(discord_snowflake_id=discord_snowflake_id, rating__isnull=False).first()
+    if student is None:
+        return
+
+    counts = Student.objects.filter(rating__isnull=False).aggregate(
+        rated=Count('id'),
+        higher=Count('id', filter=Q(rating__gt=student.rating)),
+    )
+    changes = list(RatingChange.objects.filter(student=student).order_by('-challenge')[:recent])
+    return student, counts['higher'] + 1, counts['rated'], changes
@@ -0,0 +1,128 @@
+import csv
+import heapq
+from itertools import groupby
+
+from django.db.models import Count, Min
+
+from .models import LevelPlacement, SubmissionHistory
+
+def report(weeks, format='markdown', top=10):
+    """A digest of some challenge weeks (one week, or a whole season).
+
+    Has each week's participation per division, new students, students who
+    submitted more than once, and the `top` biggest upscores. Includes
+    archived submissions.
+
+    Yields the report's text bit by bit, in `format` ('markdown' or 'csv').
+    Submissions are streamed from the database in one pass (everything else
+    is counted by the database), so memory use doesn't grow with the number
+    of submissions.
+    """
+
+    writer = FORMATS[format]()
+    subms = SubmissionHistory.objects.filter(challenge__in=weeks)
+
+    yield from writer.title(f'Weeks {min(weeks)}-{max(weeks)}' if len(weeks) > 1 else f'Week {weeks[0]}')
+
+    yield from writer.section('Participation', ['week', 'challenge', 'division', 'students', 'submissions'])
+    participation = (
+        subms.values('challenge', 'challenge__name', 'level')
+        .annotate(students=Count('student', distinct=True), submissions=Count('id'))
+        .order_by('challenge', 'level')
+    )
+    for row in participation.iterator():
+        yield from writer.row([
+            row['challenge'],
+            row['challenge__name'],
+            LevelPlacement(row['level']).label,
+            row['students'],
+            row['submissions'],
+        ])
+
+    yield from writer.section('New students', ['week', 'student'])
+    first_weeks = (
+        SubmissionHistory.objects
+        .values('student', 'student__ddr_name', 'student__discord_name')
+        .annotate(first_week=Min('challenge'))
+        .filter(first_week__in=weeks)
+        .order_by('first_week', 'student__discord_name')
+    )
+    for row in first_weeks.iterator():
+        yield from writer.row([
+            row['first_week'],
+            student_name(row['student__ddr_name'], row['student__discord_name']),
+        ])
+
+    # the one pass over the submissions: each student's submissions for a
+    # week in order, for the repeat submitters and upscores
+    yield from writer.section('Submitted more than once', ['week', 'student', 'submissions', 'first score', 'best score'])
+    stream = (
+        subms.order_by('challenge', 'student', 'submitted_at', 'id')
+        .values_list('challenge', 'student', 'student__ddr_name', 'student__discord_name', 'score')
+        .iterator(chunk_size=2000)
+    )
+    upscores = []
+    for (week, _), group in groupby(stream, key=lambda subm: subm[:2]):
+        count = 0
+        for _, _, ddr_name, discord_name, score in group:
+            count += 1
+            if count == 1:
+                first = best = score
+            elif score > best:
+                upscore = (score - best, week, student_name(ddr_name, discord_name), best, score)
+                if len(upscores) < top:
+                    heapq.heappush(upscores, upscore)
+                else:
+                    heapq.heappushpop(upscores, upscore)
+                best = score
+
+        if count > 1:
+            yield from writer.row([week, student_name(ddr_name, discord_name), count, first, best])
+
+    yield from writer.section('Biggest upscores', ['week', 'student', 'from', 'to', 'upscore'])
+    for upscore, week, name, before, after in sorted(upscores, reverse=True):
+        yield from writer.row([week, name, before, after, f'+{upscore}'])
+
+def student_name(ddr_name, discord_name):
+    return ddr_name or discord_name or '(no name)'
+
+class MarkdownWriter:
+    def title(self, title):
+        yield f'# {title}\n'
+
+    def section(self, title, headers):
+        yield f'\n## {title}\n\n'
+        yield from self.row(headers)
+        yield from self.row(['---'] * len(headers))
+
+    def row(self, values):
+        values = [str(value).replace('|', '\\|') for value in values]
+        yield f'| {" | ".join(values)} |\n'
+
+class Echo:
+    """A file-like object that just returns what's written to it."""
+
+    def write(self, value):
+        return value
+
+class CsvWriter:
+    """Writes each section as a blank row, a title row, a header row and then its rows."""
+
+    def __init__(self):
+        self.writer = csv.writer(Echo())
+
+    def title(self, title):
+        yield self.writer.writerow([title])
+
+    def section(self, title, headers):
+        yield self.writer.writerow([])
+        yield self.writer.writerow([title])
+        yield self.writer.writerow(headers)
+
+    def row(self, values):
+        yield self.writer.writerow(values)
+
+FORMATS = {
+    'markdown': MarkdownWriter,
+    'csv': CsvWriter,
+}
@@ -0,0 +1,85 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caches, ratings, stats
+from .bus import ChallengeChanged, Reconnected, SubmissionAdded, SubmissionsChanged, bus, emit
+from .models import Challenge, ChallengeStats, Submission
+
+@receiver([post_save, post_delete], sender=Submission)
+@receiver([post_save, post_delete], sender=Challenge)
+def invalidate_facets(sender, **kwargs):
+    caches.invalidate_submission_facets()
+
+@receiver([post_save, post_delete], sender=Challenge)
+def invalidate_current_challenge(sender, **kwargs):
+    caches.invalidate_current_challenge()
+
+@receiver(post_save, sender=Submission)
+def count_submission(sender, instance, created, **kwargs):
+    if created:
+        stats.count_submission(instance)
+    else:
+        stats.submission_changed(instance)
+
+@receiver(post_save, sender=Challenge)
+def update_ratings(sender, instance, **kwargs):
+    if instance.is_open:
+        # (re)opened, so it's rated again once it closes, along with any weeks
+        # rated after it
+        if ratings.unrate_from(instance.week):
+            ratings.update_ratings()
+    else:
+        ratings.update_ratings()
+
+# events for the other processes (see bus.py)
+
+@receiver([post_save, post_delete], sender=Challenge)
+def emit_challenge_changed(sender, instance, **kwargs):
+    emit(ChallengeChanged(instance.week))
+
+@receiver(post_save, sender=Submission)
+def emit_submission_added(sender, instance, created, **kwargs):
+    if created:
+        student = instance.student
+        emit(SubmissionAdded(
+            week=instance.challenge_id,
+            student=instance.student_id,
+            name=student.ddr_name or student.discord_name or '(no name)',
+            level=instance.level,
+            score=instance.score,
+        ))
+    else:
+        emit(SubmissionsChanged(instance.challenge_id))
+
+@receiver(post_delete, sender=Submission)
+def emit_submissions_changed(sender, instance, **kwargs):
+    emit(SubmissionsChanged(instance.challenge_id))
+
+@receiver(post_delete, sender=Submission)
+def uncount_submission(sender, instance, **kwargs):
+    stats.submission_changed(instance)
+
+@receiver(post_save, sender=Challenge)
+def finalize_stats(sender, instance, created, **kwargs):
+    if created:
+        return
+    if instance.is_open:
+        # reopened, so they're kept up to date again
+        ChallengeStats.objects.filter(challenge=instance, final=True).update(final=False)
+    elif not ChallengeStats.objects.filter(challenge=instance, final=True).exists():
+        stats.refresh_stats([instance])
+
+# clearing this process' caches for changes made by any process
+
+def invalidate_all(event):
+    caches.invalidate_submission_facets()
+    caches.invalidate_current_challenge()
+
+def invalidate_facets_for(event):
+    caches.invalidate_submission_facets()
+
+bus.subscribe(ChallengeChanged, invalidate_all)
+bus.subscribe(SubmissionAdded, invalidate_facets_for)
+bus.subscribe(SubmissionsChanged, invalidate_facets_for)
+# anything could have changed while it wasn't listening
+bus.subscribe(Reconnected, invalidate_all)
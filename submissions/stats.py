@@ -0,0 +1,209 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Exists, F, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import HISTOGRAM_BARS, PERCENTILES, Challenge, ChallengeStats, Submission, SubmissionHistory
+
+def compute_stats(weeks):
+    """Participation numbers and score distributions for some weeks, in one GROUP BY.
+
+    Returns [(week, level, participants, submissions, top score, median
+    score, mean, standard deviation, percentiles, histogram, histogram's
+    lowest bound, its bars' width), ...], with a level of None for each whole
+    week. Includes archived submissions. The median is of all submissions;
+    the rest of the distribution is of each participant's best score (see
+    ChallengeStats): their best in the division for a division's, and their
+    best in the week for the whole week's, so students who changed divisions
+    midweek count in each.
+
+    The histogram's bars evenly split the range of best scores, whatever
+    they're out of (money scores or EX scores).
+    """
+
+    def of_best(aggregate):
+        # GROUPING(level) is 1 for the whole week's rows
+        return (
+            f'CASE WHEN GROUPING(level) = 0 THEN {aggregate.format(scope="division")} '
+            f'ELSE {aggregate.format(scope="week")} END'
+        )
+
+    def bar_width(scope):
+        # so the best scores from lowest to highest fit in the bars
+        return (
+            f'(max(score) FILTER (WHERE is_{scope}_best) OVER {scope} '
+            f'- min(score) FILTER (WHERE is_{scope}_best) OVER {scope}) / {HISTOGRAM_BARS} + 1'
+        )
+
+    # a bar of the histogram counts the best scores in its range
+    histogram = 'ARRAY[' + ', '.join(
+        f'count(*) FILTER (WHERE is_{{scope}}_best AND (score - {{scope}}_low) / {{scope}}_width = {i})'
+        for i in range(HISTOGRAM_BARS)
+    ) + ']'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            SELECT
+                challenge_id,
+                level,
+                count(DISTINCT student_id),
+                count(*),
+                max(score),
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY score),
+                {of_best('avg(score) FILTER (WHERE is_{scope}_best)')},
+                {of_best('stddev_pop(score) FILTER (WHERE is_{scope}_best)')},
+                {of_best('percentile_cont(%(percentiles)s::float8[]) WITHIN GROUP (ORDER BY score) FILTER (WHERE is_{scope}_best)')},
+                {of_best(histogram)},
+                {of_best('min({scope}_low)')},
+                {of_best('min({scope}_width)')}
+            FROM (
+                SELECT
+                    *,
+                    min(score) FILTER (WHERE is_week_best) OVER week AS week_low,
+                    {bar_width('week')} AS week_width,
+                    min(score) FILTER (WHERE is_division_best) OVER division AS division_low,
+                    {bar_width('division')} AS division_width
+                FROM (
+                    SELECT
+                        challenge_id,
+                        level,
+                        student_id,
+                        score,
+                        row_number() OVER (
+                            PARTITION BY challenge_id, student_id ORDER BY score DESC, id DESC
+                        ) = 1 AS is_week_best,
+                        row_number() OVER (
+                            PARTITION BY challenge_id, level, student_id ORDER BY score DESC, id DESC
+                        ) = 1 AS is_division_best
+                    FROM {SubmissionHistory._meta.db_table}
+                    WHERE challenge_id = ANY(%(weeks)s)
+                ) AS ranked
+                WINDOW week AS (PARTITION BY challenge_id), division AS (PARTITION BY challenge_id, level)
+            ) AS subm
+            GROUP BY GROUPING SETS ((challenge_id, level), (challenge_id))
+            ''',
+            {'percentiles': list(PERCENTILES), 'weeks': list(weeks)},
+        )
+        return cursor.fetchall()
+
+def refresh_stats(challenges):
+    """Recomputes the stats for some weeks. Closed weeks' stats are final."""
+
+    is_open = {challenge.week: challenge.is_open for challenge in challenges}
+    with transaction.atomic():
+        # one refresh of a week at a time, so they don't both insert its stats
+        # (see ChallengeStats' constraints). NO KEY UPDATE doesn't hold up new
+        # submissions to the week.
+        list(
+            Challenge.objects.select_for_update(no_key=True)
+            .filter(week__in=list(is_open))
+            .order_by('week')
+            .values_list('week', flat=True)
+        )
+        rows = compute_stats(is_open)
+        ChallengeStats.objects.filter(challenge__in=list(is_open)).delete()
+        ChallengeStats.objects.bulk_create([
+            ChallengeStats(
+                challenge_id=week,
+                level=level,
+                participants=participants,
+                submissions=submissions,
+                top_score=top_score,
+                median_score=median_score,
+                mean_best_score=mean,
+                stddev_best_score=stddev,
+                percentiles=percentiles,
+                histogram=histogram,
+                histogram_bounds=[low + i * width for i in range(HISTOGRAM_BARS)],
+                final=not is_open[week],
+            )
+            for (
+                week, level, participants, submissions, top_score, median_score,
+                mean, stddev, percentiles, histogram, low, width,
+            ) in rows
+        ])
+
+def challenge_stats(challenges):
+    """The stats for some weeks, as {week: {level (None for the whole week): ChallengeStats}}.
+
+    Stats are computed for weeks that don't have any yet, and recomputed for
+    open weeks whose median and distribution have been stale for
+    STATS_REFRESH_SECONDS, all in one go. So while submissions keep coming
+    in, a week's full GROUP BY runs at most that often, however many times
+    its stats are looked at. (Stats kept from before distributions were are
+    recomputed too, closed or not.)
+    """
+
+    def load(using=None):
+        stats = defaultdict(dict)
+        for row in ChallengeStats.objects.using(using).filter(challenge__in=[c.week for c in challenges]):
+            stats[row.challenge_id][row.level] = row
+        return stats
+
+    stats = load()
+    due = timezone.now() - timedelta(seconds=settings.STATS_REFRESH_SECONDS)
+    stale = [
+        challenge for challenge in challenges
+        if not stats[challenge.week]
+        or any(
+            row.histogram is None or (row.stale_since is not None and row.stale_since <= due)
+            for row in stats[challenge.week].values()
+        )
+    ]
+    if stale:
+        refresh_stats(stale)
+        # from the primary, where they were just saved (these might have
+        # been read from a lagging replica)
+        stats = load('default')
+    return stats
+
+@database_sync_to_async
+def async_challenge_stats(challenge):
+    return challenge_stats([challenge])[challenge.week]
+
+def count_submission(subm):
+    """Adds a new submission to its week's stats, if they're not final.
+
+    Counts are updated in place. The median and the distribution of best
+    scores can't be, so they're marked stale, and recomputed when the stats
+    are next looked at once they've been stale for STATS_REFRESH_SECONDS
+    (see challenge_stats). Never recomputes anything itself, as it's part of
+    saving the submission.
+    """
+
+    earlier = Submission.objects.filter(
+        challenge=subm.challenge_id,
+        student=subm.student_id,
+    ).exclude(id=subm.id)
+
+    updated = ChallengeStats.objects.filter(
+        Q(level=subm.level) | Q(level__isnull=True),
+        challenge=subm.challenge_id,
+        final=False,
+    ).update(
+        participants=F('participants') + Case(
+            When(Q(level__isnull=True) & ~Exists(earlier), then=Value(1)),
+            When(Q(level=subm.level) & ~Exists(earlier.filter(level=subm.level)), then=Value(1)),
+            default=Value(0),
+        ),
+        submissions=F('submissions') + 1,
+        top_score=Greatest('top_score', Value(subm.score)),
+        stale_since=Coalesce('stale_since', Value(timezone.now())),
+    )
+
+    if updated == 1:
+        # the first submission in its division this week, so there's no row
+        # to add to
+        submission_changed(subm)
+
+def submission_changed(subm):
+    """Drops a week's stats after its submissions changed, if they're not
+    final, so they're recomputed when they're next looked at.
+    """
+
+    ChallengeStats.objects.filter(challenge=subm.challenge_id, final=False).delete()
@@ -1,7 +1,32 @@
-from django.test import TestCase
+import asyncio
+import csv
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import skipUnless
+from unittest.mock import patch
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import router, transaction
+from django.conf import settings
+from django.db import connections
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 from django.db.utils import IntegrityError
 
-from . import models
+from bfa import routers
+from . import archive, benchmarks, bus, caches, fakedata, leaderboards, live, models, ocr, ratings, reports, stats, wal
+from .admin import admin_site
 
 class SubmissionTests(TestCase):
     def test_new_submission_uses_latest_challenge(self):
@@ -147,3 +172,1282 @@ class ModelHelperTests(TestCase):
         self.assertTrue(new_challenge.is_open)
 
         self.assertEqual(models.Challenge.objects.get(week=8), new_challenge)
+
+class ScoreCheckTests(TestCase):
+    def setUp(self):
+        models.Challenge.objects.create(week=1, name='week1')
+        self.student = models.Student.objects.create(
+            discord_snowflake_id=99999,
+            discord_name='discord#1234',
+        )
+
+    def test_parse_score_ignores_smaller_numbers(self):
+        """
+        Don't take a smaller number from the picture (eg. a judgement count)
+        for the score, even if it happens to be the claimed one.
+        """
+
+        text = 'MARVELOUS 412\nPERFECT 12\nEX 1,234\n998,760'
+        self.assertEqual(ocr.parse_score(text), 998760)
+
+    def test_parse_score_uses_biggest_score(self):
+        """
+        Use the biggest number that could be a score.
+        """
+
+        text = '412 12 998,760 54321999'
+        self.assertEqual(ocr.parse_score(text), 998760)
+
+    def test_parse_score_of_ex_score_week(self):
+        """
+        Use the biggest number that could be an EX score, not the money score.
+        """
+
+        text = '998,760\nMARVELOUS 412\nPERFECT 12\nEX 1,234\nMAX COMBO 430'
+        self.assertEqual(ocr.parse_score(text, models.ScoreType.EX), 1234)
+
+    def test_parse_score_without_numbers_returns_none(self):
+        self.assertIsNone(ocr.parse_score('STAGE CLEARED'))
+
+    def test_save_ocr_score_flags_mismatch(self):
+        """
+        Store the score read from the picture beside the claimed score.
+        """
+
+        first, _ = self.student.add_submission(1000, 'url1')
+        second, _ = self.student.add_submission(2000, 'url2')
+        # the same picture again
+        self.student.add_submission(3000, 'url2')
+
+        models.save_ocr_score(first.id, 1000)
+        models.save_ocr_score(second.id, 2500)
+
+        subms = self.student.submission_set.order_by('score')
+        self.assertEqual([s.ocr_score for s in subms], [1000, 2500, None])
+        self.assertEqual([s.score_matches_picture for s in subms], [True, False, None])
+
+    def test_score_reader_skips_when_queue_is_full(self):
+        """
+        Skip checking pictures instead of waiting when the queue is full.
+        """
+
+        reader = ocr.ScoreReader(queue_size=1)
+        attachment = SimpleNamespace(proxy_url='url')
+
+        self.assertTrue(reader.submit(attachment, models.ScoreType.MONEY, 1))
+        self.assertFalse(reader.submit(attachment, models.ScoreType.MONEY, 2))
+        self.assertEqual(reader.skipped, 1)
+        self.assertEqual(reader.queue.qsize(), 1)
+
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        week1 = models.Challenge.objects.create(week=1, name='Paranoia Survivor')
+        week2 = models.Challenge.objects.create(week=2, name='MAX 300')
+
+        self.keeks = models.Student.objects.create(
+            discord_snowflake_id=1,
+            discord_name='tropikiko#7800',
+            ddr_name='KEEKSTER',
+        )
+        self.other = models.Student.objects.create(
+            discord_snowflake_id=2,
+            discord_name='someone#1234',
+            ddr_name='AFRO',
+            twitter='afrotweets',
+        )
+
+        self.keeks_subm = self.keeks.submission_set.create(challenge=week1, score=1, pic_url='url')
+        self.other_subm = self.other.submission_set.create(challenge=week2, score=2, pic_url='url')
+
+    def search(self, model, term):
+        model_admin = admin_site._registry[model]
+        req = self.factory.get('/', {'q': term})
+        results, _ = model_admin.get_search_results(req, model.objects.all(), term)
+        return list(results)
+
+    def test_student_search_matches_part_of_a_name(self):
+        self.assertEqual(self.search(models.Student, 'keek'), [self.keeks])
+        self.assertEqual(self.search(models.Student, 'tweets'), [self.other])
+
+    def test_student_search_matches_approximately(self):
+        """
+        Find students even if the search has a typo in it.
+        """
+
+        self.assertEqual(self.search(models.Student, 'KEKSTER'), [self.keeks])
+
+    def test_submission_search_matches_student_or_challenge(self):
+        self.assertEqual(self.search(models.Submission, 'KEEKSTR'), [self.keeks_subm])
+        self.assertEqual(self.search(models.Submission, 'paranoya'), [self.keeks_subm])
+        self.assertEqual(self.search(models.Submission, '2'), [self.other_subm])
+        self.assertEqual(self.search(models.Submission, 'afro max'), [self.other_subm])
+        self.assertEqual(self.search(models.Submission, 'afro paranoia'), [])
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    DATABASE_REPLICA=None,
+)
+class SubmissionFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.week1 = models.Challenge.objects.create(week=1, name='week1')
+        self.student = models.Student.objects.create(
+            discord_snowflake_id=1,
+            discord_name='discord#1234',
+            ddr_name='KEEKSTER',
+            level=models.LevelPlacement.FRESHMAN,
+        )
+        self.student.save_score(100, 'url')
+        self.student.save_score(200, 'url')
+
+    def test_submission_facets_are_cached(self):
+        facets = caches.submission_facets()
+        self.assertEqual(facets['challenge'], [(1, 'week1', 2)])
+        self.assertEqual(facets['level'], {models.LevelPlacement.FRESHMAN: 2})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(caches.submission_facets(), facets)
+
+    def test_submission_facets_are_invalidated_by_new_submissions(self):
+        caches.submission_facets()
+
+        models.Challenge.objects.create(week=2, name='week2')
+        self.student.save_score(300, 'url')
+
+        facets = caches.submission_facets()
+        self.assertEqual(facets['challenge'], [(2, 'week2', 1), (1, 'week1', 2)])
+        self.assertEqual(facets['level'], {models.LevelPlacement.FRESHMAN: 3})
+
+    def test_changelist_filters(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        url = reverse('admin:submissions_submission_changelist')
+
+        resp = self.client.get(url)
+        self.assertContains(resp, 'Week 1: week1 (2)')
+        self.assertContains(resp, 'Freshman (2)')
+        self.assertContains(resp, 'name="student"')
+
+        resp = self.client.get(url, {'student': 'KEKSTER', 'challenge__week__exact': 1})
+        self.assertEqual(resp.context['cl'].result_count, 2)
+
+        resp = self.client.get(url, {'student': 'nobody'})
+        self.assertEqual(resp.context['cl'].result_count, 0)
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    DATABASE_REPLICA=None,
+)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        weeks = [models.Challenge.objects.create(week=week, name=f'week{week}') for week in (1, 2)]
+        students = models.Student.objects.bulk_create([
+            models.Student(discord_snowflake_id=i, discord_name=f'student#{i}') for i in range(4)
+        ])
+        # lots of ties, so pages split rows that only differ by id
+        now = timezone.now()
+        models.Submission.objects.bulk_create([
+            models.Submission(
+                student=student, challenge=week, score=100 * (i % 2), level=level,
+                pic_url='url', submitted_at=now,
+            )
+            for week in weeks
+            for student in students
+            for level in ('FR', 'VA')
+            for i in range(2)
+        ])
+
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        self.url = reverse('admin:submissions_submission_changelist')
+        self.ordered = list(models.Submission.objects.order_by(
+            '-challenge', 'level', '-score', 'submitted_at', '-id',
+        ).values_list('id', flat=True))
+
+    def pages(self, query_string='', link='next_url'):
+        """The ids on each page, following `link` from the page at query_string."""
+
+        pages = []
+        while query_string is not None:
+            resp = self.client.get(self.url + query_string)
+            self.assertEqual(resp.status_code, 200)
+            pages.append([submission.id for submission in resp.context['cl'].result_list])
+            query_string = getattr(resp.context['cl'], link)
+        return pages
+
+    @patch.object(admin_site._registry[models.Submission], 'list_per_page', 5)
+    def test_pages_seek_through_every_row_in_order(self):
+        pages = self.pages()
+        self.assertEqual(len(pages), 7)
+        self.assertEqual(sum(pages, []), self.ordered)
+
+        # and back again from the last page
+        resp = self.client.get(self.url)
+        for _ in range(6):
+            resp = self.client.get(self.url + resp.context['cl'].next_url)
+        self.assertIsNone(resp.context['cl'].next_url)
+        backwards = self.pages(resp.context['cl'].previous_url, link='previous_url')
+        self.assertEqual(sum(reversed(backwards), []), self.ordered[:30])
+
+    @patch.object(admin_site._registry[models.Submission], 'list_per_page', 5)
+    def test_pages_keep_filters(self):
+        pages = self.pages('?level__exact=VA&challenge__week__exact=1')
+        self.assertEqual(
+            sum(pages, []),
+            list(models.Submission.objects.filter(level='VA', challenge=1).order_by(
+                'level', '-score', 'submitted_at', '-id',
+            ).values_list('id', flat=True)),
+        )
+
+    def test_pages_follow_sorted_columns(self):
+        # by student, then by score
+        everything, = self.pages('?o=3.-2')
+        with patch.object(admin_site._registry[models.Submission], 'list_per_page', 5):
+            pages = self.pages('?o=3.-2')
+        self.assertEqual(len(pages), 7)
+        self.assertEqual(sum(pages, []), everything)
+
+    def test_only_columns_can_be_seeked(self):
+        cl = self.client.get(self.url).context['cl']
+        self.assertTrue(cl.keyset_paged)
+        self.assertIsNone(cl.keyset(['student__discord_name', '-pk']))
+        self.assertIsNone(cl.keyset(['ocr_score', '-pk']))
+
+    def test_counts_are_estimated_when_there_are_lots(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.context['cl'].result_count, 32)
+        self.assertFalse(resp.context['cl'].result_count_estimated)
+
+        with override_settings(ESTIMATED_COUNT_THRESHOLD=0):
+            resp = self.client.get(self.url)
+        self.assertTrue(resp.context['cl'].result_count_estimated)
+        self.assertContains(resp, 'about ')
+
+    def test_bad_cursor_is_an_error(self):
+        resp = self.client.get(self.url, {'after': 'nonsense'})
+        self.assertRedirects(resp, self.url + '?e=1')
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    DATABASE_REPLICA=None,
+)
+class StudentAdminTests(TestCase):
+    def setUp(self):
+        old_week = models.Challenge.objects.create(
+            week=1,
+            name='week1',
+            is_open=False,
+            closed_at=timezone.now() - timedelta(days=60),
+        )
+        week = models.Challenge.objects.create(week=2, name='week2')
+        self.student = models.Student.objects.create(discord_snowflake_id=1, discord_name='a#1')
+        self.newbie = models.Student.objects.create(discord_snowflake_id=2, discord_name='b#2')
+        for score in (300, 100):
+            self.student.submission_set.create(challenge=old_week, score=score, pic_url='url')
+        self.latest = self.student.submission_set.create(challenge=week, score=200, pic_url='url')
+        archive.archive_closed_weeks(after_days=28)
+
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+    def test_submission_activity(self):
+        activity = models.submission_activity([self.student.id, self.newbie.id])
+        self.assertEqual(activity, {
+            self.student.id: {'submissions': 3, 'weeks': 2, 'latest': self.latest.submitted_at, 'best': 300},
+        })
+
+    def test_changelist_shows_activity(self):
+        resp = self.client.get(reverse('admin:submissions_student_changelist'))
+        students = {student.id: student for student in resp.context['cl'].result_list}
+
+        self.assertEqual(students[self.student.id].activity['submissions'], 3)
+        self.assertEqual(students[self.newbie.id].activity, {})
+        self.assertContains(resp, 'Weeks taken part')
+
+    def test_change_page_shows_activity(self):
+        resp = self.client.get(reverse('admin:submissions_student_change', args=[self.student.id]))
+        self.assertContains(resp, 'Best score (all time)')
+        self.assertEqual(resp.context['original'].activity['best'], 300)
+
+def make_submissions(students, weeks, per_week):
+    """Some closed weeks and an open one, with every student submitting
+    `per_week` times each week. Closed weeks are archived, rated, and get a
+    (made up) compaction."""
+
+    closed_at = timezone.now() - timedelta(days=60)
+    challenges = models.Challenge.objects.bulk_create([
+        models.Challenge(week=week, name=f'week{week}', is_open=False, closed_at=closed_at)
+        for week in range(1, weeks)
+    ] + [
+        models.Challenge(week=weeks, name=f'week{weeks}'),
+    ])
+    students = models.Student.objects.bulk_create([
+        models.Student(
+            discord_snowflake_id=i,
+            discord_name=f'student#{i}',
+            ddr_name=f'DDR{i}',
+            level=models.LevelPlacement.FRESHMAN,
+        )
+        for i in range(1, students + 1)
+    ])
+    models.Submission.objects.bulk_create([
+        models.Submission(
+            student=student,
+            challenge=challenge,
+            score=100 * i,
+            pic_url='url',
+            level=student.level,
+        )
+        for challenge in challenges
+        for student in students
+        for i in range(1, per_week + 1)
+    ])
+    archive.archive_closed_weeks(after_days=28)
+    ratings.update_ratings()
+    for challenge in challenges[:-1]:
+        models.Compaction.objects.create(challenge=challenge, keep_latest=1, submission_count=1, data=b'')
+
+# (students, weeks, submissions per student each week)
+FIXTURE_SIZES = [(2, 2, 2), (25, 4, 6)]
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    DATABASE_REPLICA=None,
+)
+class AdminQueryBudgetTests(TestCase):
+    """How many queries each admin page makes, which mustn't grow with the data.
+
+    Each page is loaded with a small and a large set of data (FIXTURE_SIZES),
+    and has to make the same number of queries both times, no more than its
+    budget. Bump a budget on purpose, never to make a test pass.
+    """
+
+    # (url name, object to change or None, query string, max queries)
+    BUDGETS = [
+        ('admin:submissions_student_changelist', None, {}, 6),
+        ('admin:submissions_student_change', 'student', {}, 9),
+        ('admin:submissions_challenge_changelist', None, {}, 6),
+        ('admin:submissions_challenge_change', 'challenge', {}, 6),
+        ('admin:submissions_submission_changelist', None, {}, 7),
+        ('admin:submissions_submission_changelist', None, {'leaderboard': 'true'}, 7),
+        ('admin:submissions_submission_changelist', None, {'challenge__week__exact': 1}, 7),
+        ('admin:submissions_submission_change', 'submission', {}, 8),
+        ('admin:submissions_submissionhistory_changelist', None, {}, 6),
+        ('admin:submissions_submissionhistory_change', 'submissionhistory', {}, 7),
+        ('admin:submissions_compaction_changelist', None, {}, 6),
+        ('admin:submissions_compaction_change', 'compaction', {}, 6),
+        ('admin:submissions_ratingchange_changelist', None, {}, 6),
+        ('admin:submissions_ratingchange_change', 'ratingchange', {}, 7),
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def count_queries(self, url_name, obj, params):
+        # objects from the end of the data, eg. a week with lots of submissions
+        objects = {
+            'student': models.Student.objects.last,
+            'challenge': models.Challenge.objects.first,
+            'submission': models.Submission.objects.last,
+            'submissionhistory': models.SubmissionHistory.objects.filter(archived=True).last,
+            'compaction': models.Compaction.objects.last,
+            'ratingchange': models.RatingChange.objects.last,
+        }
+        url = reverse(url_name, args=[objects[obj]().pk] if obj else [])
+
+        self.client.force_login(self.user)
+        # once to fill process-wide caches (eg. content types), which would
+        # only make the first fixture's count higher
+        self.client.get(url, params)
+
+        cache.clear()
+        with CaptureQueriesContext(connections['default']) as queries:
+            resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+        return len(queries)
+
+    def test_admin_pages_stay_within_query_budgets(self):
+        counts = [[] for _ in self.BUDGETS]
+        for size in FIXTURE_SIZES:
+            models.Compaction.objects.all().delete()
+            models.RatingChange.objects.all().delete()
+            models.Submission.objects.all().delete()
+            models.ArchivedSubmission.objects.all().delete()
+            models.Student.objects.all().delete()
+            models.Challenge.objects.all().delete()
+            make_submissions(*size)
+
+            for (url_name, obj, params, _), page_counts in zip(self.BUDGETS, counts):
+                page_counts.append(self.count_queries(url_name, obj, params))
+
+        for (url_name, obj, params, budget), page_counts in zip(self.BUDGETS, counts):
+            with self.subTest(page=url_name, params=params):
+                self.assertEqual(len(set(page_counts)), 1, f'query count grows with the data: {page_counts}')
+                self.assertLessEqual(page_counts[0], budget)
+
+class CurrentChallengeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_current_challenge_is_cached(self):
+        self.assertIsNone(caches.current_challenge())
+
+        models.Challenge.objects.create(week=1, name='week1')
+        week2 = models.Challenge.objects.create(week=2, name='week2')
+        self.assertEqual(caches.current_challenge(), week2)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(caches.current_challenge(), week2)
+
+    def test_current_challenge_is_invalidated_by_changes(self):
+        week1 = models.Challenge.objects.create(week=1, name='week1')
+        self.assertTrue(caches.current_challenge().is_open)
+
+        week1.close()
+        self.assertFalse(caches.current_challenge().is_open)
+
+    def test_warm_up_loads_current_challenge(self):
+        week1 = models.Challenge.objects.create(week=1, name='week1')
+
+        self.assertEqual(caches.warm_up(), week1)
+        with self.assertNumQueries(0):
+            caches.current_challenge()
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.week1 = models.Challenge.objects.create(week=1, name='week1')
+
+    def make_student(self, id, level, ddr_name=''):
+        return models.Student.objects.create(
+            discord_snowflake_id=id,
+            discord_name=f'discord#{id}',
+            ddr_name=ddr_name,
+            level=level,
+        )
+
+    def test_leaderboards_by_division(self):
+        a = self.make_student(1, models.LevelPlacement.FRESHMAN, 'AAA')
+        b = self.make_student(2, models.LevelPlacement.FRESHMAN)
+        c = self.make_student(3, models.LevelPlacement.FRESHMAN, 'CCC')
+        d = self.make_student(4, models.LevelPlacement.VARSITY, 'DDD')
+        a.save_score(100, 'url')
+        a.save_score(300, 'url')
+        b.save_score(200, 'url')
+        c.save_score(300, 'url')
+        d.save_score(50, 'url')
+
+        boards = leaderboards.leaderboards(1)
+
+        self.assertEqual(boards, [
+            (models.LevelPlacement.VARSITY, [(1, 'DDD', 50)]),
+            (models.LevelPlacement.FRESHMAN, [
+                (1, 'AAA', 300),
+                (1, 'CCC', 300),
+                (3, 'discord#2', 200),
+            ]),
+        ])
+
+    def test_render_leaderboard(self):
+        image = leaderboards.render_leaderboard('Week 1: week1 - Freshman', [(1, 'AAA', 300)])
+        self.assertTrue(image.startswith(b'\x89PNG'))
+
+    def test_render_leaderboard_without_fonts(self):
+        from PIL import Image, ImageChops, ImageFont
+
+        # scores are right-aligned even with the fallback (bitmap) font
+        # (newer Pillows' load_default is a TrueType font)
+        bitmap_font = getattr(ImageFont, 'load_default_imagefont', ImageFont.load_default)()
+        with patch.object(ImageFont, 'truetype', side_effect=OSError), \
+                patch.object(ImageFont, 'load_default', return_value=bitmap_font):
+            image = Image.open(BytesIO(leaderboards.render_leaderboard('Week 1', [(1, 'AAA', 987_654)])))
+
+        score_row = image.crop((300, 24 + 32 * 2, image.width, 24 + 32 * 3))
+        left, _, right, _ = ImageChops.invert(score_row.convert('L')).getbbox()
+        self.assertLessEqual(right, image.width - 300 - 24)
+        self.assertGreater(right, image.width - 300 - 24 - 5)
+        self.assertGreater(left, 0)
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.student = models.Student.objects.create(discord_snowflake_id=1, discord_name='a#1')
+        self.other = models.Student.objects.create(discord_snowflake_id=2, discord_name='b#2')
+
+        self.old_week = models.Challenge.objects.create(
+            week=1,
+            name='old',
+            is_open=False,
+            closed_at=timezone.now() - timedelta(days=60),
+        )
+        self.recent_week = models.Challenge.objects.create(
+            week=2,
+            name='recent',
+            is_open=False,
+            closed_at=timezone.now() - timedelta(days=1),
+        )
+
+        for week in (self.old_week, self.recent_week):
+            for score in (100, 300, 200):
+                self.student.submission_set.create(challenge=week, score=score, pic_url='url')
+            self.other.submission_set.create(challenge=week, score=50, pic_url='url')
+
+    def test_close_and_open_track_closed_at(self):
+        challenge = models.Challenge.objects.create(week=3, name='new')
+        self.assertIsNone(challenge.closed_at)
+
+        challenge.close()
+        self.assertIsNotNone(challenge.closed_at)
+
+        challenge.open()
+        self.assertIsNone(challenge.closed_at)
+
+    def test_best_submissions(self):
+        best = models.best_submissions()
+        self.assertEqual(
+            sorted((s.challenge_id, s.student_id, s.score) for s in best),
+            [
+                (1, self.student.id, 300), (1, self.other.id, 50),
+                (2, self.student.id, 300), (2, self.other.id, 50),
+            ],
+        )
+
+    def test_archive_keeps_best_submissions_for_old_weeks(self):
+        archived = archive.archive_closed_weeks(after_days=28)
+        self.assertEqual(archived, 2)
+
+        old_scores = models.Submission.objects.filter(challenge=self.old_week).values_list('score', flat=True)
+        self.assertCountEqual(old_scores, [300, 50])
+        self.assertEqual(models.Submission.objects.filter(challenge=self.recent_week).count(), 4)
+
+        archived_scores = models.ArchivedSubmission.objects.values_list('challenge', 'score')
+        self.assertCountEqual(archived_scores, [(1, 100), (1, 200)])
+
+    def test_submission_history_includes_archived_submissions(self):
+        ids = set(models.Submission.objects.values_list('id', flat=True))
+        archive.archive_closed_weeks(after_days=28)
+
+        history = models.SubmissionHistory.objects.all()
+        self.assertEqual({s.id for s in history}, ids)
+        self.assertEqual(history.filter(archived=True).count(), 2)
+        self.assertEqual(history.filter(challenge=self.old_week, student=self.student).count(), 3)
+
+class ChallengeStatsTests(TestCase):
+    def setUp(self):
+        self.week = models.Challenge.objects.create(week=1, name='week1')
+        self.freshman = models.Student.objects.create(discord_snowflake_id=1, level=models.LevelPlacement.FRESHMAN)
+        self.varsity = models.Student.objects.create(discord_snowflake_id=2, level=models.LevelPlacement.VARSITY)
+        for score in (100, 300):
+            self.freshman.save_score(score, 'url')
+        self.varsity.save_score(500, 'url')
+
+    def week_stats(self):
+        self.week.refresh_from_db()
+        return stats.challenge_stats([self.week])[1]
+
+    def test_stats(self):
+        week = self.week_stats()
+        self.assertEqual(
+            (week[None].participants, week[None].submissions, week[None].top_score, week[None].median_score),
+            (2, 3, 500, 300),
+        )
+        self.assertEqual((week['FR'].participants, week['FR'].median_score), (1, 200))
+        self.assertFalse(week[None].final)
+
+    def test_score_distribution(self):
+        # of each student's best score: 300 and 500
+        row = self.week_stats()[None]
+        self.assertEqual((row.mean_best_score, row.stddev_best_score), (400, 100))
+        self.assertEqual(row.percentiles, [320, 350, 400, 450, 480])
+        # the bars split 300 to 500
+        self.assertEqual(row.histogram, [1] + [0] * 8 + [1])
+        self.assertEqual(row.histogram_bounds, [300 + 21 * i for i in range(models.HISTOGRAM_BARS)])
+
+        self.varsity.save_score(999_000, 'url')
+        with override_settings(STATS_REFRESH_SECONDS=0):
+            week = self.week_stats()
+        self.assertEqual(week[None].histogram, [1] + [0] * 8 + [1])
+        self.assertEqual(week['VA'].percentiles, [999_000] * len(models.PERCENTILES))
+
+    def test_histogram_fits_ex_scores(self):
+        ex_week = models.Challenge.objects.create(week=2, name='EX week')
+        for i in range(10):
+            student = models.Student.objects.create(discord_snowflake_id=100 + i, level=models.LevelPlacement.VARSITY)
+            student.save_score(2000 + 100 * i, 'url')
+
+        row = stats.challenge_stats([ex_week])[2][None]
+        self.assertEqual(row.histogram, [1] * models.HISTOGRAM_BARS)
+        self.assertEqual(row.histogram_bounds, [2000 + 91 * i for i in range(models.HISTOGRAM_BARS)])
+
+    def test_stats_are_updated_by_new_submissions(self):
+        self.week_stats()
+
+        # saving it, updating its division's and week's stats in one go, and
+        # telling the other processes
+        with self.assertNumQueries(3):
+            self.freshman.submission_set.create(challenge=self.week, score=700, pic_url='url', level='FR')
+        newbie = models.Student.objects.create(discord_snowflake_id=3, level=models.LevelPlacement.FRESHMAN)
+        newbie.submission_set.create(challenge=self.week, score=50, pic_url='url', level='FR')
+
+        # the counts are up to date, and the rest waits to be recomputed
+        with self.assertNumQueries(1):
+            week = stats.challenge_stats([self.week])[1]
+        self.assertEqual(
+            (week[None].participants, week[None].submissions, week[None].top_score, week[None].mean_best_score),
+            (3, 5, 700, 400),
+        )
+        self.assertEqual((week['FR'].participants, week['FR'].submissions), (2, 4))
+        self.assertIsNotNone(week[None].stale_since)
+
+        with override_settings(STATS_REFRESH_SECONDS=0):
+            week = self.week_stats()
+        self.assertEqual(week[None].participants, 3)
+        self.assertAlmostEqual(week[None].mean_best_score, 1250 / 3)
+        self.assertIsNone(week[None].stale_since)
+
+    def test_first_submission_in_division_doesnt_recompute_stats(self):
+        self.week_stats()
+
+        # saving it, finding its division has no stats yet, dropping the
+        # week's, and telling the other processes
+        graduate = models.Student.objects.create(discord_snowflake_id=3, level=models.LevelPlacement.GRADUATE)
+        with self.assertNumQueries(4):
+            graduate.submission_set.create(challenge=self.week, score=800, pic_url='url', level='GR')
+
+        week = self.week_stats()
+        self.assertEqual((week['GR'].participants, week['GR'].top_score), (1, 800))
+        self.assertEqual(week[None].participants, 3)
+
+    def test_score_distribution_of_student_changing_division(self):
+        # moved up midweek, with a lower score than their best as a freshman
+        self.freshman.level = models.LevelPlacement.JUNIOR_VARSITY
+        self.freshman.save()
+        self.freshman.save_score(200, 'url')
+
+        week = self.week_stats()
+        self.assertEqual((week['JV'].participants, week['JV'].mean_best_score), (1, 200))
+        self.assertEqual(week['JV'].percentiles, [200] * len(models.PERCENTILES))
+        self.assertEqual(week['JV'].histogram, [1] + [0] * (models.HISTOGRAM_BARS - 1))
+        self.assertEqual(week['JV'].histogram_bounds, list(range(200, 200 + models.HISTOGRAM_BARS)))
+        self.assertEqual(week['FR'].mean_best_score, 300)
+        self.assertEqual(week[None].mean_best_score, 400)
+
+        self.week.stats = week
+        table = admin_site._registry[models.Challenge].score_distribution(self.week)
+        self.assertIn('<td>JV</td><td>1</td><td>200</td>', table)
+
+    def test_closed_week_stats_are_final(self):
+        self.week.close()
+        self.assertTrue(all(row.final for row in self.week_stats().values()))
+
+        self.freshman.submission_set.create(challenge=self.week, score=900, pic_url='url')
+        self.assertEqual(self.week_stats()[None].top_score, 500)
+
+        self.week.open()
+        self.freshman.submission_set.create(challenge=self.week, score=900, pic_url='url')
+        self.assertEqual(self.week_stats()[None].top_score, 900)
+
+    def test_one_stats_row_per_division_and_week(self):
+        week = self.week_stats()
+        for level in ('FR', None):
+            row = week[level]
+            row.pk = None
+            with self.subTest(level=level), self.assertRaises(IntegrityError), transaction.atomic():
+                row.save()
+
+        stats.refresh_stats([self.week])
+        self.assertEqual(models.ChallengeStats.objects.count(), 3)
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+        DATABASE_REPLICA=None,
+    )
+    def test_challenge_changelist_shows_stats(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        resp = self.client.get(reverse('admin:submissions_challenge_changelist'))
+        self.assertContains(resp, '2 (VA 1, FR 1)')
+
+        resp = self.client.get(reverse('admin:submissions_challenge_change', args=[1]))
+        self.assertContains(resp, '<th>p90</th>', html=True)
+        self.assertContains(resp, '<td>400</td>', html=True)
+        self.assertContains(resp, 'title="300-320: 1"')
+        self.assertContains(resp, 'title="489+: 1"')
+
+class LiveLeaderboardTests(TransactionTestCase):
+    def setUp(self):
+        self.week = models.Challenge.objects.create(week=1, name='week1')
+        self.student = models.Student.objects.create(discord_snowflake_id=1, ddr_name='KEEKSTER', level='FR')
+        self.student.save_score(100, 'url')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+
+    def communicator(self, user):
+        communicator = WebsocketCommunicator(live.LeaderboardConsumer.as_asgi(), '/ws/leaderboard/1/')
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'week': 1}}
+        return communicator
+
+    async def test_sends_board_then_new_scores(self):
+        communicator = self.communicator(self.staff)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        try:
+            self.assertEqual(await communicator.receive_json_from(), {
+                'type': 'board',
+                'rows': [{'student': self.student.id, 'name': 'KEEKSTER', 'level': 'FR', 'score': 100}],
+            })
+
+            # saved (and committed) like the bot does, in another connection
+            self.assertTrue(await database_sync_to_async(bus.bus.wait_until_listening)(5))
+            await database_sync_to_async(self.student.save_score)(300, 'url')
+            self.assertEqual(await communicator.receive_json_from(timeout=5), {
+                'type': 'score', 'week': 1, 'student': self.student.id, 'name': 'KEEKSTER', 'level': 'FR', 'score': 300,
+            })
+        finally:
+            await communicator.disconnect()
+            bus.bus.stop()
+
+    async def test_staff_only(self):
+        user = await database_sync_to_async(User.objects.create_user)('student')
+        connected, _ = await self.communicator(user).connect()
+        self.assertFalse(connected)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_live_leaderboard_page(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        resp = self.client.get(reverse('admin:submissions_challenge_live', args=[1]))
+        self.assertContains(resp, '/ws/leaderboard/1/')
+
+class BusTests(TransactionTestCase):
+    def setUp(self):
+        self.bus = bus.Bus()
+        self.events = []
+        self.received = threading.Event()
+
+        def handler(event):
+            self.events.append(event)
+            self.received.set()
+
+        self.bus.subscribe(bus.ChallengeChanged, handler)
+        self.bus.subscribe(bus.SubmissionsChanged, handler)
+
+    def test_deliver(self):
+        self.bus.deliver('{"type": "SubmissionsChanged", "week": 3}')
+        # from a newer version
+        self.bus.deliver('{"type": "SomethingElse", "week": 3}')
+        self.assertEqual(self.events, [bus.SubmissionsChanged(3)])
+
+    def test_bad_payloads_are_skipped(self):
+        self.bus.deliver('{"type": "SubmissionsChan')
+        self.bus.deliver('["SubmissionsChanged", 3]')
+        # with fields from a different version
+        self.bus.deliver('{"type": "SubmissionsChanged", "weeks": [3]}')
+        self.bus.deliver('{"type": "SubmissionsChanged", "week": 3}')
+        self.assertEqual(self.events, [bus.SubmissionsChanged(3)])
+
+    def test_listener_restarts_after_errors(self):
+        self.bus.retry_delay = 0
+        reconnects = []
+        reconnected = threading.Semaphore(0)
+        self.bus.subscribe(bus.Reconnected, lambda event: (reconnects.append(event), reconnected.release()))
+
+        deliver = self.bus.deliver
+        failures = [ValueError('oops')]
+        def flaky_deliver(payload):
+            if failures:
+                raise failures.pop()
+            deliver(payload)
+        self.bus.deliver = flaky_deliver
+
+        self.bus.start()
+        try:
+            self.assertTrue(reconnected.acquire(timeout=5))
+            models.Challenge.objects.create(week=1, name='week1')
+            # the listener died delivering that, and started again
+            self.assertTrue(reconnected.acquire(timeout=5))
+            models.Challenge.objects.create(week=2, name='week2')
+            self.assertTrue(self.received.wait(5))
+            self.assertEqual(self.events, [bus.ChallengeChanged(2)])
+            self.assertEqual(len(reconnects), 2)
+        finally:
+            self.bus.stop()
+
+    def test_handler_errors_are_caught(self):
+        self.bus.subscribe(bus.SubmissionsChanged, lambda event: 1 / 0)
+        self.bus.handle(bus.SubmissionsChanged(None))
+        self.assertEqual(self.events, [bus.SubmissionsChanged(None)])
+
+    def test_events_reach_other_processes_on_commit(self):
+        self.bus.start()
+        try:
+            self.assertTrue(self.bus.wait_until_listening(5))
+            with transaction.atomic():
+                models.Challenge.objects.create(week=1, name='week1')
+                self.assertFalse(self.received.wait(0.2))
+            self.assertTrue(self.received.wait(5))
+            self.assertEqual(self.events, [bus.ChallengeChanged(1)])
+        finally:
+            self.bus.stop()
+
+    def test_clears_caches(self):
+        challenge = models.Challenge.objects.create(week=1, name='week1')
+        self.assertEqual(caches.current_challenge(), challenge)
+        # changed by another process, which doesn't clear this one's cache
+        models.Challenge.objects.filter(week=1).update(is_open=False)
+        self.assertTrue(caches.current_challenge().is_open)
+
+        bus.bus.handle(bus.ChallengeChanged(1))
+        self.assertFalse(caches.current_challenge().is_open)
+
+class RatingTests(TestCase):
+    def setUp(self):
+        self.week1 = models.Challenge.objects.create(week=1, name='week1')
+        self.students = [
+            models.Student.objects.create(discord_snowflake_id=i, level=models.LevelPlacement.FRESHMAN)
+            for i in range(3)
+        ]
+        self.varsity = models.Student.objects.create(discord_snowflake_id=3, level=models.LevelPlacement.VARSITY)
+        for student, score in zip(self.students + [self.varsity], (300, 200, 100, 900)):
+            student.save_score(score, 'url')
+
+    def ratings(self):
+        return {
+            student.discord_snowflake_id: student.rating
+            for student in models.Student.objects.order_by('discord_snowflake_id')
+        }
+
+    def test_match_changes(self):
+        self.assertEqual(ratings.match_changes([(1500, 200), (1500, 100)], k=32), [16, -16])
+        self.assertEqual(ratings.match_changes([(1500, 100), (1500, 100)], k=32), [0, 0])
+        self.assertEqual(ratings.match_changes([(1500, 100)], k=32), [0])
+        # an upset moves ratings more
+        upset, = ratings.match_changes([(1300, 200), (1700, 100)], k=32)[:1]
+        self.assertGreater(upset, 16)
+
+    def test_big_match_changes(self):
+        # everyone against everyone, like smaller matches
+        players = [(1000 + (i * 37) % 900, (i * 53) % 150) for i in range(ratings.PAIRWISE_PLAYERS * 3)]
+        pairwise = [
+            32 * sum(
+                (1 if score > other_score else 0.5 if score == other_score else 0) - ratings.expected_result(rating, other_rating)
+                for j, (other_rating, other_score) in enumerate(players) if i != j
+            ) / (len(players) - 1)
+            for i, (rating, score) in enumerate(players)
+        ]
+        for change, expected in zip(ratings.match_changes(players, k=32), pairwise):
+            self.assertAlmostEqual(change, expected)
+
+    def test_closing_a_week_rates_it(self):
+        self.assertEqual(self.ratings(), {0: None, 1: None, 2: None, 3: None})
+
+        self.week1.close()
+        after = self.ratings()
+        self.assertGreater(after[0], 1500)
+        self.assertEqual(after[1], 1500)
+        self.assertLess(after[2], 1500)
+        self.assertAlmostEqual(after[0] + after[1] + after[2], 3 * 1500)
+        # alone in their division
+        self.assertEqual(after[3], 1500)
+
+        changes = models.RatingChange.objects.filter(level=models.LevelPlacement.FRESHMAN)
+        self.assertEqual([(c.rank, c.players, c.rating_before) for c in changes], [(1, 3, None), (2, 3, None), (3, 3, None)])
+
+    def test_weeks_are_rated_from_the_ones_before(self):
+        self.week1.close()
+        after_week1 = self.ratings()
+
+        week2 = models.Challenge.objects.create(week=2, name='week2')
+        # the loser wins this time
+        for student, score in zip(self.students, (100, 200, 300)):
+            student.save_score(score, 'url')
+        week2.close()
+
+        changes = {c.student.discord_snowflake_id: c for c in models.RatingChange.objects.filter(challenge=week2).select_related('student')}
+        self.assertEqual(changes[2].rating_before, after_week1[2])
+        self.assertEqual(changes[2].rank, 1)
+        self.assertAlmostEqual(self.ratings()[2], after_week1[2] + ratings.match_changes([
+            (after_week1[0], 100), (after_week1[1], 200), (after_week1[2], 300),
+        ])[2])
+
+    def test_reopening_a_week_undoes_it(self):
+        self.week1.close()
+        week2 = models.Challenge.objects.create(week=2, name='week2')
+        self.students[2].save_score(500, 'url')
+        self.students[0].save_score(400, 'url')
+        week2.close()
+        rated = self.ratings()
+
+        # an old week reopened, changed and closed again
+        self.week1.open()
+        self.assertFalse(models.RatingChange.objects.filter(challenge=self.week1).exists())
+        self.assertTrue(models.RatingChange.objects.filter(challenge=week2).exists())
+        self.week1.close()
+        self.assertEqual(self.ratings(), rated)
+
+        week2.open()
+        self.assertEqual(models.RatingChange.objects.filter(challenge=week2).count(), 0)
+        self.assertEqual(self.ratings()[2], models.RatingChange.objects.get(challenge=self.week1, student=self.students[2]).rating_after)
+
+    def test_rebuild(self):
+        self.week1.close()
+        rated = self.ratings()
+        models.Student.objects.update(rating=None)
+
+        out = StringIO()
+        call_command('updateratings', '--rebuild', stdout=out)
+        self.assertEqual(out.getvalue(), 'Week 1: rated 4 students\n')
+        self.assertEqual(self.ratings(), rated)
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+        DATABASE_REPLICA=None,
+    )
+    def test_admin_shows_ratings(self):
+        self.week1.close()
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        resp = self.client.get(reverse('admin:submissions_student_change', args=[self.students[0].id]))
+        self.assertContains(resp, '<polyline')
+        self.assertContains(resp, 'ranked 1 of 3')
+
+        resp = self.client.get(reverse('admin:submissions_ratingchange_changelist'))
+        self.assertContains(resp, '+16')
+
+class CompactionTests(TestCase):
+    def setUp(self):
+        self.student = models.Student.objects.create(discord_snowflake_id=1, discord_name='a#1')
+        self.other = models.Student.objects.create(discord_snowflake_id=2, discord_name='b#2')
+        self.week = models.Challenge.objects.create(
+            week=1,
+            name='old',
+            is_open=False,
+            closed_at=timezone.now() - timedelta(days=30),
+        )
+        self.open_week = models.Challenge.objects.create(week=2, name='new')
+
+        for week in (self.week, self.open_week):
+            for score in (500, 100, 200, 300, 400):
+                self.student.submission_set.create(challenge=week, score=score, pic_url='url')
+            self.other.submission_set.create(challenge=week, score=50, pic_url='url')
+
+    def scores(self, week):
+        return sorted(
+            models.SubmissionHistory.objects.filter(challenge=week).values_list('score', flat=True)
+        )
+
+    def test_keeps_best_and_latest_submissions(self):
+        compactions = archive.compact_closed_weeks(after_days=7, keep_latest=2)
+
+        self.assertEqual(len(compactions), 1)
+        self.assertEqual(compactions[0].challenge, self.week)
+        self.assertEqual(compactions[0].submission_count, 2)
+        self.assertEqual(self.scores(self.week), [50, 300, 400, 500])
+        self.assertEqual(self.scores(self.open_week), [50, 100, 200, 300, 400, 500])
+
+        compaction = models.Compaction.objects.get()
+        self.assertEqual(
+            [(subm['score'], subm['student_id'], subm['archived']) for subm in compaction.submissions()],
+            [(100, self.student.id, False), (200, self.student.id, False)],
+        )
+
+        # nothing left to compact
+        self.assertEqual(archive.compact_closed_weeks(after_days=7, keep_latest=2), [])
+
+    def test_compacts_archived_submissions(self):
+        archive.archive_closed_weeks(after_days=7)
+        archive.compact_closed_weeks(after_days=7, keep_latest=1)
+
+        self.assertEqual(self.scores(self.week), [50, 400, 500])
+        self.assertEqual(models.ArchivedSubmission.objects.get().score, 400)
+        self.assertEqual(models.Compaction.objects.get().submission_count, 3)
+
+    def test_compact_command(self):
+        out = StringIO()
+        call_command('compactsubmissions', '--keep', '0', stdout=out)
+        self.assertIn('Week 1: compacted 4 submissions', out.getvalue())
+        self.assertEqual(self.scores(self.week), [50, 500])
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+        DATABASE_REPLICA=None,
+    )
+    def test_compaction_admin(self):
+        compaction, = archive.compact_closed_weeks(after_days=7, keep_latest=2)
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        resp = self.client.get(reverse('admin:submissions_compaction_changelist'))
+        self.assertContains(resp, 'Download')
+
+        resp = self.client.get(reverse('admin:submissions_compaction_download', args=[compaction.pk]))
+        self.assertEqual(
+            resp['Content-Disposition'],
+            f'attachment; filename="week1-compaction{compaction.pk}.jsonl.gz"',
+        )
+        self.assertEqual(resp.content, bytes(compaction.data))
+
+class ReportTests(TestCase):
+    def setUp(self):
+        self.week1 = models.Challenge.objects.create(week=1, name='week1', is_open=False)
+        self.week2 = models.Challenge.objects.create(week=2, name='week2')
+        self.veteran = models.Student.objects.create(
+            discord_snowflake_id=1,
+            discord_name='vet#1',
+            ddr_name='VET',
+            level=models.LevelPlacement.VARSITY,
+        )
+        self.rookie = models.Student.objects.create(
+            discord_snowflake_id=2,
+            discord_name='rookie#2',
+            level=models.LevelPlacement.FRESHMAN,
+        )
+
+        self.veteran.submission_set.create(challenge=self.week1, score=500, pic_url='url', level='VA')
+        for score in (100, 400, 300, 900):
+            self.veteran.submission_set.create(challenge=self.week2, score=score, pic_url='url', level='VA')
+        self.rookie.submission_set.create(challenge=self.week2, score=50, pic_url='url', level='FR')
+
+    def test_week_report(self):
+        text = ''.join(reports.report([2]))
+
+        self.assertIn('# Week 2', text)
+        self.assertIn('| 2 | week2 | Freshman | 1 | 1 |', text)
+        self.assertIn('| 2 | week2 | Varsity | 1 | 4 |', text)
+        # new students
+        self.assertIn('| 2 | rookie#2 |', text)
+        self.assertNotIn('| 2 | VET |\n', text)
+        # submitted more than once
+        self.assertIn('| 2 | VET | 4 | 100 | 900 |', text)
+        # upscores
+        self.assertEqual(
+            text.split('## Biggest upscores')[1].strip().splitlines()[2:],
+            ['| 2 | VET | 400 | 900 | +500 |', '| 2 | VET | 100 | 400 | +300 |'],
+        )
+
+    def test_season_report_as_csv(self):
+        # archived submissions are still reported
+        self.week2.close()
+        self.assertEqual(archive.archive_closed_weeks(after_days=0), 3)
+
+        rows = list(csv.reader(''.join(reports.report([1, 2], 'csv', top=1)).splitlines()))
+
+        self.assertEqual(rows[0], ['Weeks 1-2'])
+        self.assertIn(['1', 'week1', 'Varsity', '1', '1'], rows)
+        self.assertIn(['1', 'VET'], rows)
+        self.assertIn(['2', 'rookie#2'], rows)
+        self.assertEqual(rows[-1], ['2', 'VET', '400', '900', '+500'])
+
+    def test_report_command(self):
+        out = StringIO()
+        call_command('submissionreport', '1-2', stdout=out)
+        self.assertIn('# Weeks 1-2', out.getvalue())
+
+        out = StringIO()
+        call_command('submissionreport', stdout=out)
+        self.assertIn('# Week 2', out.getvalue())
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_report_admin_action(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        resp = self.client.post(reverse('admin:submissions_challenge_changelist'), {
+            'action': 'csv_report',
+            '_selected_action': [1, 2],
+        })
+
+        self.assertEqual(resp['Content-Disposition'], 'attachment; filename="weeks1-2-report.csv"')
+        self.assertIn('Biggest upscores', b''.join(resp.streaming_content).decode())
+
+class FakeDataTests(TestCase):
+    def test_generate(self):
+        total = fakedata.generate(students=50, weeks=4, seed=1, batch_size=100, log=lambda msg: None)
+
+        self.assertEqual(models.Student.objects.count(), 50)
+        self.assertEqual(models.Submission.objects.count(), total)
+        self.assertEqual(list(models.Challenge.objects.filter(is_open=True).values_list('week', flat=True)), [4])
+        # submitted during their week, in the order they were made
+        week1 = models.Challenge.objects.get(week=1)
+        times = list(
+            models.Submission.objects.filter(challenge=week1).order_by('id').values_list('submitted_at', flat=True)
+        )
+        self.assertEqual(times, sorted(times))
+        self.assertLessEqual(times[-1], week1.closed_at)
+
+    def test_generatedata_command(self):
+        out = StringIO()
+        call_command('generatedata', '--students', '10', '--weeks', '2', '--seed', '1', stdout=out)
+        self.assertIn('Made 2 weeks and 10 students', out.getvalue())
+
+        with self.assertRaisesMessage(CommandError, 'already has students'):
+            call_command('generatedata', '--students', '10', stdout=StringIO())
+
+        call_command('generatedata', '--students', '5', '--weeks', '1', '--clear', '--noinput', stdout=StringIO())
+        self.assertEqual(models.Student.objects.count(), 5)
+
+    def test_benchmark_command(self):
+        student = models.Student.objects.create(discord_snowflake_id=1, discord_name='a#1')
+        out = StringIO()
+        call_command('benchmark', '--sizes', '5,10', '--weeks', '2', '--repeat', '1', stdout=out, stderr=StringIO())
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 1 + len(benchmarks.BENCHMARKS))
+        self.assertIn('O(n^', lines[1])
+        # the fake data was rolled back
+        self.assertEqual(list(models.Student.objects.all()), [student])
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def route(self, req):
+        """Runs a request through the replica middleware.
+
+        Returns the database a Student query would have read from.
+        """
+
+        middleware = routers.ReplicaMiddleware(lambda req: models.Student.objects.all().db)
+        req.session = SessionStore()
+        return middleware(req)
+
+    @override_settings(DATABASE_REPLICA=None)
+    def test_no_replica_reads_from_primary(self):
+        with routers.replica_reads():
+            self.assertEqual(models.Student.objects.all().db, 'default')
+
+    @override_settings(DATABASE_REPLICA='replica')
+    def test_replica_reads(self):
+        with routers.replica_reads():
+            self.assertEqual(models.Student.objects.all().db, 'replica')
+            self.assertEqual(router.db_for_write(models.Student), 'default')
+        self.assertEqual(models.Student.objects.all().db, 'default')
+
+    @override_settings(DATABASE_REPLICA='replica')
+    def test_middleware_uses_replica_for_changelists(self):
+        changelist = reverse('admin:submissions_submission_changelist')
+        change = reverse('admin:submissions_submission_change', args=[1])
+
+        self.assertEqual(self.route(self.factory.get(changelist)), 'replica')
+        self.assertEqual(self.route(self.factory.get(change)), 'default')
+
+    @override_settings(DATABASE_REPLICA='replica')
+    def test_middleware_reads_from_primary_after_changes(self):
+        changelist = reverse('admin:submissions_submission_changelist')
+        change = reverse('admin:submissions_submission_change', args=[1])
+
+        middleware = routers.ReplicaMiddleware(lambda req: models.Student.objects.all().db)
+        session = SessionStore()
+
+        req = self.factory.post(change)
+        req.session = session
+        self.assertEqual(middleware(req), 'default')
+
+        req = self.factory.get(changelist)
+        req.session = session
+        self.assertEqual(middleware(req), 'default')
+
+@skipUnless(settings.DATABASE_REPLICA, 'needs a replica database (REPLICA_DATABASE_URL)')
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ReplicaChangelistTests(TransactionTestCase):
+    # the replica is a separate connection, so the data has to be committed
+    databases = '__all__'
+
+    def test_changelist_reads_from_replica(self):
+        week1 = models.Challenge.objects.create(week=1, name='week1')
+        student = models.Student.objects.create(discord_snowflake_id=1, discord_name='a#1')
+        subm = student.submission_set.create(challenge=week1, score=100, pic_url='http://url')
+
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        with CaptureQueriesContext(connections[settings.DATABASE_REPLICA]) as replica_queries:
+            resp = self.client.get(reverse('admin:submissions_submission_changelist'))
+        self.assertEqual(resp.context['cl'].result_count, 1)
+        self.assertTrue(replica_queries.captured_queries)
+
+        with CaptureQueriesContext(connections[settings.DATABASE_REPLICA]) as replica_queries:
+            resp = self.client.get(reverse('admin:submissions_submission_change', args=[subm.id]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(replica_queries.captured_queries)
+
+class SubmissionLogTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'submissions.log')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def entry(self, score, pic_url='url'):
+        return {
+            'discord_snowflake_id': 99999,
+            'discord_name': 'discord#1234',
+            'level': models.LevelPlacement.FRESHMAN,
+            'score': score,
+            'pic_url': pic_url,
+        }
+
+    def test_unsaved_entries_are_replayed(self):
+        """
+        Pick up unsaved entries from the log file when starting again.
+        """
+
+        log = wal.SubmissionLog(self.path)
+        log.append(self.entry(100))
+        log.append(self.entry(200))
+        log.append(self.entry(300))
+        log.commit(1)
+
+        restarted = wal.SubmissionLog(self.path)
+        self.assertEqual(
+            [entry['score'] for entry in restarted.pending],
+            [200, 300],
+        )
+        self.assertTrue(all(entry['replayed'] for entry in restarted.pending))
+
+        restarted.commit(2)
+        self.assertEqual(wal.SubmissionLog(self.path).pending, [])
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_submit_before_start_fails_without_logging(self):
+        log = wal.SubmissionLog(self.path)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(log.submit(self.entry(100)))
+        self.assertEqual(wal.SubmissionLog(self.path).pending, [])
+
+    def test_partly_written_entry_is_ignored(self):
+        log = wal.SubmissionLog(self.path)
+        log.append(self.entry(100))
+        with open(self.path, 'ab') as f:
+            f.write(b'{"discord_snowf')
+
+        restarted = wal.SubmissionLog(self.path)
+        self.assertEqual([entry['score'] for entry in restarted.pending], [100])
+
+        restarted.append(self.entry(200))
+        self.assertEqual(
+            [entry['score'] for entry in wal.SubmissionLog(self.path).pending],
+            [100, 200],
+        )
+
+    def test_save_scores_skips_saved_replayed_submissions(self):
+        """
+        Replaying entries that were saved right before a crash doesn't duplicate them.
+        """
+
+        models.Challenge.objects.create(week=1, name='week1')
+
+        entries = [self.entry(100, 'url1'), self.entry(300, 'url2')]
+        saved = models.save_scores(entries)
+        self.assertEqual([upscore for upscore, _ in saved], [None, 200])
+
+        replayed = [{**entry, 'replayed': True} for entry in entries + [self.entry(500, 'url3')]]
+        replayed_saved = models.save_scores(replayed)
+        self.assertEqual([upscore for upscore, _ in replayed_saved], [None, None, 200])
+        # the ones already saved are the same submissions
+        self.assertEqual([id for _, id in replayed_saved[:2]], [id for _, id in saved])
+        self.assertEqual(models.Submission.objects.count(), 3)
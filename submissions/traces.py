@@ -0,0 +1,385 @@
+"""Traces of the bot's command traffic, to replay for performance testing.
+
+With BOT_TRACE_PATH set, the bot appends each command it's sent (! commands
+in the submissions channel, typos and all, and slash commands) to a JSON Lines
+file, one event per line:
+
+    {"time": 1634592000.5, "command": "!submit", "arguments": "912345",
+     "member": "member-3f2a9c1b0d4e", "roles": ["Varsity"],
+     "attachments": [{"filename": "score.jpg", "size": 204800, ...}]}
+
+Slash commands have "/submit" and their options as "arguments" (a list like
+discord's). Traces are anonymised: members are pseudonyms (stable, from a
+keyed hash of their id), mentions point to pseudonyms, names given to !addname
+and !addtwitter are masked, and attachments keep only their metadata.
+
+`replay` sends a trace's commands to the bot's cogs through dpytest, at the
+recorded pace (or faster), and measures each command's latency and queries.
+See `manage.py replaytrace`.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+
+from .models import Challenge
+
+# commands whose arguments are names, which are masked
+PERSONAL_COMMANDS = {'addname', 'addtwitter'}
+PERSONAL_OPTIONS = {'ddr_name', 'twitter'}
+
+# attachment fields kept (no ids or urls)
+ATTACHMENT_FIELDS = ('filename', 'size', 'content_type', 'width', 'height')
+
+# slash command option types (see interactions.py)
+USER = 6
+ATTACHMENT = 11
+
+MENTION = re.compile(r'<@!?(\d+)>')
+PSEUDONYM_MENTION = re.compile(r'<@(member-[0-9a-f]+)>')
+
+def pseudonym(user_id):
+    """A member's name in traces. The same member gets the same name in every
+    trace (from this deployment), which can't be turned back into their id
+    without the SECRET_KEY.
+    """
+
+    digest = hmac.new(settings.SECRET_KEY.encode(), str(user_id).encode(), hashlib.sha256).hexdigest()
+    return f'member-{digest[:12]}'
+
+def mask(text):
+    """Text with its letters and digits replaced, keeping its length and punctuation."""
+
+    return re.sub(r'[^\W\d_]', 'x', re.sub(r'\d', '0', text))
+
+def attachment_metadata(attachment):
+    """The fields kept from an attachment, given as a dict (eg. from an interaction) or discord.Attachment."""
+
+    if not isinstance(attachment, dict):
+        attachment = {field: getattr(attachment, field, None) for field in ATTACHMENT_FIELDS}
+    return {field: attachment.get(field) for field in ATTACHMENT_FIELDS}
+
+class TraceRecorder:
+    """Appends the commands the bot is sent to a trace file (see above)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record_message(self, message):
+        """Records a ! command, given its message."""
+
+        command, _, arguments = message.content.partition(' ')
+        personal = command[1:].lower() in PERSONAL_COMMANDS
+        # text and mentioned ids, alternately
+        parts = MENTION.split(arguments.strip())
+        arguments = ''.join(
+            f'<@{pseudonym(part)}>' if i % 2 else mask(part) if personal else part
+            for i, part in enumerate(parts)
+        )
+
+        self.write({
+            'time': time.time(),
+            'command': command,
+            'arguments': arguments,
+            'member': pseudonym(message.author.id),
+            'roles': sorted(role.name for role in getattr(message.author, 'roles', [])[1:]),
+            'attachments': [attachment_metadata(attachment) for attachment in message.attachments],
+        })
+
+    def record_interaction(self, guild, interaction):
+        """Records a slash command, given its raw interaction and the guild it's from."""
+
+        data = interaction['data']
+        resolved = data.get('resolved', {})
+        options = []
+        for opt in data.get('options', []):
+            value = opt['value']
+            if opt.get('type') == ATTACHMENT:
+                value = attachment_metadata(resolved.get('attachments', {}).get(value, {}))
+            elif opt.get('type') == USER:
+                value = pseudonym(value)
+            elif opt['name'] in PERSONAL_OPTIONS:
+                value = mask(str(value))
+            options.append({'name': opt['name'], 'type': opt.get('type'), 'value': value})
+
+        member = interaction.get('member') or {}
+        user = member.get('user') or interaction.get('user') or {}
+        roles = [guild.get_role(int(role_id)) for role_id in member.get('roles', [])] if guild else []
+        self.write({
+            'time': time.time(),
+            'command': f'/{data["name"]}',
+            'arguments': options,
+            'member': pseudonym(user.get('id')),
+            'roles': sorted(role.name for role in roles if role is not None),
+            'attachments': [],
+        })
+
+    def write(self, event):
+        line = json.dumps(event) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as trace:
+                trace.write(line)
+
+def read_trace(path):
+    """The events in a trace file, in order."""
+
+    with open(path) as trace:
+        events = [json.loads(line) for line in trace if line.strip()]
+    events.sort(key=lambda event: event['time'])
+    return events
+
+def schedule(events, speed=1.0, max_gap=60.0):
+    """When (in seconds from the start) to send each event, at `speed` times
+    the recorded pace. Gaps longer than `max_gap` seconds (eg. the bot being
+    off) are shortened to it. A speed of 0 is as fast as possible.
+    """
+
+    offsets = []
+    offset = 0.0
+    for previous, event in zip([None] + events, events):
+        if previous is not None and speed:
+            offset += min(event['time'] - previous['time'], max_gap) / speed
+        offsets.append(offset)
+    return offsets
+
+def percentile(values, p):
+    """The p-th percentile (0-100) of some values, by nearest rank."""
+
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+class ReplayedEvent:
+    def __init__(self, event):
+        self.command = event['command'].lower()
+        self.latency = None
+        self.queries = 0
+        self.error = None
+
+# the event being replayed, in its task (and the database thread's calls from it)
+_current_event = contextvars.ContextVar('current_event', default=None)
+
+def _count_query(execute, sql, params, many, context):
+    event = _current_event.get()
+    if event is not None:
+        event.queries += 1
+    return execute(sql, params, many, context)
+
+async def replay(events, speed=1.0, max_gap=60.0, open_week=True, log=print):
+    """Replays a trace's events through dpytest, against the current database.
+
+    The bot runs its cogs on this event loop as it would for discord, and
+    events are sent at their scheduled time (see `schedule`) whether or not
+    earlier ones are done, so bursts overlap like they did live. With speed 0,
+    each event is sent once the one before it is done.
+
+    Returns a ReplayedEvent for each event, with its latency (from when it
+    was due to when the bot was done with it, in seconds), the number of
+    queries it made and the error it raised, if any.
+    """
+
+    # test-only dependencies, and the bot itself (which sets up django)
+    import discord
+    import discord.ext.test as dpytest
+    from discord.ext import commands
+    from discord.ext.test import backend
+
+    import bot
+
+    class ReplayBot(commands.Bot):
+        async def on_message(self, message):
+            # commands are run by the replay, to time them
+            pass
+
+        async def on_command_error(self, ctx, error):
+            event = _current_event.get()
+            if event is not None:
+                event.error = event.error or error.__class__.__name__
+
+    loop = asyncio.get_running_loop()
+    intents = discord.Intents.default()
+    intents.members = True
+    replay_bot = ReplayBot('!', loop=loop, intents=intents)
+    replay_bot.add_check(bot.globally_block_dms)
+    replay_bot.add_check(bot.correct_channel)
+    replay_bot.add_cog(bot.Students(replay_bot))
+    replay_bot.add_cog(bot.Faculty(replay_bot))
+
+    # every member in the trace, in order of appearance
+    pseudonyms = []
+    for event in events:
+        names = [event['member']]
+        if isinstance(event['arguments'], str):
+            names += PSEUDONYM_MENTION.findall(event['arguments'])
+        else:
+            names += [opt['value'] for opt in event['arguments'] if opt.get('type') == USER]
+        pseudonyms += [name for name in names if name not in pseudonyms]
+
+    dpytest.configure(client=replay_bot, num_channels=1, num_members=max(len(pseudonyms), 1))
+    guild = replay_bot.guilds[0]
+    channel = guild.text_channels[0]
+    members = dict(zip(pseudonyms, dpytest.get_config().members))
+    roles = {}
+    for name in sorted({role for event in events for role in event['roles']}):
+        roles[name] = await guild.create_role(name=name)
+
+    # replies to slash commands go nowhere
+    async def request(route, **kwargs):
+        pass
+    replay_bot.http.request = request
+
+    old_channel_id = os.environ.get('SUBMISSION_CHANNEL_ID')
+    os.environ['SUBMISSION_CHANNEL_ID'] = str(channel.id)
+    # dpytest saves files the bot sends (leaderboards) in the current directory
+    old_cwd = os.getcwd()
+    files = tempfile.TemporaryDirectory()
+    os.chdir(files.name)
+
+    def prepare_database():
+        connection.execute_wrappers.append(_count_query)
+        if open_week and not Challenge.objects.exists():
+            Challenge.objects.create(week=1, name='Replay', is_open=True)
+
+    def restore_database():
+        connection.execute_wrappers.remove(_count_query)
+        # so the database can be dropped afterwards
+        connections.close_all()
+
+    # commands' queries all run in database_sync_to_async's one thread
+    await database_sync_to_async(prepare_database)()
+    cache.clear()
+
+    ids = iter(range(1, 1_000_000_000))
+
+    def attachment(metadata):
+        attachment_id = next(ids)
+        filename = metadata.get('filename') or 'picture.png'
+        return {
+            'id': str(attachment_id),
+            'url': f'https://cdn.discordapp.com/attachments/{attachment_id}/{filename}',
+            'proxy_url': f'https://media.discordapp.net/attachments/{attachment_id}/{filename}',
+            **metadata,
+            'filename': filename,
+        }
+
+    def interaction(event, member):
+        data = {'name': event['command'][1:], 'options': [], 'resolved': {'attachments': {}, 'users': {}, 'members': {}}}
+        for opt in event['arguments']:
+            value = opt['value']
+            if opt.get('type') == ATTACHMENT:
+                resolved = attachment(value)
+                data['resolved']['attachments'][resolved['id']] = resolved
+                value = resolved['id']
+            elif opt.get('type') == USER:
+                user = members[value]
+                value = str(user.id)
+                data['resolved']['users'][value] = {
+                    'id': value, 'username': user.name, 'discriminator': user.discriminator, 'avatar': None,
+                }
+                data['resolved']['members'][value] = {'roles': [str(role.id) for role in user.roles[1:]]}
+            data['options'].append({'name': opt['name'], 'type': opt.get('type'), 'value': value})
+        return {
+            'id': str(next(ids)),
+            'token': 'token',
+            'application_id': str(replay_bot.user.id),
+            'type': 2,
+            'guild_id': str(guild.id),
+            'channel_id': str(channel.id),
+            'member': {'user': {'id': str(member.id)}, 'roles': [str(role.id) for role in member.roles[1:]]},
+            'data': data,
+        }
+
+    async def send(event, replayed, due):
+        _current_event.set(replayed)
+        member = members[event['member']]
+        member_roles = [roles[name] for name in event['roles']]
+        if {role.name for role in member.roles[1:]} != set(event['roles']):
+            backend.update_member(member, roles=member_roles)
+
+        try:
+            if event['command'].startswith('/'):
+                await bot.slash.handle(replay_bot, interaction(event, member))
+            else:
+                content = PSEUDONYM_MENTION.sub(lambda match: members[match.group(1)].mention, event['arguments'])
+                message = backend.make_message(
+                    f'{event["command"]} {content}'.strip(),
+                    member,
+                    channel,
+                    attachments=[
+                        discord.Attachment(data=attachment(metadata), state=backend.get_state())
+                        for metadata in event['attachments']
+                    ],
+                )
+                await replay_bot.process_commands(message)
+        except Exception as error:
+            replayed.error = replayed.error or error.__class__.__name__
+        replayed.latency = loop.time() - due
+
+    replayed = [ReplayedEvent(event) for event in events]
+    tasks = []
+    started = loop.time()
+    try:
+        for i, (event, offset) in enumerate(zip(events, schedule(events, speed, max_gap))):
+            due = started + offset
+            if speed:
+                await asyncio.sleep(max(0, due - loop.time()))
+                tasks.append(asyncio.create_task(send(event, replayed[i], due)))
+            else:
+                await send(event, replayed[i], loop.time())
+            if (i + 1) % 100 == 0:
+                log(f'Sent {i + 1} of {len(events)} events')
+        await asyncio.gather(*tasks)
+        # the bot's replies, and errors dpytest kept
+        await dpytest.empty_queue()
+    finally:
+        await database_sync_to_async(restore_database)()
+        os.chdir(old_cwd)
+        files.cleanup()
+        if old_channel_id is None:
+            del os.environ['SUBMISSION_CHANNEL_ID']
+        else:
+            os.environ['SUBMISSION_CHANNEL_ID'] = old_channel_id
+
+    return replayed
+
+def summarize(replayed):
+    """Latency percentiles (in seconds), queries and errors per command (and
+    for 'all'), as {command: {...}}, busiest commands first.
+    """
+
+    by_command = defaultdict(list)
+    for event in replayed:
+        by_command[event.command].append(event)
+        by_command['all'].append(event)
+
+    summary = {}
+    for command, events in sorted(by_command.items(), key=lambda item: (item[0] != 'all', -len(item[1]))):
+        latencies = [event.latency for event in events]
+        queries = [event.queries for event in events]
+        summary[command] = {
+            'count': len(events),
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies),
+            'mean_queries': sum(queries) / len(queries),
+            'max_queries': max(queries),
+            'errors': sum(event.error is not None for event in events),
+        }
+    return summary
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import threading
+import uuid
+
+from django.db import InterfaceError, OperationalError
+from django.utils import timezone
+
+from .models import async_save_scores
+
+class SubmissionLog:
+    """A local append-only log (write-ahead log) of accepted submissions.
+
+    Submissions are written to the log (and fsync'd) before the bot replies,
+    then saved to the database in batches by a background task. If the
+    database is down, they wait in the log until it's back, even across bot
+    restarts, since the log is replayed on startup.
+
+    The log file has one JSON entry per line. A separate `.offset` file keeps
+    track of how much of the log has been saved to the database. Once
+    everything in it is saved, the log starts over from empty.
+    """
+
+    def __init__(self, path, batch_size=50, retry_delay=5):
+        self.path = path
+        self.offset_path = f'{path}.offset'
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        # (entry, where it ends in the log file) for each entry not saved yet
+        self._pending = []
+        # futures for submissions waiting to hear they've been saved, by entry id
+        self._waiting = {}
+        self._wakeup = None
+        self._task = None
+
+        self._load()
+
+    @property
+    def pending(self):
+        return [entry for entry, _ in self._pending]
+
+    def start(self, loop):
+        """Starts saving logged submissions (starting with any left from last time)."""
+
+        if self._task is not None:
+            return
+
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._save_forever())
+
+    async def submit(self, entry):
+        """Logs a submission to be saved to the database.
+
+        `entry` is a dict of async_save_score's arguments and the week's
+        `challenge_id`; it's stamped with the time it was submitted. Once the
+        entry is safely in the log, returns a future for its (upscore,
+        submission id) (like async_save_score), which is set once it's saved.
+        """
+
+        if self._task is None:
+            # nothing would save it (and the caller would have it resubmitted)
+            raise RuntimeError("The submission log hasn't been started")
+
+        loop = asyncio.get_running_loop()
+        entry = {'id': uuid.uuid4().hex, 'submitted_at': timezone.now().isoformat(), **entry}
+        saved = loop.create_future()
+        self._waiting[entry['id']] = saved
+
+        try:
+            await loop.run_in_executor(None, self.append, entry)
+        except Exception:
+            del self._waiting[entry['id']]
+            raise
+        self._wakeup.set()
+
+        return saved
+
+    def append(self, entry):
+        line = json.dumps(entry).encode() + b'\n'
+        with self._lock:
+            with open(self.path, 'ab') as log:
+                log.write(line)
+                log.flush()
+                os.fsync(log.fileno())
+                self._pending.append((entry, log.tell()))
+
+    def commit(self, count):
+        """Marks the first `count` pending entries as saved."""
+
+        with self._lock:
+            done, self._pending = self._pending[:count], self._pending[count:]
+            if self._pending:
+                self._write_offset(done[-1][1])
+            else:
+                # everything's saved, so start the log over
+                with open(self.path, 'r+b') as log:
+                    log.truncate(0)
+                    os.fsync(log.fileno())
+                self._write_offset(0)
+
+    def _load(self):
+        try:
+            with open(self.offset_path) as f:
+                offset = int(f.read() or 0)
+        except FileNotFoundError:
+            offset = 0
+
+        try:
+            log = open(self.path, 'r+b')
+        except FileNotFoundError:
+            return
+
+        with log:
+            size = os.fstat(log.fileno()).st_size
+            if offset > size:
+                # the log was started over but the offset wasn't reset yet
+                offset = 0
+
+            log.seek(offset)
+            end = offset
+            for line in log:
+                if not line.endswith(b'\n'):
+                    # a partly written entry (the bot died while writing it),
+                    # which was never acknowledged
+                    break
+                end += len(line)
+                # it might have been saved right before the bot stopped
+                entry = {**json.loads(line), 'replayed': True}
+                self._pending.append((entry, end))
+            log.truncate(end)
+
+        self._write_offset(offset)
+        if self._pending:
+            print(f'Found {len(self._pending)} unsaved submissions in {self.path}')
+
+    def _write_offset(self, offset):
+        tmp_path = f'{self.offset_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.offset_path)
+
+    async def _save_forever(self):
+        while True:
+            await self._save_pending()
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+    async def _save_pending(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            batch = self.pending[:self.batch_size]
+            try:
+                results = await self._save(batch)
+            except (OperationalError, InterfaceError) as error:
+                print(f"Couldn't reach the database, {len(self._pending)} submissions waiting in the log: {error}")
+                await asyncio.sleep(self.retry_delay)
+                continue
+
+            await loop.run_in_executor(None, self.commit, len(batch))
+            for entry, result in zip(batch, results):
+                saved = self._waiting.pop(entry['id'], None)
+                if saved is None or saved.done():
+                    continue
+                if isinstance(result, Exception):
+                    saved.set_exception(result)
+                else:
+                    saved.set_result(result)
+
+    async def _save(self, batch):
+        """Saves a batch of entries. Returns the (upscore, id) (or error) for each one.
+
+        Database connection errors are raised so the batch can be retried.
+        Anything else means an entry can't be saved, so it's dropped.
+        """
+
+        try:
+            return await async_save_scores(batch)
+        except (OperationalError, InterfaceError):
+            raise
+        except Exception as error:
+            if len(batch) == 1:
+                print(f'Dropping submission {batch[0]} from the log: {error.__class__.__name__}: {error}')
+                return [error]
+
+        # save them one at a time so one bad entry doesn't hold up the rest
+        results = []
+        for entry in batch:
+            results += await self._save([entry])
+        return results